@@ -0,0 +1,356 @@
+"""
+Benchmark the overhead of the SMxFastHTTPUser harness itself.
+
+Drives SMxFastHTTPUser methods through a real Locust FastHttpSession (with
+the local runner request statistics listener attached) against a zero
+latency SMx mock (locustfiles.lib.smxmock) started in a separate process,
+so the measured CPU time is the load generator only.
+
+For every benchmark reports:
+
+    * rps                   observed requests per second on one greenlet
+    * cpu_us_per_request    process CPU time per request
+    * max_rps_per_core      1e6 / cpu_us_per_request, the request rate a
+                            worker core can generate at most
+    * peak_bytes_per_request     transient memory allocated by a request
+                                 (tracemalloc peak above the start)
+    * retained_bytes_per_request memory still held after the request
+    * allocated_blocks_per_request  allocation count: memory blocks a
+                                    request leaves allocated when it
+                                    returns (sys.getallocatedblocks,
+                                    before a collection)
+    * retained_blocks_per_request   blocks still allocated after a garbage
+                                    collection
+
+The breakdown separates client_get/client_post/client_put/client_delete
+(full HTTP round trip), json_encode (payload encoding of client_post and
+client_put with the selected --json-encoder), route_building (API methods with a client that does not send
+anything: route and group name building plus wrapper dispatch),
+error_logging (log_tracked_error_response of a failed response) and
+trace_record (one request trace row, see smxtrace).
+
+Example:
+    PYTHONPATH=. python locustfiles/helpers/bench_smxfasthttpuser.py --requests 5000 --json results/bench_fasthttpuser.json
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess  # nosec B404 - starts the local mock server only
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import locust
+from locust.contrib.fasthttp import FastHttpSession
+from locust.env import Environment
+from loguru import logger
+
+from locustfiles.lib.locustmodeldata.ontcrud import ONTConfigModel
+from locustfiles.lib.smxtrace import TraceRecorder
+from locustfiles.lib.smxuserapi.smxapi import SMxFastHTTPUser
+
+DEVICE_NAME = "bench-olt"
+ONT_CONFIGURATION = {
+    "ont-id": "1",
+    "serial-number": "CXNK0012ABCD",
+    "vendor-id": "CXNK",
+    "profile-id": "GP1100X",
+    "subscriber-id": "bench-subscriber-1",
+    "description": "bench ont",
+}
+ONT_RECORD = ONTConfigModel(
+    ont_id="1", serial_number="12ABCD", profile_id="GP1100X", vendor_id="CXNK"
+)
+VLAN_CONFIGURATION = {"vlan-id": 100, "name": "bench-vlan", "mode": "N2ONE"}
+
+
+class NullResponse:
+    """Response of NullClient, always successful"""
+
+    status_code = 200
+    text = ""
+    content = b""
+    url = ""
+    request = SimpleNamespace(method="GET")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def success(self):
+        """Mark response successful"""
+
+
+class NullClient:
+    """Client answering every request without sending it"""
+
+    def __init__(self):
+        self.response = NullResponse()
+
+    def request(self, method, url, **kwargs):
+        return self.response
+
+    def get(self, url, **kwargs):
+        return self.response
+
+    post = put = delete = get
+
+
+def start_mock(port: int) -> subprocess.Popen:
+    """Start the zero latency mock in its own process and wait for it"""
+    process = subprocess.Popen(  # nosec B603 - fixed argv, no shell
+        [
+            sys.executable,
+            "-m",
+            "locustfiles.lib.smxmock",
+            "--port",
+            str(port),
+            "--devices",
+            DEVICE_NAME,
+            "--onts-per-device",
+            "20",
+        ],
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"SMx mock did not start on port {port}")
+
+
+def free_port() -> int:
+    """Return a free local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(name: str, func, count: int, warmup: int, memory_count: int) -> dict:
+    """Time count calls of func and measure the memory (traced bytes and
+    allocated blocks) of memory_count calls
+    """
+    for _ in range(warmup):
+        func()
+    gc.collect()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(count):
+        func()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    gc.collect()
+    start_blocks = sys.getallocatedblocks()
+    blocks = 0
+    for _ in range(memory_count):
+        before = sys.getallocatedblocks()
+        func()
+        blocks += sys.getallocatedblocks() - before
+    gc.collect()
+    retained_blocks = sys.getallocatedblocks() - start_blocks
+
+    tracemalloc.start()
+    start_current, _ = tracemalloc.get_traced_memory()
+    transient = 0
+    for _ in range(memory_count):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        transient += peak - before
+    gc.collect()
+    end_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cpu_us = cpu / count * 1e6
+    result = {
+        "name": name,
+        "requests": count,
+        "rps": round(count / wall, 1),
+        "cpu_us_per_request": round(cpu_us, 2),
+        "max_rps_per_core": round(1e6 / cpu_us, 1) if cpu_us else None,
+        "peak_bytes_per_request": round(transient / memory_count),
+        "retained_bytes_per_request": round(
+            (end_current - start_current) / memory_count
+        ),
+        "allocated_blocks_per_request": round(blocks / memory_count, 1),
+        "retained_blocks_per_request": round(retained_blocks / memory_count, 1),
+    }
+    print(
+        f"{name:<32} {result['cpu_us_per_request']:>9.2f} us/req "
+        f"{result['max_rps_per_core']:>10} req/s/core "
+        f"{result['peak_bytes_per_request']:>8} B peak "
+        f"{result['retained_bytes_per_request']:>6} B retained "
+        f"{result['allocated_blocks_per_request']:>7} blocks"
+    )
+    return result
+
+
+def end_to_end_benchmarks(api: SMxFastHTTPUser, client) -> dict:
+    """Return name: callable of the SMxFastHTTPUser methods over HTTP"""
+    ont_configuration = dict(ONT_CONFIGURATION)
+    return {
+        "client_get": lambda: api.client_get(client, f"/config/device/{DEVICE_NAME}"),
+        "client_post": lambda: api.client_post(
+            client, f"/config/device/{DEVICE_NAME}/vlan", data=VLAN_CONFIGURATION
+        ),
+        "client_put": lambda: api.client_put(
+            client, f"/config/device/{DEVICE_NAME}/vlan", data=VLAN_CONFIGURATION
+        ),
+        "client_delete": lambda: api.client_delete(
+            client, f"/config/device/{DEVICE_NAME}/vlan/4000"
+        ),
+        "read_config_device_vlan": lambda: api.read_config_device_vlan(
+            client, DEVICE_NAME, 100
+        ),
+        "create_config_device_ont": lambda: api.create_config_device_ont(
+            client, DEVICE_NAME, "CXNK", ont_configuration
+        ),
+        "create_config_device_ont_record": lambda: api.create_config_device_ont_record(
+            client, DEVICE_NAME, ONT_RECORD
+        ),
+        "get_performance_device_ont": lambda: api.get_performance_device_ont(
+            client, DEVICE_NAME, "1"
+        ),
+        "get_config_device_gui_onts": lambda: api.get_config_device_gui_onts(
+            client, DEVICE_NAME, ("ont-id", "serial-number")
+        ),
+    }
+
+
+def harness_benchmarks(api: SMxFastHTTPUser, trace: TraceRecorder) -> dict:
+    """Return name: callable of the harness work without HTTP"""
+    null_client = NullClient()
+    ont_configuration = dict(ONT_CONFIGURATION)
+
+    # one call per request cycling through GET and DELETE methods
+    route_calls = itertools.cycle(
+        [
+            lambda: api.read_config_device_vlan(null_client, DEVICE_NAME, 100),
+            lambda: api.delete_config_device_ont(null_client, DEVICE_NAME, "1"),
+            lambda: api.get_performance_device_ont(null_client, DEVICE_NAME, "1"),
+        ]
+    )
+
+    failed_response = SimpleNamespace(
+        status_code=500,
+        url=f"{api.rooturl}/config/device/{DEVICE_NAME}/ont",
+        text='{"message": "Internal error"}',
+        request=SimpleNamespace(method="POST"),
+    )
+    logging_api = SMxFastHTTPUser(
+        api.rooturl, *api.auth, group_requests=True, log_error_response=True
+    )
+    return {
+        "json_encode": lambda: api.encode_payload(ont_configuration),
+        "route_building": lambda: next(route_calls)(),
+        "error_logging": lambda: logging_api.log_tracked_error_response(
+            failed_response
+        ),
+        "trace_record": lambda: trace.record(
+            time.perf_counter(),
+            "GET",
+            "/config/device/{device_name}/vlan/{vlan_id}",
+            DEVICE_NAME,
+            200,
+            512,
+            "BenchUser",
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument(
+        "--memory-requests",
+        type=int,
+        default=200,
+        help="Requests traced with tracemalloc (bytes per request)",
+    )
+    parser.add_argument(
+        "--url", default=None, help="Mock base url, default starts a local mock"
+    )
+    parser.add_argument("--json", default=None, help="Write results to json file")
+    parser.add_argument(
+        "--json-encoder", default="json", help="Request body encoder json or orjson"
+    )
+    args = parser.parse_args()
+
+    # error logging is measured without writing to the terminal
+    logger.remove()
+    logger.add(lambda message: None, level="DEBUG")
+
+    mock = None
+    base_url = args.url
+    if base_url is None:
+        port = free_port()
+        mock = start_mock(port)
+        base_url = f"http://127.0.0.1:{port}/rest/v1"
+
+    environment = Environment()
+    environment.create_local_runner()  # attaches the request stats listener
+    client = FastHttpSession(environment, base_url=base_url, user=None)
+    api = SMxFastHTTPUser(
+        base_url,
+        "admin",
+        "admin",
+        group_requests=True,
+        json_encoder=args.json_encoder,
+    )
+
+    results = {
+        "python": platform.python_version(),
+        "locust": locust.__version__,
+        "json_encoder": args.json_encoder,
+        "platform": platform.platform(),
+        "base_url": base_url,
+        "end_to_end": [],
+        "breakdown": [],
+    }
+    trace_directory = tempfile.TemporaryDirectory()
+    trace = TraceRecorder(os.path.join(trace_directory.name, "trace.bin"))
+    try:
+        for name, func in end_to_end_benchmarks(api, client).items():
+            entry = measure(
+                name, func, args.requests, args.warmup, args.memory_requests
+            )
+            key = "breakdown" if name.startswith("client_") else "end_to_end"
+            results[key].append(entry)
+        for name, func in harness_benchmarks(api, trace).items():
+            results["breakdown"].append(
+                measure(name, func, args.requests, args.warmup, args.memory_requests)
+            )
+    finally:
+        trace.close()
+        trace_directory.cleanup()
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+
+    if args.json:
+        directory = os.path.dirname(args.json)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.json, "w", encoding="utf8") as outfile:
+            json.dump(results, outfile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
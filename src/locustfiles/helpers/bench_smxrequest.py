@@ -0,0 +1,134 @@
+"""
+Benchmark the untracked SmxRequest setup/teardown client against the local
+SMx mock (locustfiles.lib.smxmock).
+
+Compares the previous behavior (module level requests call per request, a new
+TCP connection every time) with the pooled keep-alive session now owned by
+SmxRequest.  Reports requests per second for each mode.  With --https the
+local mock serves HTTPS with a throwaway self-signed certificate (openssl
+command needed), where every unpooled request also pays a TLS handshake.
+
+Example:
+    PYTHONPATH=. python locustfiles/helpers/bench_smxrequest.py --requests 2000
+    PYTHONPATH=. python locustfiles/helpers/bench_smxrequest.py --threads 8 --pool-size 8
+    PYTHONPATH=. python locustfiles/helpers/bench_smxrequest.py --https
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from locustfiles.lib.smxmock import (
+    MockSettings,
+    self_signed_certificate,
+    start_mock_server,
+)
+from locustfiles.lib.smxrestapi.smxapi import SMxRequests
+
+HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+
+def unpooled_create(base_url, configuration):
+    """Previous behavior: module level request with a new connection"""
+    return requests.post(
+        url=f"{base_url}/config/device/bench-olt/ont",
+        auth=("admin", "admin"),
+        headers=HEADERS,
+        data=json.dumps(configuration),
+        verify=False,  # nosec B501 - local mock server only
+        timeout=60,
+    )
+
+
+def run(label, func, count, threads) -> dict:
+    """Execute func count times over threads returning results"""
+    configurations = [
+        {"ont-id": f"{label}-{index}", "serial-number": f"{index:06X}"}
+        for index in range(count)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        status_codes = list(executor.map(func, configurations))
+    elapsed = time.perf_counter() - start
+    failures = sum(1 for code in status_codes if not 200 <= code <= 299)
+    result = {
+        "mode": label,
+        "requests": count,
+        "threads": threads,
+        "seconds": round(elapsed, 3),
+        "rps": round(count / elapsed, 1),
+        "failures": failures,
+    }
+    print(
+        f"{label:<10} {count} requests {threads} threads "
+        f"{result['seconds']}s {result['rps']} req/s failures={failures}"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument(
+        "--url", default=None, help="Mock base url, default starts a local mock"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Local mock device latency"
+    )
+    parser.add_argument(
+        "--https",
+        action="store_true",
+        help="Local mock serves HTTPS with a self-signed certificate",
+    )
+    parser.add_argument("--json", default=None, help="Write results to json file")
+    args = parser.parse_args()
+
+    mock = None
+    base_url = args.url
+    if base_url is None:
+        settings = MockSettings(latency=args.latency, device_queue=False)
+        if args.https:
+            certificates = tempfile.TemporaryDirectory()
+            settings.certfile, settings.keyfile = self_signed_certificate(
+                certificates.name
+            )
+        mock = start_mock_server(settings)
+        base_url = mock.base_url
+    print(f"SMx {base_url}")
+
+    results = [
+        run(
+            "unpooled",
+            lambda cfg: unpooled_create(base_url, cfg).status_code,
+            args.requests,
+            args.threads,
+        )
+    ]
+    with SMxRequests(
+        base_url, "admin", "admin", HEADERS, pool_size=args.pool_size
+    ) as smx:
+        results.append(
+            run(
+                "pooled",
+                lambda cfg: smx.create_config_device_ont("bench-olt", cfg).status_code,
+                args.requests,
+                args.threads,
+            )
+        )
+    print(f"speedup    {results[1]['rps'] / results[0]['rps']:.2f}x")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as outfile:
+            json.dump(results, outfile, indent=2)
+    if mock is not None:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
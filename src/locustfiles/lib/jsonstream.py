@@ -0,0 +1,144 @@
+"""
+Incremental parsing of large SMx list responses.
+
+iter_records decodes the records of a list response one at a time while the
+body is still arriving and keeps only the requested fields, so a page is
+never held twice (raw body and full decoded list) and work starts before the
+download ends.  loads_records does the same for a body already in memory,
+decoding bytes directly (no charset detection or str copy as with
+FastResponse.text) with orjson when it is installed.
+
+Each record is still decoded by the C JSON decoder: pulling fields with a
+Python level tokenizer costs more CPU than decoding the record and dropping
+the unused fields.
+
+Example:
+    with smx.session.get(url, params=params, stream=True) as response:
+        for ont in iter_records(response.iter_content(65536), ("ont-id", "state")):
+            ...
+"""
+
+import codecs
+import json
+import re
+from typing import Iterable, Iterator, Sequence
+
+from locustfiles.lib.pagination import response_records
+
+try:
+    import orjson
+except ImportError:  # optional faster decoder
+    orjson = None
+
+_SEPARATORS = re.compile(r"[\s,]*")
+_WHITESPACE = re.compile(r"\s*")
+_KEY_SEPARATOR = re.compile(r"[\s:]*")
+_DECODER = json.JSONDecoder()
+
+
+def project(record, fields: Sequence[str] = None):
+    """Return record with only fields (all fields when fields is empty)"""
+    if not fields or not isinstance(record, dict):
+        return record
+    return {field: record[field] for field in fields if field in record}
+
+
+def _with_end(chunks: Iterable[bytes]) -> Iterator[tuple]:
+    """Yield (chunk, final) with an empty final chunk after the last one"""
+    for chunk in chunks:
+        yield chunk, False
+    yield b"", True
+
+
+def _find_array(buffer: str, final: bool):
+    """Return the position after the opening bracket of the records array
+    (the body, or the first array value of the body object as
+    response_records), None when more of the body is needed and -1 when the
+    body has no such array.  Keys and values before the array are skipped
+    token by token, so brackets in their strings are not taken for it.
+    """
+    pos = _WHITESPACE.match(buffer).end()
+    if pos >= len(buffer):
+        return -1 if final else None
+    if buffer[pos] == "[":
+        return pos + 1
+    if buffer[pos] != "{":
+        return -1
+    pos += 1
+    while True:
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if pos >= len(buffer):
+            return -1 if final else None
+        if buffer[pos] == "}":
+            return -1
+        try:
+            _, pos = _DECODER.raw_decode(buffer, pos)  # key
+            pos = _KEY_SEPARATOR.match(buffer, pos).end()
+            if pos >= len(buffer):
+                return -1 if final else None
+            if buffer[pos] == "[":
+                return pos + 1
+            _, pos = _DECODER.raw_decode(buffer, pos)  # value skipped
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None  # token incomplete, wait for the next chunk
+        if pos == len(buffer) and not final:
+            return None  # number possibly cut at the chunk boundary
+
+
+def iter_records(
+    chunks: Iterable[bytes], fields: Sequence[str] = None
+) -> Iterator[dict]:
+    """Yield the records of a streamed list response body.
+    chunks are utf-8 encoded pieces of the body in arrival order, either a
+    plain list or an object wrapping the list (its first array value).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    in_array = False
+    for chunk, final in _with_end(chunks):
+        buffer = buffer[pos:] + decoder.decode(chunk, final)
+        pos = 0
+        if not in_array:
+            start = _find_array(buffer, final)
+            if start is None:
+                continue
+            if start < 0:
+                return
+            pos = start
+            in_array = True
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                return
+            try:
+                record, end = _DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break  # record incomplete, wait for the next chunk
+            if end == len(buffer) and not final and not isinstance(record, dict):
+                break  # scalar or list possibly cut at the chunk boundary
+            pos = end
+            yield project(record, fields)
+
+
+def loads(body: bytes):
+    """Decode a JSON body from bytes"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def loads_records(body: bytes, fields: Sequence[str] = None) -> list:
+    """Return the records of a list response body keeping only fields"""
+    if not body:
+        return []
+    records = response_records(loads(body))
+    if not fields:
+        return records
+    return [project(record, fields) for record in records]
@@ -0,0 +1,195 @@
+"""
+Parse once test data service shared by all the users of a process.
+
+Every locustmodeldata module validates its section with validate_test_data
+on the raw params, and each user class merges the locust_user_configuration
+overrides of its section over the global parameters by hand.  ConfigService
+parses the test data file once per process and:
+
+    * resolves the global parameters up front: global_test_data, or the top
+      level keys in files without it (locust_smxapi_data.yaml), and per
+      section the global parameters with the locust_user_configuration of
+      the section merged over them (top level keys replaced)
+    * validates each section on first access only, memoized: spawning users
+      validates nothing
+    * hands out the same objects to all users: models of frozen subclasses
+      of the validated models (assigning a field raises, model_dump and
+      model_dump_json unchanged).  The list and dict fields keep their
+      types for serialization and are shared: never modify them, copy with
+      model_copy(update)
+
+    config = configservice.load(paramsfile, smxshard.current(environment))
+    user = config.user(l3one2oneservicecrud)
+    user.global_data.wait_time_between  # section overrides applied
+    user.equipment.smx_name
+    user.test_data.onts.ont_config
+
+The section models (l3one2oneservicecrud, vlancrud, coxfetch, ...) are
+validated with their validate_test_data, for the shard of the service.  With
+large ONT lists load with skip=("ont_config",) and read the ONTs from a
+snapshot (see ontsnapshot).
+"""
+
+import os
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from locustfiles.lib import util
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.locustmodeldata import equipmentdata, globallocustparams
+from locustfiles.lib.locustmodeldata.ontvalidate import gc_paused
+from locustfiles.lib.smxshard import Shard
+
+LOGGER = getlogger(__name__)
+
+GLOBAL_SECTION = "global_test_data"
+USER_OVERRIDES = "locust_user_configuration"
+
+
+class UserConfig(NamedTuple):
+    """Validated configuration of a user type"""
+
+    global_data: globallocustparams.DataModel
+    equipment: equipmentdata.DataModel
+    test_data: Any  # section model, None when the section is not set
+
+
+class ConfigService:
+    """Test data parsed once, sections validated on first access"""
+
+    def __init__(self, params: dict, shard: Optional[Shard] = None):
+        self.params = params or {}
+        self.shard = shard
+        global_params = self.params.get(GLOBAL_SECTION)
+        if not isinstance(global_params, dict):
+            global_params = self.params  # global parameters at the top level
+        # section: raw global parameters with the section overrides
+        self.global_params: Dict[Optional[str], dict] = {None: global_params}
+        for section, data in self.params.items():
+            overrides = data.get(USER_OVERRIDES) if isinstance(data, dict) else None
+            if overrides:
+                self.global_params[section] = {**global_params, **overrides}
+        self._validated: Dict[Tuple[str, Optional[str]], Any] = {}
+
+    @classmethod
+    def from_file(
+        cls, paramsfile: str, shard: Optional[Shard] = None, skip: Sequence[str] = ()
+    ) -> "ConfigService":
+        """Return the service of a test data file (see util.load_test_params
+        for skip)
+        """
+        return cls(util.load_test_params(paramsfile, skip), shard)
+
+    def _memoized(self, kind: str, key: Optional[str], validate):
+        validated = self._validated.get((kind, key), _MISSING)
+        if validated is _MISSING:
+            with gc_paused():
+                validated = self._validated[(kind, key)] = freeze(validate())
+        return validated
+
+    def global_data(self, section: Optional[str] = None):
+        """Return the global parameters, with the locust_user_configuration
+        overrides of section when it has any
+        """
+        if section not in self.global_params:
+            section = None
+        return self._memoized(
+            "global",
+            section,
+            lambda: globallocustparams.validate_test_data(self.global_params[section]),
+        )
+
+    def equipment(self):
+        """Return the SMx and device names"""
+        return self._memoized(
+            "equipment", None, lambda: equipmentdata.validate_test_data(self.params)
+        )
+
+    def test_data(self, module):
+        """Return the section of a test data model module (e.g. vlancrud),
+        None when the file has no such section
+        """
+        return self._memoized(
+            "section",
+            module.__name__,
+            lambda: module.validate_test_data(self.params, shard=self.shard),
+        )
+
+    def user(self, module) -> UserConfig:
+        """Return the configuration of the user type of a test data model
+        module
+        """
+        return UserConfig(
+            self.global_data(section_name(module)),
+            self.equipment(),
+            self.test_data(module),
+        )
+
+
+_MISSING = object()
+_services: Dict[Tuple[str, Optional[Shard], Tuple[str, ...]], ConfigService] = {}
+
+
+def load(
+    paramsfile: str, shard: Optional[Shard] = None, skip: Sequence[str] = ()
+) -> ConfigService:
+    """Return the service of a test data file shared by the process, the
+    file is parsed on the first call only
+    """
+    key = (os.path.realpath(paramsfile), shard, tuple(skip))
+    service = _services.get(key)
+    if service is None:
+        service = _services[key] = ConfigService.from_file(paramsfile, shard, skip)
+        LOGGER.info(f"Test data {paramsfile} loaded")
+    return service
+
+
+def section_name(module) -> str:
+    """Return the test data section of a model module, the single field of
+    its DataModel (e.g. vlan_crud_data)
+    """
+    fields = list(module.DataModel.model_fields)
+    if len(fields) != 1:
+        raise ValueError(f"{module.__name__} is not a test data section module")
+    return fields[0]
+
+
+_frozen_classes: Dict[type, type] = {}
+
+
+def freeze(value):
+    """Return value with its models, nested in models, lists and dicts
+    included, made instances of frozen subclasses of their model (in place).
+    Lists and dicts are left as they are: tuples in list fields would not
+    serialize as the model fields.
+    """
+    if isinstance(value, BaseModel):
+        for item in value.__dict__.values():
+            freeze(item)
+        value.__class__ = _frozen_class(type(value))
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            freeze(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            freeze(item)
+    return value
+
+
+def _frozen_class(cls: type) -> type:
+    """Return the frozen subclass of a model class"""
+    if cls.model_config.get("frozen"):
+        return cls
+    frozen = _frozen_classes.get(cls)
+    if frozen is None:
+        frozen = _frozen_classes[cls] = type(
+            cls.__name__,
+            (cls,),
+            {
+                "__module__": cls.__module__,
+                "__doc__": cls.__doc__,
+                "model_config": {**cls.model_config, "frozen": True},
+            },
+        )
+    return frozen
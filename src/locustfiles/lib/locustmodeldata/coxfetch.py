@@ -11,8 +11,11 @@ from pydantic import (
     model_validator,
     class_validators,
     field_validator,
+    ValidationInfo,
 )
 
+from locustfiles.lib.smxshard import Shard, shard_items, unique
+
 
 class BaseConfigModel(BaseModel):
     """Base configuration for common data model configuration"""
@@ -31,9 +34,12 @@ class FetchModel(BaseConfigModel):
 
     @field_validator("device_name_pool")
     @classmethod
-    def remove_dupes_from_device_name_pool(cls, value):
-        """Remove duplicate device names from pool"""
-        return list(set(value))
+    def remove_dupes_from_device_name_pool(cls, value, info: ValidationInfo):
+        """Remove duplicate device names from pool, keep the devices of the
+        worker shard (see smxshard).  Workers left without a device of their
+        own share one, fetches are read only.
+        """
+        return shard_items(unique(value), info, wrap=True)
 
 
 class DataModel(BaseConfigModel):
@@ -45,9 +51,12 @@ class DataModel(BaseConfigModel):
 # --------------------
 
 
-def validate_test_data(params) -> dict:
+def validate_test_data(params, shard: Shard = None) -> dict:
     """Validate test data for Cox Fetch User.
     Ignore all other params.
+    shard selects the device_name_pool of a worker (see smxshard).
     """
-    validated_params = DataModel(**params).cox_fetch_data
+    validated_params = DataModel.model_validate(
+        params, context={"shard": shard}
+    ).cox_fetch_data
     return validated_params
@@ -4,7 +4,7 @@ Data models for Common Locust Parameters
 Modularize the locustfile to allow for re-use of common code and data models.
 """
 
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import (
     BaseModel,
     ConfigDict,
@@ -23,6 +23,36 @@ class BaseConfigModel(BaseModel):
     model_config = ConfigDict(extra="ignore")
 
 
+class CapacitySearchModel(BaseConfigModel):
+    """Capacity search load shape parameters (see smxcapacity)"""
+
+    mode: Optional[Literal["step", "binary"]] = "binary"
+    target: Optional[Literal["users", "rate"]] = "users"
+    workloads: Optional[List[str]] = []
+    min_level: Optional[float] = Field(gt=0, default=1)
+    max_level: Optional[float] = Field(gt=0, default=100)
+    step: Optional[float] = Field(gt=0, default=5)
+    resolution: Optional[float] = Field(gt=0, default=1)
+    users: Optional[int] = Field(ge=0, default=0)
+    spawn_rate: Optional[float] = Field(gt=0, default=1)
+    warm_up: Optional[NonNegativeFloat] = 60
+    duration: Optional[float] = Field(gt=0, default=300)
+    cool_down: Optional[NonNegativeFloat] = 60
+    slo_p95_ms: Optional[float] = None
+    slo_p99_ms: Optional[float] = None
+    slo_error_rate: Optional[float] = Field(ge=0, le=1, default=0.01)
+    slo_request_types: Optional[List[str]] = []
+    report: Optional[str] = "capacity_report.json"
+
+    @field_validator("max_level")
+    @classmethod
+    def level_range(cls, value, info):
+        """Validate min_level <= max_level"""
+        if value < info.data.get("min_level", 0):
+            raise ValueError(f"max_level {value} invalid.  min_level > max_level.")
+        return value
+
+
 class DataModel(BaseConfigModel):
     """Global parameters commonly used for all Locust files"""
 
@@ -39,7 +69,18 @@ class DataModel(BaseConfigModel):
         conlist(NonNegativeFloat, min_length=2, max_length=2)
     ] = [0, 0]
     group_requests: Optional[bool] = True
+    stats_max_names: Optional[int] = Field(ge=0, default=0)
     log_tracked_failed_responses: Optional[bool] = False
+    json_encoder: Optional[Literal["json", "orjson"]] = "json"
+    trace_directory: Optional[str] = None
+    connection_phases: Optional[bool] = False
+    max_requests_per_device: Optional[int] = Field(ge=0, default=0)
+    device_lock_directory: Optional[str] = None
+    arrival_rate: Optional[NonNegativeFloat] = 0
+    arrival_distribution: Optional[Literal["fixed", "poisson"]] = "poisson"
+    max_in_flight: Optional[PositiveInt] = 100
+    capacity_search: Optional[CapacitySearchModel] = None
+    snapshot_directory: Optional[str] = None
     skip_clenup: Optional[bool] = False
     cleanup_ramp_down: Optional[int] = 10
     cleanup_time_between: Optional[conlist(PositiveInt, min_length=2, max_length=2)] = [
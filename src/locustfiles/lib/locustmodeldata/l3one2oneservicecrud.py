@@ -10,8 +10,12 @@ from pydantic import (
     ConfigDict,
     field_validator,
     model_validator,
+    ValidationInfo,
 )
 
+from locustfiles.lib.locustmodeldata.ontvalidate import OntSpec, gc_paused
+from locustfiles.lib.smxshard import Shard, context_shard
+
 
 class BaseConfigModel(BaseModel):
     """Base configuration for common data model configuration"""
@@ -65,6 +69,18 @@ class ONTDefaultsModel(BaseConfigModel):
     voice_service: Optional[ONTVoiceServiceModel] = None
 
 
+ONT_SPEC = OntSpec(
+    "l3_one2one_service_data",
+    defaults=("profile_id", "vendor_id"),
+    services=("data_service", "voice_service"),
+    unique_serial=True,
+    unique_c_vlan=True,
+    unique_sip_user=True,
+    required=("profile_id", "vendor_id"),
+    required_service=("vlan", "service_name", "ont_port_id"),
+)
+
+
 class ONTModel(BaseConfigModel):
     """ONT Data for L3 1:1 Service Crud User"""
 
@@ -80,71 +96,14 @@ class ONTModel(BaseConfigModel):
             raise ValueError("ont force_delete must be 'true' or 'false'")
         return value.lower()
 
-    @model_validator(mode="after")
-    def fill_in_ont_config_defaults(self) -> "ONTModel":
-        """Fill in ONT defaults for ONT config"""
-        # TODO Remove duplicate ONT IDs
-        # TODO Fail when either profile_id or vendor_id is None after applying defaults
-        profile_id = self.defaults.profile_id
-        vendor_id = self.defaults.vendor_id
-        data_service = self.defaults.data_service
-        voice_service = self.defaults.voice_service
-        for ont in self.ont_config:
-            if ont.profile_id is None:
-                ont.profile_id = profile_id
-            if ont.vendor_id is None:
-                ont.vendor_id = vendor_id
-            if ont.data_service is None:
-                ont.data_service = data_service
-            else:
-                if ont.data_service.vlan is None:
-                    ont.data_service.vlan = self.defaults.data_service.vlan
-                if ont.data_service.service_name is None:
-                    ont.data_service.service_name = (
-                        self.defaults.data_service.service_name
-                    )
-                # if ont.data_service.control_policy_name_1 is None:
-                #     ont.data_service.control_policy_name_1 = (
-                #         self.defaults.data_service.control_policy_name_1
-                #     )
-                # if ont.data_service.control_policy_name_2 is None:
-                #     ont.data_service.control_policy_name_2 = (
-                #         self.defaults.data_service.control_policy_name_2
-                #     )
-                # c_vlan should be unique and problably not set by default
-                # if ont.data_service.c_vlan is None:
-                #     ont.data_service.c_vlan = self.defaults.data_service.c_vlan
-                if ont.data_service.ont_port_id is None:
-                    ont.data_service.ont_port_id = (
-                        self.defaults.data_service.ont_port_id
-                    )
-            if ont.voice_service is None:
-                ont.voice_service = voice_service
-            else:
-                if ont.voice_service.vlan is None:
-                    ont.voice_service.vlan = self.defaults.voice_service.vlan
-                if ont.voice_service.service_name is None:
-                    ont.voice_service.service_name = (
-                        self.defaults.voice_service.service_name
-                    )
-                # if ont.voice_service.control_policy_name_1 is None:
-                #     ont.voice_service.control_policy_name_1 = (
-                #         self.defaults.voice_service.control_policy_name_1
-                #     )
-                # if ont.voice_service.control_policy_name_2 is None:
-                #     ont.voice_service.control_policy_name_2 = (
-                #         self.defaults.voice_service.control_policy_name_2
-                #     )
-                # c_vlan should be unique and problably not set by default
-                if ont.voice_service.ont_port_id is None:
-                    ont.voice_service.ont_port_id = (
-                        self.defaults.voice_service.ont_port_id
-                    )
-                # user should be unique and problably not set by default
-                if ont.voice_service.password is None:
-                    ont.voice_service.password = self.defaults.voice_service.password
-                # uri should be unique and problably not set by default
-        return self
+    @model_validator(mode="before")
+    @classmethod
+    def prepare_ont_config(cls, data, info: ValidationInfo):
+        """Remove duplicate ONTs, keep the ONTs of the worker shard (see
+        smxshard), apply their defaults and check their required fields in
+        one pass (see ontvalidate)
+        """
+        return ONT_SPEC.prepare(data, context_shard(info))
 
 
 class ONTsModel(BaseConfigModel):
@@ -162,9 +121,13 @@ class DataModel(BaseConfigModel):
 # --------------------
 
 
-def validate_test_data(params) -> dict:
+def validate_test_data(params, shard: Shard = None) -> dict:
     """Validate test data for L3 1:1 Service Crud User.
     Ignore all other params.
+    shard selects the ONTs of a worker (see smxshard).
     """
-    validated_params = DataModel(**params).l3_one2one_service_data
+    with gc_paused():
+        validated_params = DataModel.model_validate(
+            params, context={"shard": shard}
+        ).l3_one2one_service_data
     return validated_params
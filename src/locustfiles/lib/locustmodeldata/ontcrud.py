@@ -9,8 +9,12 @@ from pydantic import (
     BaseModel,
     ConfigDict,
     model_validator,
+    ValidationInfo,
 )
 
+from locustfiles.lib.locustmodeldata.ontvalidate import OntSpec, gc_paused
+from locustfiles.lib.smxshard import Shard, context_shard
+
 
 class BaseConfigModel(BaseModel):
     """Base configuration for common data model configuration"""
@@ -35,6 +39,14 @@ class ONTConfigModel(BaseConfigModel):
     vendor_id: Optional[str] = None
 
 
+ONT_SPEC = OntSpec(
+    "ont_crud_data",
+    defaults=("profile_id", "vendor_id"),
+    unique_serial=True,
+    required=("profile_id", "vendor_id"),
+)
+
+
 class OntModel(BaseConfigModel):
     """ "ONT CRUD data model"""
 
@@ -42,28 +54,14 @@ class OntModel(BaseConfigModel):
     defaults: ONTDefaultsModel
     ont_config: List[ONTConfigModel]
 
-    @model_validator(mode="after")
-    def process_ont_configuration(self) -> "OntModel":
-        """Post process ont_configuration to ensure list of unique ONT IDs
-        Order is kept intact from the order of the input data
+    @model_validator(mode="before")
+    @classmethod
+    def prepare_ont_config(cls, data, info: ValidationInfo):
+        """Remove duplicate ONTs, keep the ONTs of the worker shard (see
+        smxshard), apply their defaults and check their required fields in
+        one pass (see ontvalidate)
         """
-        # TODO Logic to remove duplicate ONTs
-        ont_id_list = []
-        profile_id = self.defaults.profile_id
-        vendor_id = self.defaults.vendor_id
-        for ont in self.ont_config:
-            if ont.ont_id not in ont_id_list:
-                if ont.profile_id is None:
-                    ont.profile_id = profile_id
-                if ont.vendor_id is None:
-                    ont.vendor_id = vendor_id
-                if ont.profile_id is None or ont.vendor_id is None:
-                    raise ValueError(
-                        f"ONT {ont.ont_id} is missing ONT profile_id or vendor_id"
-                    )
-                ont_id_list.append(ont.ont_id)
-
-        return self
+        return ONT_SPEC.prepare(data, context_shard(info))
 
 
 class OntsModel(BaseConfigModel):
@@ -81,9 +79,13 @@ class DataModel(BaseConfigModel):
 # --------------------
 
 
-def validate_test_data(params) -> dict:
+def validate_test_data(params, shard: Shard = None) -> dict:
     """Validate test data for L3 1:1 Service Crud User.
     Ignore all other params.
+    shard selects the ONTs of a worker (see smxshard).
     """
-    validated_params = DataModel(**params).ont_crud_data
+    with gc_paused():
+        validated_params = DataModel.model_validate(
+            params, context={"shard": shard}
+        ).ont_crud_data
     return validated_params
@@ -10,8 +10,12 @@ from pydantic import (
     ConfigDict,
     field_validator,
     model_validator,
+    ValidationInfo,
 )
 
+from locustfiles.lib.locustmodeldata.ontvalidate import OntSpec, gc_paused
+from locustfiles.lib.smxshard import Shard, context_shard
+
 
 class BaseConfigModel(BaseModel):
     """Base configuration for common data model configuration"""
@@ -44,6 +48,15 @@ class ONTDefaultsModel(BaseConfigModel):
     data_service: Optional[ONTDataServiceModel] = None
 
 
+ONT_SPEC = OntSpec(
+    "ont_l2tp_data_service_data",
+    defaults=("device_name",),
+    services=("data_service",),
+    required=("device_name",),
+    required_service=("vlan", "service_name", "ont_port_id"),
+)
+
+
 class ONTModel(BaseConfigModel):
     """ONT Data for L3 1:1 Service Crud User"""
 
@@ -59,30 +72,14 @@ class ONTModel(BaseConfigModel):
             raise ValueError("ont force_delete must be 'true' or 'false'")
         return value.lower()
 
-    @model_validator(mode="after")
-    def fill_in_ont_config_defaults(self) -> "ONTModel":
-        """Fill in ONT defaults for ONT config"""
-        # TODO Remove duplicate ONT IDs
-        # TODO Check for expected populated values
-        data_service = self.defaults.data_service
-        device_name = self.defaults.device_name
-        for ont in self.ont_config:
-            if ont.device_name is None:
-                ont.device_name = device_name
-            if ont.data_service is None:
-                ont.data_service = data_service
-            else:
-                if ont.data_service.vlan is None:
-                    ont.data_service.vlan = self.defaults.data_service.vlan
-                if ont.data_service.service_name is None:
-                    ont.data_service.service_name = (
-                        self.defaults.data_service.service_name
-                    )
-                if ont.data_service.ont_port_id is None:
-                    ont.data_service.ont_port_id = (
-                        self.defaults.data_service.ont_port_id
-                    )
-        return self
+    @model_validator(mode="before")
+    @classmethod
+    def prepare_ont_config(cls, data, info: ValidationInfo):
+        """Remove duplicate ONTs, keep the ONTs of the worker shard (see
+        smxshard), apply their defaults and check their required fields in
+        one pass (see ontvalidate)
+        """
+        return ONT_SPEC.prepare(data, context_shard(info))
 
 
 class ONTsModel(BaseConfigModel):
@@ -100,9 +97,13 @@ class DataModel(BaseConfigModel):
 # --------------------
 
 
-def validate_test_data(params) -> dict:
+def validate_test_data(params, shard: Shard = None) -> dict:
     """Validate test data for L3 1:1 Service Crud User.
     Ignore all other params.
+    shard selects the ONTs of a worker (see smxshard).
     """
-    validated_params = DataModel(**params).ont_l2tp_data_service_data
+    with gc_paused():
+        validated_params = DataModel.model_validate(
+            params, context={"shard": shard}
+        ).ont_l2tp_data_service_data
     return validated_params
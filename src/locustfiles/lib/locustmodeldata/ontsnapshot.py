@@ -0,0 +1,389 @@
+"""
+Precompiled ONT test data snapshots shared by the workers of a host.
+
+Every worker parses the test data file and validates its ONTs on start.
+A snapshot is the ONTStore of an ONT test data section (all ONTs validated
+and defaulted, see ontstream) written once to a binary file.  Workers memory
+map it read only: the ONTs take one copy in the page cache for all the
+workers of the host and a worker opens them in milliseconds.
+
+    snapshot = load(paramsfile, l3one2oneservicecrud, global_data.snapshot_directory)
+    snapshot.test_data.onts.force_delete  # validated section, ont_config empty
+    indexes = snapshot.indexes(smxshard.current(environment))
+    pool = LeasePool(indexes, key=snapshot.store.key("device_name"))
+    ont = snapshot.store[pool.checkout()]
+
+The file name holds the SHA-256 of the test data file, the model and the
+snapshot format, so a changed file (or model) compiles a new snapshot on the
+next load, the outdated snapshots of the file are removed.  A JSONL or CSV
+ont_config side file is hashed in the snapshot and checked on load.  The
+worker compiling holds a lock file, the others wait for its snapshot.
+Compile ahead of a run (e.g. in the container build):
+
+    python -m locustfiles.lib.locustmodeldata.ontsnapshot \\
+        config/locust_test_data.yaml l3one2oneservicecrud
+
+Layout: magic, metadata length, JSON metadata (test data section, symbol
+table, column offsets), then the 8 byte aligned column arrays in the host
+byte order.
+"""
+
+import argparse
+import glob
+import hashlib
+import importlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from contextlib import contextmanager
+from typing import List, Optional
+
+import gevent
+
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.errors import ToolboxError
+from locustfiles.lib.locustmodeldata.ontstore import (
+    IntColumn,
+    ONTStore,
+    SymbolColumn,
+    TextColumn,
+)
+from locustfiles.lib.locustmodeldata.ontstream import OntStream
+from locustfiles.lib.smxshard import Shard
+
+try:
+    import fcntl
+except ImportError:  # no compile lock, concurrent compiles replace each other
+    fcntl = None
+
+LOGGER = getlogger(__name__)
+
+MAGIC = b"SMXONTS2"
+FORMAT = 2
+SUFFIX = ".ontsnap"
+_HEADER = struct.Struct("<8sQ")  # magic, metadata length
+_ALIGN = 8
+_TYPECODES = {"ends": "I", "ids": "I", "values": "i", "services": "B"}
+
+
+class SnapshotError(ToolboxError):
+    """ONT test data snapshot error"""
+
+    pass
+
+
+def default_directory() -> str:
+    """Return the snapshot directory used when none is configured"""
+    return os.path.join(tempfile.gettempdir(), "smx_snapshots")
+
+
+def file_digest(path: str) -> str:
+    """Return the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_key(paramsfile: str, module) -> str:
+    """Return the key of the snapshot of a test data file and model"""
+    digest = hashlib.sha256()
+    layout = {code: array(code).itemsize for code in _TYPECODES.values()}
+    digest.update(
+        f"{FORMAT} {sys.byteorder} {layout} {module.__name__} "
+        f"{module.ONT_SPEC!r}".encode("utf8")
+    )
+    digest.update(file_digest(paramsfile).encode("ascii"))
+    return digest.hexdigest()[:24]
+
+
+def _prefix(paramsfile: str, module) -> str:
+    """Return the file name prefix of the snapshots of a test data file
+    and model: the file name, a hash of its path (files of the same name in
+    other directories) and the section
+    """
+    path = os.path.realpath(paramsfile)
+    name = os.path.splitext(os.path.basename(path))[0]
+    path_hash = hashlib.sha256(path.encode("utf8")).hexdigest()[:8]
+    return f"{name}-{path_hash}-{module.ONT_SPEC.section}-"
+
+
+class OntSnapshot:
+    """Read only ONT store of a memory mapped snapshot file"""
+
+    def __init__(self, path: str, module):
+        self.path = path
+        self.module = module
+        with open(path, "rb") as infile:
+            self._map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.metadata = _read_metadata(self._map, path)
+            self.store = self._store()
+            section = self.metadata["section"]
+            test_data = self.metadata["test_data"]
+            self.test_data = None
+            if test_data is not None:
+                self.test_data = getattr(
+                    module.DataModel.model_validate({section: test_data}), section
+                )
+        except BaseException:
+            self.close()
+            raise
+
+    def _view(self, block: List[int], typecode: str) -> memoryview:
+        offset, size = block
+        return memoryview(self._map)[offset : offset + size].cast(typecode)
+
+    def _store(self) -> ONTStore:
+        """Return the store reading the mapped columns"""
+        metadata = self.metadata
+        store = ONTStore()
+        store.symbols.strings = metadata["symbols"]
+        store.symbols.ids = {
+            symbol: index
+            for index, symbol in enumerate(metadata["symbols"])
+            if symbol is not None
+        }
+        store.services = self._view(metadata["services"], "B")
+        rows = len(store.services)
+        for name, column in metadata["columns"].items():
+            kind = column["kind"]
+            if kind == "text":
+                values = TextColumn()
+                values.buffer = self._view(column["buffer"], "B")
+                values.ends = self._view(column["ends"], "I")
+            elif kind == "symbol":
+                values = SymbolColumn(store.symbols)
+                values.ids = self._view(column["ids"], "I")
+            else:
+                values = IntColumn()
+                values.values = self._view(column["values"], "i")
+            if len(values) != rows:
+                raise SnapshotError(f"Snapshot {self.path} column {name} corrupted")
+            store.columns[name] = values
+        return store
+
+    def side_file_stale(self) -> bool:
+        """Return True when the ont_config side file changed since compiled"""
+        side_file = self.metadata.get("side_file")
+        if side_file is None:
+            return False
+        path = side_file["path"]
+        return not os.path.exists(path) or file_digest(path) != side_file["sha256"]
+
+    def indexes(self, shard: Optional[Shard] = None) -> List[int]:
+        """Return the ONT indexes of a shard (all ONTs when None)"""
+        indexes = range(len(self.store))
+        return list(indexes) if shard is None else shard.take(indexes)
+
+    def close(self):
+        """Release the mapping, the store must not be used anymore"""
+        self.store = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # views still referenced, released with them
+
+
+def _read_metadata(mapped: mmap.mmap, path: str) -> dict:
+    """Return the metadata with the column offsets from the file start"""
+    if len(mapped) < _HEADER.size:
+        raise SnapshotError(f"Snapshot {path} truncated")
+    magic, size = _HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC or _HEADER.size + size > len(mapped):
+        raise SnapshotError(f"Snapshot {path} invalid")
+    metadata = json.loads(mapped[_HEADER.size : _HEADER.size + size])
+    start = _aligned(_HEADER.size + size)
+    blocks = [metadata["services"]] + [
+        block
+        for column in metadata["columns"].values()
+        for key, block in column.items()
+        if key != "kind"
+    ]
+    for block in blocks:
+        block[0] += start
+        if block[0] + block[1] > len(mapped):
+            raise SnapshotError(f"Snapshot {path} truncated")
+    return metadata
+
+
+def _aligned(offset: int) -> int:
+    return offset + -offset % _ALIGN
+
+
+def compile_snapshot(paramsfile: str, module, path: str) -> str:
+    """Write the snapshot of the ONT section of module in paramsfile to
+    path (atomically replaced), return path
+    """
+    start = time.perf_counter()
+    stream = OntStream(paramsfile, module)
+    store = ONTStore.from_onts(stream)
+    blocks = []  # column arrays in file order
+    size = 0
+
+    def block(values) -> List[int]:
+        """Add an array, return its [offset from the data start, size]"""
+        nonlocal size
+        data = memoryview(values).cast("B")
+        blocks.append(data)
+        offset = size
+        size = _aligned(size + len(data))
+        return [offset, len(data)]
+
+    columns = {}
+    for name, column in store.columns.items():
+        if isinstance(column, TextColumn):
+            columns[name] = {
+                "kind": "text",
+                "buffer": block(column.buffer),
+                "ends": block(column.ends),
+            }
+        elif isinstance(column, SymbolColumn):
+            columns[name] = {"kind": "symbol", "ids": block(column.ids)}
+        else:
+            columns[name] = {"kind": "int", "values": block(column.values)}
+    side_file = None
+    if stream.side_file is not None:
+        side_file = {
+            "path": os.path.abspath(stream.side_file),
+            "sha256": file_digest(stream.side_file),
+        }
+    test_data = stream.test_data
+    metadata = json.dumps(
+        {
+            "format": FORMAT,
+            "source": os.path.abspath(paramsfile),
+            "section": module.ONT_SPEC.section,
+            "test_data": None if test_data is None else test_data.model_dump(),
+            "side_file": side_file,
+            "count": len(store),
+            "symbols": store.symbols.strings,
+            "services": block(store.services),
+            "columns": columns,
+        }
+    ).encode("utf8")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as outfile:
+            outfile.write(_HEADER.pack(MAGIC, len(metadata)))
+            outfile.write(metadata)
+            outfile.write(bytes(-outfile.tell() % _ALIGN))
+            for data in blocks:
+                outfile.write(data)
+                outfile.write(bytes(-len(data) % _ALIGN))
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    LOGGER.info(
+        f"{module.ONT_SPEC.section}: snapshot of {len(store)} ONTs compiled to "
+        f"{path} in {time.perf_counter() - start:.1f} s"
+    )
+    return path
+
+
+def load(paramsfile: str, module, directory: Optional[str] = None) -> OntSnapshot:
+    """Return the snapshot of the ONT section of module (e.g.
+    l3one2oneservicecrud) in paramsfile, compiled first when missing or
+    outdated
+    """
+    directory = directory or default_directory()
+    prefix = _prefix(paramsfile, module)
+    path = os.path.join(
+        directory, f"{prefix}{snapshot_key(paramsfile, module)}{SUFFIX}"
+    )
+    snapshot = _open(path, module)
+    if snapshot is not None:
+        return snapshot
+    os.makedirs(directory, exist_ok=True)
+    with _compile_lock(os.path.join(directory, f"{prefix}lock")):
+        snapshot = _open(path, module)  # compiled by another worker meanwhile
+        if snapshot is not None:
+            return snapshot
+        compile_snapshot(paramsfile, module, path)
+        for outdated in glob.glob(os.path.join(directory, f"{prefix}*{SUFFIX}")):
+            if outdated != path:
+                try:
+                    os.remove(outdated)  # workers mapping it keep their copy
+                except FileNotFoundError:
+                    pass
+    return OntSnapshot(path, module)
+
+
+def _open(path: str, module) -> Optional[OntSnapshot]:
+    """Return the snapshot at path, None when missing, invalid or stale"""
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = OntSnapshot(path, module)
+    except FileNotFoundError:
+        return None  # removed since checked
+    except (OSError, SnapshotError, ValueError, KeyError) as error:
+        LOGGER.warning(f"Snapshot {path} ignored, recompiled: {error}")
+        return None
+    try:
+        stale = snapshot.side_file_stale()
+    except OSError:
+        stale = True
+    if stale:
+        snapshot.close()
+        return None
+    return snapshot
+
+
+@contextmanager
+def _compile_lock(path: str, poll_interval: float = 0.1):
+    """Hold the compile lock file of a snapshot.  Polled without blocking
+    so the gevent hub of a waiting worker keeps running.
+    """
+    if fcntl is None:
+        yield
+        return
+    descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        while True:
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                gevent.sleep(poll_interval)
+        yield
+    finally:
+        os.close(descriptor)  # releases the lock
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("paramsfile", help="Test data file")
+    parser.add_argument(
+        "models",
+        nargs="+",
+        help="ONT test data model modules, e.g. l3one2oneservicecrud",
+    )
+    parser.add_argument(
+        "--directory", default=None, help=f"Default {default_directory()}"
+    )
+    args = parser.parse_args(argv)
+    for name in args.models:
+        module = importlib.import_module(f"locustfiles.lib.locustmodeldata.{name}")
+        snapshot = load(args.paramsfile, module, args.directory)
+        print(
+            f"{module.ONT_SPEC.section}: {len(snapshot.store)} ONTs, "
+            f"{os.path.getsize(snapshot.path)} bytes, {snapshot.path}"
+        )
+        snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Compact columnar store of the ONT test data.
+
+A validated ONTConfigModel costs a pydantic object per ONT plus one per data
+and voice service, a few KB per ONT kept alive by every worker.  ONTStore
+keeps the ONTs of any ONT user type (ontcrud, l3one2oneservicecrud,
+ontl3121dataservicecd, ontl2tpdataservicecd) in columns:
+
+    * text fields unique per ONT (ont_id, serial_number, subscriber_id,
+      voice user and uri) in one UTF-8 buffer with an end offset array
+    * repeated strings (device_name, profile_id, vendor_id, service names,
+      ports, passwords) as ids of an interned string table
+    * VLAN and c_vlan as integer arrays
+
+so an ONT costs a few dozen bytes.  Columns are only created for fields
+set in the data, missing fields read as None.  store[index] returns a
+lightweight ONTRow view reading the columns, with the attributes of
+ONTConfigModel (ont.ont_id, ont.data_service.vlan, ...), so the users code
+is unchanged:
+
+    test_data = validate_test_data(params)
+    store = ONTStore.from_test_data(test_data)  # ont_config models released
+    ont = store[0]
+    ont.data_service.vlan
+
+Views are created on access: lease ONT indexes rather than views (see
+smxlease), e.g. LeasePool(range(len(store)), key=store.key("device_name")).
+
+A store can be written to a snapshot file memory mapped by all the workers
+of a host (see ontsnapshot).
+"""
+
+from array import array
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional
+
+TEXT, SYMBOL, INT = "text", "symbol", "int"
+
+# ONT field: column kind
+FIELDS = {
+    "ont_id": TEXT,
+    "serial_number": TEXT,
+    "subscriber_id": TEXT,
+    "device_name": SYMBOL,
+    "profile_id": SYMBOL,
+    "vendor_id": SYMBOL,
+}
+SERVICES = ("data_service", "voice_service")
+# Service field: column kind, the columns are named <service>.<field>
+SERVICE_FIELDS = {
+    "vlan": INT,
+    "c_vlan": INT,
+    "service_name": SYMBOL,
+    "ont_port_id": SYMBOL,
+    "user": TEXT,
+    "password": SYMBOL,
+    "uri": TEXT,
+}
+
+# (column, kind) of the ONT fields and
+# (service bit, service, ((column, field, kind), ...)) of the service fields
+ONT_COLUMNS = tuple(FIELDS.items())
+SERVICE_COLUMNS = tuple(
+    (
+        1 << bit,
+        service,
+        tuple(
+            (f"{service}.{field}", field, kind)
+            for field, kind in SERVICE_FIELDS.items()
+        ),
+    )
+    for bit, service in enumerate(SERVICES)
+)
+
+NO_INT = -1  # None in integer columns
+NONE_END = 1 << 31  # bit of the end offset of None in text columns
+END_MASK = NONE_END - 1
+
+
+class TextColumn:
+    """Strings in one UTF-8 buffer with end offsets, the end of a None value
+    has the NONE_END bit set (its end offset is the previous end).
+    Columns read from a snapshot (see ontsnapshot) hold read only memory
+    views instead of arrays.
+    """
+
+    __slots__ = ("buffer", "ends")
+
+    def __init__(self, rows: int = 0):
+        self.buffer = bytearray()
+        self.ends = array("I", [NONE_END]) * rows
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def append(self, value: Optional[str]):
+        if value is None:
+            self.ends.append(len(self.buffer) | NONE_END)
+        else:
+            self.buffer += value.encode("utf8")
+            if len(self.buffer) >= NONE_END:
+                raise OverflowError("Text column buffer over 2 GiB")
+            self.ends.append(len(self.buffer))
+
+    def get(self, index: int) -> Optional[str]:
+        end = self.ends[index]
+        if end & NONE_END:
+            return None
+        start = self.ends[index - 1] & END_MASK if index else 0
+        return str(self.buffer[start:end], "utf8")
+
+    def nbytes(self) -> int:
+        return len(self.buffer) + self.ends.itemsize * len(self.ends)
+
+
+class SymbolColumn:
+    """Ids of the interned string table of the store, 0 is None"""
+
+    __slots__ = ("ids", "table")
+
+    def __init__(self, table: "SymbolTable", rows: int = 0):
+        self.ids = array("I", bytes(4 * rows))
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, value: Optional[str]):
+        self.ids.append(self.table.id(value))
+
+    def get(self, index: int) -> Optional[str]:
+        return self.table.strings[self.ids[index]]
+
+    def nbytes(self) -> int:
+        return self.ids.itemsize * len(self.ids)
+
+
+class IntColumn:
+    """Non negative integers, NO_INT is None"""
+
+    __slots__ = ("values",)
+
+    def __init__(self, rows: int = 0):
+        self.values = array("i", [NO_INT]) * rows
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, value: Optional[int]):
+        self.values.append(NO_INT if value is None else value)
+
+    def get(self, index: int) -> Optional[int]:
+        value = self.values[index]
+        return None if value == NO_INT else value
+
+    def nbytes(self) -> int:
+        return self.values.itemsize * len(self.values)
+
+
+class SymbolTable:
+    """Interned strings shared by the symbol columns of a store"""
+
+    __slots__ = ("strings", "ids")
+
+    def __init__(self):
+        self.strings: List[Optional[str]] = [None]
+        self.ids: Dict[str, int] = {}
+
+    def id(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        symbol = self.ids.get(value)
+        if symbol is None:
+            symbol = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return symbol
+
+
+class ServiceRow:
+    """View of the data or voice service of an ONT"""
+
+    __slots__ = ("_store", "_index", "_service")
+
+    def __init__(self, store: "ONTStore", index: int, service: str):
+        self._store = store
+        self._index = index
+        self._service = service
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in SERVICE_FIELDS
+        )
+        return f"{self._service}({fields})"
+
+
+class ONTRow:
+    """View of an ONT of the store with the ONTConfigModel attributes"""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: "ONTStore", index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ONTRow)
+            and other._store is self._store
+            and other._index == self._index
+        )
+
+    def __hash__(self):
+        return hash((id(self._store), self._index))
+
+    def __repr__(self):
+        return f"ONTRow({self.to_dict()})"
+
+    def to_dict(self) -> dict:
+        """Return the ONT as a dict like ONTConfigModel.model_dump"""
+        ont = {field: getattr(self, field) for field in FIELDS}
+        for service in SERVICES:
+            row = getattr(self, service)
+            ont[service] = (
+                None
+                if row is None
+                else {field: getattr(row, field) for field in SERVICE_FIELDS}
+            )
+        return ont
+
+
+def _column_property(column: str) -> property:
+    def get(self):
+        return self._store.value(column, self._index)
+
+    return property(get)
+
+
+def _service_column_property(field: str) -> property:
+    def get(self):
+        return self._store.value(f"{self._service}.{field}", self._index)
+
+    return property(get)
+
+
+def _service_property(service: str) -> property:
+    bit = 1 << SERVICES.index(service)
+
+    def get(self):
+        if self._store.services[self._index] & bit:
+            return ServiceRow(self._store, self._index, service)
+        return None
+
+    return property(get)
+
+
+for _field in FIELDS:
+    setattr(ONTRow, _field, _column_property(_field))
+for _service in SERVICES:
+    setattr(ONTRow, _service, _service_property(_service))
+for _field in SERVICE_FIELDS:
+    setattr(ServiceRow, _field, _service_column_property(_field))
+
+
+class ONTStore:
+    """Columnar ONT test data"""
+
+    def __init__(self):
+        self.symbols = SymbolTable()
+        self.columns: Dict[str, Any] = {}
+        self.services = array("B")  # bit per service of SERVICES set
+        self._ont_ids: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_onts(cls, onts: Iterable[Any]) -> "ONTStore":
+        """Return the store of ONTConfigModel like objects (or dicts)"""
+        store = cls()
+        for ont in onts:
+            store.append(ont)
+        return store
+
+    @classmethod
+    def from_test_data(cls, test_data) -> "ONTStore":
+        """Return the store of the ont_config of validated ONT test data
+        (onts.ont_config) and release the ont_config models, unless shared
+        read only (see configservice)
+        """
+        onts = test_data.onts
+        store = cls.from_onts(onts.ont_config)
+        if not onts.model_config.get("frozen"):
+            onts.ont_config.clear()
+        return store
+
+    def _column(self, name: str, kind: str):
+        """Return a column, created and filled with None on first use"""
+        column = self.columns.get(name)
+        if column is None:
+            rows = len(self.services)
+            if kind == TEXT:
+                column = TextColumn(rows)
+            elif kind == SYMBOL:
+                column = SymbolColumn(self.symbols, rows)
+            else:
+                column = IntColumn(rows)
+            self.columns[name] = column
+        return column
+
+    def append(self, ont: Any) -> int:
+        """Add an ONT, return its index"""
+        index = len(self.services)
+        columns = self.columns
+        appended = 0
+        flags = 0
+        get = _getter(ont)
+        for name, kind in ONT_COLUMNS:
+            value = get(name)
+            if value is not None or name in columns:
+                self._column(name, kind).append(value)
+                appended += 1
+        for bit, service, service_columns in SERVICE_COLUMNS:
+            service_value = get(service)
+            if service_value is None:
+                continue
+            flags |= bit
+            service_get = _getter(service_value)
+            for name, field, kind in service_columns:
+                value = service_get(field)
+                if value is not None or name in columns:
+                    self._column(name, kind).append(value)
+                    appended += 1
+        if appended < len(columns):
+            for column in columns.values():
+                if len(column) == index:  # not set by this ONT
+                    column.append(None)
+        self.services.append(flags)
+        if self._ont_ids is not None:
+            self._ont_ids.setdefault(get("ont_id"), index)
+        return index
+
+    def value(self, column: str, index: int):
+        """Return the value of a column of an ONT, None when not set"""
+        values = self.columns.get(column)
+        return None if values is None else values.get(index)
+
+    def __len__(self) -> int:
+        return len(self.services)
+
+    def __getitem__(self, index: int) -> ONTRow:
+        count = len(self.services)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError(f"ONT index {index} out of range")
+        return ONTRow(self, index)
+
+    def __iter__(self) -> Iterator[ONTRow]:
+        for index in range(len(self.services)):
+            yield ONTRow(self, index)
+
+    def find(self, ont_id: str) -> Optional[ONTRow]:
+        """Return the first ONT with ont_id (index built on first call)"""
+        if self._ont_ids is None:
+            column = self.columns.get("ont_id")
+            self._ont_ids = {}
+            if column is not None:
+                for index in range(len(self.services)):
+                    self._ont_ids.setdefault(column.get(index), index)
+        index = self._ont_ids.get(ont_id)
+        return None if index is None else ONTRow(self, index)
+
+    def key(self, column: str) -> Callable[[int], Hashable]:
+        """Return a function of an ONT index returning its column value
+        (interned id for symbol columns), e.g. a LeasePool key
+        """
+        values = self.columns.get(column)
+        if values is None:
+            return lambda index: None
+        if isinstance(values, SymbolColumn):
+            return values.ids.__getitem__
+        return values.get
+
+    def nbytes(self) -> int:
+        """Return the size of the columns in bytes (string table excluded)"""
+        return len(self.services) + sum(
+            column.nbytes() for column in self.columns.values()
+        )
+
+
+def _getter(item: Any) -> Callable[[str], Any]:
+    """Return a function of a field name returning the field of a model,
+    view or dict, None when not set
+    """
+    if isinstance(item, dict):
+        return item.get
+    fields = getattr(item, "__dict__", None)
+    if fields is not None:  # pydantic models keep their fields in __dict__
+        return fields.get
+    return lambda field: getattr(item, field, None)
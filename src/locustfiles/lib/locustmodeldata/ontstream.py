@@ -0,0 +1,190 @@
+"""
+Streaming loader of large ont_config test data.
+
+validate_test_data needs the whole test data file loaded (load_test_params)
+and builds a model per ONT of the file, on every worker.  OntStream reads the
+ont_config of an ONT test data section one ONT at a time and yields the
+validated ONTConfigModel of the worker shard only, so the start time and
+memory of a worker do not grow with the ONTs it does not use:
+
+    stream = OntStream(paramsfile, l3one2oneservicecrud, smxshard.current(env))
+    store = ONTStore.from_onts(stream)  # or any consumer of the ONTs
+    stream.test_data.onts.force_delete  # validated section, ont_config empty
+
+The ont_config is read from the YAML file (parser events, see yamlstream,
+force_delete and defaults must then precede ont_config) or from a side file
+named by ont_config, relative to the YAML file:
+
+    ont_config: onts.jsonl   # one JSON ONT per line
+    ont_config: onts.csv     # header row of the ONT fields, service fields
+                             # as data_service.vlan, empty cells not set
+
+Every ONT goes through the ontvalidate pipeline (defaults, duplicates
+removed over the whole file, required fields), so a stream yields the ONTs
+validate_test_data would return for the shard.  Only the unique keys of the
+ONTs are kept while streaming, the ONTs of other shards are not defaulted.
+Duplicates are logged and the ONTs of the shard missing required fields
+raise one ValueError when the stream ends.
+
+The other test data is loaded without the ont_config lists with
+load_test_params(paramsfile, skip=("ont_config",)) (see util).
+"""
+
+import csv
+import json
+import os
+from typing import Any, Iterator, Optional
+
+from pydantic import ValidationError
+
+from locustfiles.lib import yamlstream
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.errors import ToolboxError
+from locustfiles.lib.locustmodeldata.ontvalidate import ValidationReport
+from locustfiles.lib.smxshard import Shard
+
+try:
+    import orjson
+except ImportError:  # optional faster decoder
+    orjson = None
+
+LOGGER = getlogger(__name__)
+
+ONT_CONFIG = "ont_config"
+_END = object()
+
+
+class OntStreamError(ToolboxError):
+    """ONT test data stream error"""
+
+    pass
+
+
+class OntStream:
+    """Validated ONTs of the shard of an ONT test data section, read
+    incrementally from the test data file on each iteration
+    """
+
+    def __init__(self, paramsfile: str, module, shard: Optional[Shard] = None):
+        # module: ONT test data model module, e.g. l3one2oneservicecrud
+        self.paramsfile = paramsfile
+        self.module = module
+        self.spec = module.ONT_SPEC
+        self.shard = shard or Shard(0, 1)
+        self.test_data = None  # validated section without ont_config
+        self.count = 0  # ONTs of the section, duplicates excluded
+        self.side_file: Optional[str] = None  # path of the ont_config side file
+
+    def __iter__(self) -> Iterator[Any]:
+        section = self.spec.section
+        header = {}
+        with open(self.paramsfile, "r", encoding="utf8") as stream:
+            items = yamlstream.iter_items(
+                stream, (section, "onts", ONT_CONFIG), header, skip=(ONT_CONFIG,)
+            )
+            first = next(items, _END)  # reads the keys before ont_config
+            if first is _END and not header:
+                return  # no section
+            side_file = header.pop(ONT_CONFIG, None)
+            if side_file is not None:
+                for _ in items:
+                    pass  # the keys after ont_config
+                onts = self._side_file(side_file)
+            else:
+                onts = items if first is _END else _chain(first, items)
+            self.test_data = self._validate_header(header, side_file is None)
+            yield from self._validate(onts, header.get("defaults"))
+
+    def _validate_header(self, header: dict, inline: bool):
+        """Return the validated section with an empty ont_config"""
+        section = self.spec.section
+        try:
+            test_data = self.module.DataModel.model_validate(
+                {section: {"onts": {**header, ONT_CONFIG: []}}}
+            )
+        except ValidationError as error:
+            hint = ""
+            if inline:
+                hint = "  force_delete and defaults must precede ont_config"
+            raise OntStreamError(
+                f"{self.paramsfile} {section}: {error}{hint}"
+            ) from None
+        return getattr(test_data, section)
+
+    def _validate(self, onts, defaults) -> Iterator[Any]:
+        """Yield the validated ONTs of the shard"""
+        model = self.module.ONTConfigModel
+        index, count = self.shard
+        report = ValidationReport(self.spec.section)
+        self.count = selected = 0
+        for position, ont in self.spec.iter_prepared(
+            onts, defaults, report, self.shard
+        ):
+            selected += 1
+            try:
+                yield model.model_validate(ont)
+            except ValidationError as error:
+                raise OntStreamError(
+                    f"{self.paramsfile} {self.spec.section} {ONT_CONFIG}"
+                    f"[{position}]: {error}"
+                ) from None
+        self.count = report.count
+        report.log()
+        report.raise_for_errors()
+        LOGGER.info(
+            f"{self.spec.section}: {selected} of {self.count} ONTs loaded from "
+            f"{self.paramsfile} (shard {index}/{count})"
+        )
+
+    def _side_file(self, name) -> Iterator[dict]:
+        """Return the raw ONTs of a JSONL or CSV side file"""
+        path = os.path.join(os.path.dirname(self.paramsfile), str(name))
+        self.side_file = path
+        extension = os.path.splitext(path)[1].lower()
+        if extension in (".jsonl", ".ndjson"):
+            return iter_jsonl(path)
+        if extension == ".csv":
+            return iter_csv(path)
+        raise OntStreamError(
+            f"{self.paramsfile} {self.spec.section} {ONT_CONFIG}: "
+            f"{name} is not a .jsonl or .csv file"
+        )
+
+
+def _chain(first, items: Iterator) -> Iterator:
+    yield first
+    yield from items
+
+
+def iter_jsonl(path: str) -> Iterator[dict]:
+    """Yield the records of a JSON lines file, blank lines skipped"""
+    loads = orjson.loads if orjson is not None else json.loads
+    with open(path, "rb") as lines:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except ValueError as error:
+                raise OntStreamError(f"{path} line {number}: {error}") from None
+
+
+def iter_csv(path: str) -> Iterator[dict]:
+    """Yield the records of a CSV file with a header row.  Columns named
+    <service>.<field> set a field of a nested service, empty cells are not
+    set.
+    """
+    with open(path, "r", encoding="utf8", newline="") as rows:
+        reader = csv.reader(rows)
+        columns = [tuple(column.strip().split(".", 1)) for column in next(reader, ())]
+        for row in reader:
+            record = {}
+            for column, value in zip(columns, row):
+                if not value:
+                    continue
+                if len(column) == 1:
+                    record[column[0]] = value
+                else:
+                    record.setdefault(column[0], {})[column[1]] = value
+            if record:
+                yield record
@@ -0,0 +1,306 @@
+"""
+Linear validation pipeline of the ont_config test data.
+
+Runs on the raw YAML data of an ONT test data section (force_delete,
+defaults, ont_config) before the pydantic models are built, in one pass:
+
+    * applies the defaults: missing ONT fields (profile_id, vendor_id,
+      device_name) and missing service fields (vlan, service_name,
+      ont_port_id, password) are taken from defaults, an ONT without a
+      service gets the default service.  Fields unique per ONT (c_vlan,
+      SIP user and uri) are never defaulted
+    * removes duplicates, the first ONT is kept: ONT ID, serial number,
+      c_vlan per device and S-VLAN, SIP user.  Duplicates across the whole
+      list are removed before the ONTs are sharded (see smxshard), so two
+      workers never get colliding ONTs
+    * selects the ONTs of the shard, round robin over the ONTs left.  Only
+      the unique keys of the other ONTs are tracked: the ONTs of the shard
+      alone are copied, defaulted and checked, so the work of a worker
+      shrinks with the worker count
+    * checks the required fields after the defaults are applied
+
+Duplicates are logged as one summary, the ONTs missing required fields are
+reported as one ValueError (a single pydantic validation error) listing them
+all.  Hash set lookups only, and the garbage collector is paused while the
+ONTs are prepared and validated (gc_paused): it otherwise rescans the
+millions of ONT objects over and over and triples the validation time.
+
+    @model_validator(mode="before")
+    @classmethod
+    def prepare_ont_config(cls, data, info: ValidationInfo):
+        return OntSpec(...).prepare(data, context_shard(info))
+"""
+
+import gc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.smxshard import Shard
+
+LOGGER = getlogger(__name__)
+
+# Report at most this many examples per problem
+MAX_EXAMPLES = 10
+
+
+class ValidationReport:
+    """Aggregated duplicates and missing fields of an ont_config list"""
+
+    def __init__(self, section: str):
+        self.section = section
+        self.duplicates: Dict[str, List[Tuple]] = {}  # key: [(value, pos, first)]
+        self.duplicate_counts: Dict[str, int] = {}  # key: duplicates
+        self.duplicate_count = 0
+        self.missing: List[Tuple[object, List[str]]] = []  # (ont_id, fields)
+        self.missing_count = 0
+        self.count = 0  # ONTs, duplicates excluded
+
+    def duplicate(self, key: str, value, position: int, first: int):
+        self.duplicate_count += 1
+        self.duplicate_counts[key] = self.duplicate_counts.get(key, 0) + 1
+        examples = self.duplicates.setdefault(key, [])
+        if len(examples) < MAX_EXAMPLES:
+            examples.append((value, position, first))
+
+    def missing_fields(self, ont_id, fields: List[str]):
+        self.missing_count += 1
+        if len(self.missing) < MAX_EXAMPLES:
+            self.missing.append((ont_id, fields))
+
+    def log(self):
+        """Log the duplicate ONTs removed"""
+        if not self.duplicate_count:
+            return
+        summary = "; ".join(
+            f"{self.duplicate_counts[key]} {key} ("
+            + ", ".join(
+                f"{value} at {position} first at {first}"
+                for value, position, first in examples
+            )
+            + (", ..." if self.duplicate_counts[key] > len(examples) else "")
+            + ")"
+            for key, examples in self.duplicates.items()
+        )
+        LOGGER.warning(
+            f"{self.section} ont_config: {self.duplicate_count} duplicate ONTs "
+            f"removed: {summary}"
+        )
+
+    def raise_for_errors(self):
+        """Raise one ValueError listing the ONTs missing required fields"""
+        if not self.missing_count:
+            return
+        onts = ", ".join(
+            f"{ont_id} ({', '.join(fields)})" for ont_id, fields in self.missing
+        )
+        more = self.missing_count - len(self.missing)
+        raise ValueError(
+            f"{self.missing_count} ONTs missing required fields: {onts}"
+            + (f" and {more} more" if more > 0 else "")
+        )
+
+
+@dataclass(frozen=True)
+class OntSpec:
+    """Defaults, unique keys and required fields of an ONT test data model"""
+
+    section: str
+    defaults: Tuple[str, ...] = ()  # ONT fields defaulted
+    services: Tuple[str, ...] = ()  # services of the ONT
+    service_defaults: Tuple[str, ...] = (
+        "vlan",
+        "service_name",
+        "ont_port_id",
+        "password",
+    )
+    unique_serial: bool = False
+    unique_c_vlan: bool = False
+    unique_sip_user: bool = False
+    required: Tuple[str, ...] = ()
+    # service fields required when the ONT has the service
+    required_service: Tuple[str, ...] = ()
+
+    def prepare(self, data, shard: Optional[Shard] = None):
+        """Return the raw test data with the ONTs of the shard (all without
+        shard) in its ont_config, defaulted, without duplicates.  Raise
+        ValueError when ONTs of the shard miss required fields.
+        """
+        if not isinstance(data, dict) or not isinstance(data.get("ont_config"), list):
+            return data  # left to the model validation errors
+        report = ValidationReport(self.section)
+        with gc_paused():
+            onts = [
+                ont
+                for _, ont in self.iter_prepared(
+                    data["ont_config"], data.get("defaults"), report, shard
+                )
+            ]
+        report.log()
+        report.raise_for_errors()
+        return {**data, "ont_config": onts}
+
+    def iter_prepared(
+        self,
+        ont_config: Iterable,
+        defaults,
+        report: ValidationReport,
+        shard: Optional[Shard] = None,
+    ) -> Iterator[Tuple[int, dict]]:
+        """Yield (position, ONT) of the raw ONTs of the shard defaulted,
+        without duplicates, one at a time.  The unique keys of every ONT are
+        tracked, the ONTs of other shards are neither copied nor checked.
+        Duplicates and ONTs of the shard missing required fields (yielded)
+        are recorded in report.
+        """
+        index, count = shard or (0, 1)
+        defaults = defaults or {}
+        if not isinstance(defaults, dict):
+            defaults = defaults.model_dump()
+        ont_defaults = [
+            (field, defaults[field])
+            for field in self.defaults
+            if defaults.get(field) is not None
+        ]
+        default_device = dict(ont_defaults).get("device_name")
+        # (service, default service, [(field, default)], default vlan,
+        #  SIP user checked)
+        services = []
+        for service in self.services:
+            default_service, fields = _service_defaults(
+                defaults.get(service), self.service_defaults
+            )
+            sip_user = self.unique_sip_user and service == "voice_service"
+            default_vlan = dict(fields).get("vlan")
+            services.append((service, default_service, fields, default_vlan, sip_user))
+        unique_serial = self.unique_serial
+        unique_c_vlan = self.unique_c_vlan
+        service_keys = unique_c_vlan or self.unique_sip_user
+        required = self.required
+        required_service = self.required_service
+        ont_ids: Dict[object, int] = {}
+        serials: Dict[object, int] = {}
+        c_vlans: Dict[Tuple, int] = {}
+        sip_users: Dict[object, int] = {}
+        for position, ont in enumerate(ont_config):
+            if type(ont) is not dict:
+                report.count += 1
+                if (report.count - 1) % count == index:
+                    yield position, ont  # left to the model validation errors
+                continue
+            get = ont.get
+
+            # unique keys of the ONT, defaults applied, recorded as they are
+            # checked (one lookup each) and forgotten again on a duplicate
+            ont_id = get("ont_id")
+            duplicate = None
+            added = []  # (seen, value) recorded for this ONT
+            if ont_id is not None:
+                first = ont_ids.setdefault(ont_id, position)
+                if first != position:
+                    duplicate = "ont_id", ont_id, first
+                else:
+                    added.append((ont_ids, ont_id))
+            if unique_serial and duplicate is None:
+                serial = get("serial_number")
+                if serial is not None:
+                    first = serials.setdefault(serial, position)
+                    if first != position:
+                        duplicate = "serial_number", serial, first
+                    else:
+                        added.append((serials, serial))
+            if service_keys and duplicate is None:
+                for service, default_service, _, default_vlan, sip_user in services:
+                    ont_service = get(service)
+                    if ont_service is None:
+                        ont_service = default_service
+                    if type(ont_service) is not dict:
+                        continue  # no service or left to the model errors
+                    service_get = ont_service.get
+                    c_vlan = service_get("c_vlan") if unique_c_vlan else None
+                    if c_vlan is not None:
+                        device = get("device_name")
+                        vlan = service_get("vlan")
+                        key = (
+                            default_device if device is None else device,
+                            default_vlan if vlan is None else vlan,
+                            c_vlan,
+                        )
+                        first = c_vlans.setdefault(key, position)
+                        if first != position:
+                            duplicate = "c_vlan", key, first
+                            break
+                        added.append((c_vlans, key))
+                    user = service_get("user") if sip_user else None
+                    if user is not None:
+                        first = sip_users.setdefault(user, position)
+                        if first != position:
+                            duplicate = "sip_user", user, first
+                            break
+                        added.append((sip_users, user))
+
+            if duplicate is not None:
+                for seen, value in added:
+                    seen.pop(value, None)
+                report.duplicate(*duplicate[:2], position, duplicate[2])
+                continue
+            report.count += 1
+            if (report.count - 1) % count != index:
+                continue  # ONT of another shard
+
+            ont = dict(ont)
+            get = ont.get
+            for field, value in ont_defaults:
+                if get(field) is None:
+                    ont[field] = value
+            missing = [field for field in required if get(field) is None]
+            for service, default_service, fields, _, _ in services:
+                ont_service = get(service)
+                if ont_service is None:
+                    if default_service is None:
+                        continue
+                    ont_service = ont[service] = dict(default_service)
+                elif type(ont_service) is not dict:
+                    continue  # left to the model validation errors
+                elif fields:
+                    ont_service = ont[service] = dict(ont_service)
+                    for field, value in fields:
+                        if ont_service.get(field) is None:
+                            ont_service[field] = value
+                for field in required_service:
+                    if ont_service.get(field) is None:
+                        missing.append(f"{service}.{field}")
+            if missing:
+                report.missing_fields(ont_id, missing)
+            yield position, ont
+
+
+@contextmanager
+def gc_paused():
+    """Pause the cyclic garbage collector while building millions of
+    acyclic objects (ONT dicts and models), it would rescan them all
+    every few thousand allocations
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _service_defaults(
+    default_service, fields: Tuple[str, ...]
+) -> Tuple[Optional[dict], List[Tuple[str, object]]]:
+    """Return (default service dict, [(field, default)]) of a service"""
+    if default_service is None:
+        return None, []
+    if not isinstance(default_service, dict):
+        default_service = default_service.model_dump()
+    return default_service, [
+        (field, default_service[field])
+        for field in fields
+        if default_service.get(field) is not None
+    ]
@@ -12,8 +12,11 @@ from pydantic import (
     field_validator,
     PositiveInt,
     conlist,
+    ValidationInfo,
 )
 
+from locustfiles.lib.smxshard import Shard, context_shard
+
 
 class BaseConfigModel(BaseModel):
     """Base configuration for common data model configuration"""
@@ -43,12 +46,14 @@ class CrudDataModel(BaseConfigModel):
 
     @field_validator("vlan_ids")
     @classmethod
-    def vlan_ids_processed(cls, value):
+    def vlan_ids_processed(cls, value, info: ValidationInfo):
         """Post process vlan_ids into a list and ensure list of unique VLAN IDs
-        Order is kept intact from the order of the input data
+        Order is kept intact from the order of the input data.
+        Only the VLAN IDs of the worker shard are kept (see smxshard).
         """
+        shard = context_shard(info)
         if type(value) == int:
-            return [value]
+            return [value] if shard is None else shard.take([value])
         else:
             vlan_ids_list = []
             for vlan in value:
@@ -58,7 +63,8 @@ class CrudDataModel(BaseConfigModel):
                     vlan_ids_list.extend(vlan)
                 elif type(vlan) == VlanRangeModel:
                     vlan_ids_list.extend(range(*vlan.range))
-            return list(OrderedDict.fromkeys(vlan_ids_list))  # ensure no duplicates
+            vlan_ids_list = list(OrderedDict.fromkeys(vlan_ids_list))  # no duplicates
+            return vlan_ids_list if shard is None else shard.take(vlan_ids_list)
 
 
 class DataModel(BaseConfigModel):
@@ -70,9 +76,12 @@ class DataModel(BaseConfigModel):
 # --------------------
 
 
-def validate_test_data(params) -> dict:
+def validate_test_data(params, shard: Shard = None) -> dict:
     """Validate test data for L3 1:1 Service Crud User.
     Ignore all other params.
+    shard selects the VLAN IDs of a worker (see smxshard).
     """
-    validated_params = DataModel(**params).vlan_crud_data
+    validated_params = DataModel.model_validate(
+        params, context={"shard": shard}
+    ).vlan_crud_data
     return validated_params
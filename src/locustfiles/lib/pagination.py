@@ -0,0 +1,92 @@
+"""
+Streaming iteration over paginated SMx list endpoints.
+
+iter_pages yields records one at a time across pages so callers walk every
+ONT or device with a single for loop.  While the current page is consumed
+the next page is already being fetched (prefetch), and the page size adapts
+to the observed response time: fast pages grow the page size, slow pages
+shrink it, within [min_limit, max_limit].  At most the current page and the
+prefetched page are held in memory.
+
+Under Locust (gevent monkey patched) the prefetch worker is a greenlet.
+
+Example:
+    for ont in smx.iter_config_device_gui_ont("olt1", ("ont-id", "serial-number")):
+        print(ont["ont-id"])
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+
+def response_records(body) -> list:
+    """Return the list of records of a decoded SMx list response.
+    Accepts a plain list or an object wrapping the list.
+    """
+    if isinstance(body, dict):
+        for value in body.values():
+            if isinstance(value, list):
+                return value
+        return []
+    return body or []
+
+
+def next_limit(
+    limit: int, elapsed: float, target_seconds: float, min_limit: int, max_limit: int
+) -> int:
+    """Return page size for the next page from the last page response time"""
+    if elapsed < target_seconds / 2:
+        limit *= 2
+    elif elapsed > target_seconds * 2:
+        limit //= 2
+    return max(min_limit, min(max_limit, limit))
+
+
+def iter_pages(
+    fetch_page: Callable[[int, int], list],
+    limit: int,
+    min_limit: int = None,
+    max_limit: int = None,
+    target_seconds: float = 1.0,
+    prefetch: bool = True,
+) -> Iterator[dict]:
+    """Yield records of a paginated read.
+    fetch_page(offset, limit) returns the list of records of one page, an
+    empty page or a page shorter than the limit it was fetched with ends the
+    read.  Page size adapts between min_limit (default limit / 4) and
+    max_limit (default limit) aiming for target_seconds per page.  SMx
+    returns at most its own page size cap: a max_limit above it would end
+    the read at the first capped page.
+    """
+    min_limit = min_limit or max(1, limit // 4)
+    max_limit = max_limit or limit
+
+    def timed_fetch(offset, limit):
+        start = time.perf_counter()
+        page = fetch_page(offset, limit)
+        return page, time.perf_counter() - start
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        offset = 0
+        page, elapsed = timed_fetch(offset, limit)
+        while True:
+            last_page = not page or len(page) < limit  # limit the page was sent
+            offset += len(page)
+            future = None
+            if not last_page:
+                limit = next_limit(limit, elapsed, target_seconds, min_limit, max_limit)
+                if executor is not None:
+                    future = executor.submit(timed_fetch, offset, limit)
+            yield from page
+            if last_page:
+                return
+            page = None  # release the consumed page before the next one
+            if future is not None:
+                page, elapsed = future.result()
+            else:
+                page, elapsed = timed_fetch(offset, limit)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
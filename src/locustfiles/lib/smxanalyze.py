@@ -0,0 +1,605 @@
+"""
+Offline analysis of a Locust run against SMx.
+
+Reads the per request traces of a run (smxtrace files, one per worker) or
+the Locust CSV history (--csv <prefix> --csv-full-history) and reports per
+endpoint, optionally per device, the request rate and the p50/p95/p99/p99.9
+latency over sliding windows.  Two runs are compared per endpoint to tell
+whether a new SMx build is slower:
+
+    * latency: Mann-Whitney U test of the request latencies of both runs
+      (of the window p95 series for CSV input, the raw latencies are not in
+      the CSV), normal approximation with tie correction
+    * throughput: Welch test of the request rates of non-overlapping
+      windows (every window/step-th sliding window, so that no request is
+      counted in two samples)
+
+A change is flagged when its two sided p-value is below --alpha and the
+median, p95 or mean request rate moved by more than --min-change.  The
+normal approximation holds for the sample sizes of load runs (tens of
+windows, thousands of requests).
+
+Processing is vectorized with numpy (optional dependency, pip install
+numpy): a run is sorted once and each window is a slice of the sorted
+latencies.
+
+Examples:
+    python -m locustfiles.lib.smxanalyze summary traces/ --window 60 --step 10
+    python -m locustfiles.lib.smxanalyze summary results/run1_stats_history.csv --by-device
+    python -m locustfiles.lib.smxanalyze compare traces-r21/ traces-r22/ --json compare.json
+"""
+
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from locustfiles.lib import smxtrace
+from locustfiles.lib.errors import ToolboxError
+from locustfiles.lib.smxroutes import COMPILED_ROUTES
+
+try:
+    import numpy as np
+except ImportError:  # optional, only needed for the analysis
+    np = None
+
+PERCENTILES = (50, 95, 99, 99.9)
+HISTORY_PERCENTILES = {50: "50%", 95: "95%", 99: "99%", 99.9: "99.9%"}
+# seconds averaged by the Requests/s of a Locust history row (current_rps)
+HISTORY_RATE_WINDOW = 10.0
+DEVICE_PATTERN = re.compile(r"(?:/device/|device-name=)([^/?&\[]+)")
+ROOT_PATTERN = re.compile(r"^https?://[^/]+(?:/rest/v\d+)?")
+
+# (method, path template): operation, labels trace endpoints
+OPERATIONS = {
+    (compiled.method, compiled.template): operation
+    for operation, compiled in COMPILED_ROUTES.items()
+}
+
+
+class AnalyzeError(ToolboxError):
+    """Run analysis error"""
+
+    pass
+
+
+def require_numpy():
+    """Raise AnalyzeError when numpy is not installed"""
+    if np is None:
+        raise AnalyzeError(
+            "Run analysis needs numpy, install it with: pip install numpy"
+        )
+
+
+@dataclass
+class Windows:
+    """Sliding window series of one endpoint (and device)"""
+
+    start: "np.ndarray"  # window start, seconds since the run start
+    requests: "np.ndarray"
+    failures: "np.ndarray"
+    rps: "np.ndarray"
+    percentiles: Dict[float, "np.ndarray"]  # percentile: latency ms series
+    latency_ms: Optional["np.ndarray"] = None  # all request latencies (traces)
+    stride: int = 1  # windows per window length, consecutive windows overlap
+
+    def independent_rps(self) -> "np.ndarray":
+        """Return the request rates of non-overlapping windows"""
+        return self.rps[:: self.stride]
+
+    def report(self) -> list:
+        """Return the windows as a list of dicts"""
+        return [
+            {
+                "start": round(float(self.start[index]), 3),
+                "requests": int(self.requests[index]),
+                "failures": int(self.failures[index]),
+                "rps": round(float(self.rps[index]), 3),
+                **{
+                    f"p{percentile:g}": _number(series[index])
+                    for percentile, series in self.percentiles.items()
+                },
+            }
+            for index in range(len(self.start))
+        ]
+
+
+@dataclass
+class Run:
+    """Analyzed run: windows per group (endpoint or "endpoint @ device")"""
+
+    source: str
+    duration: float
+    groups: Dict[str, Windows]
+    totals: Dict[str, dict]
+
+
+def _number(value) -> Optional[float]:
+    """Return value rounded for the report, None for NaN"""
+    value = float(value)
+    return None if math.isnan(value) else round(value, 3)
+
+
+def trace_paths(path: str) -> List[str]:
+    """Return the trace files of a trace file or directory"""
+    if os.path.isdir(path):
+        paths = sorted(glob.glob(os.path.join(path, "smxtrace-*.bin")))
+        if not paths:
+            raise AnalyzeError(f"No smxtrace-*.bin trace files in {path}")
+        return paths
+    return [path]
+
+
+def endpoint_label(method: str, template: str) -> str:
+    """Return the endpoint name of a trace method and route template"""
+    operation = OPERATIONS.get((method, template))
+    if operation is None:
+        return f"{method} {template}"
+    return f"{operation} ({method} {template})"
+
+
+def load_traces(paths: List[str]) -> dict:
+    """Return the columns of trace files as numpy arrays.
+    endpoint and device are codes of the endpoints and devices lists.
+    """
+    require_numpy()
+    endpoints: Dict[str, int] = {}
+    devices: Dict[str, int] = {}
+    columns = {
+        name: [] for name in ("start", "latency_ms", "failed", "endpoint", "device")
+    }
+    for path in paths:
+        for block in smxtrace.iter_blocks(path):
+            strings = block["strings"]
+            method = np.frombuffer(block["method"], dtype=np.uint32)
+            template = np.frombuffer(block["template"], dtype=np.uint32)
+            pairs, inverse = np.unique(
+                (method.astype(np.uint64) << 32) | template, return_inverse=True
+            )
+            codes = np.array(
+                [
+                    endpoints.setdefault(
+                        endpoint_label(
+                            strings[int(pair) >> 32], strings[int(pair) & 0xFFFFFFFF]
+                        ),
+                        len(endpoints),
+                    )
+                    for pair in pairs
+                ],
+                dtype=np.int64,
+            )
+            columns["endpoint"].append(codes[inverse.reshape(-1)])
+            device_ids, inverse = np.unique(
+                np.frombuffer(block["device"], dtype=np.uint32), return_inverse=True
+            )
+            codes = np.array(
+                [
+                    devices.setdefault(strings[device_id] or "-", len(devices))
+                    for device_id in device_ids
+                ],
+                dtype=np.int64,
+            )
+            columns["device"].append(codes[inverse.reshape(-1)])
+            columns["start"].append(np.frombuffer(block["start"], dtype=np.float64))
+            columns["latency_ms"].append(
+                np.frombuffer(block["latency_us"], dtype=np.uint32) / 1000.0
+            )
+            status = np.frombuffer(block["status"], dtype=np.uint16)
+            columns["failed"].append((status == 0) | (status >= 400))
+    if not columns["start"]:
+        raise AnalyzeError(f"No requests in {', '.join(paths)}")
+    trace = {name: np.concatenate(values) for name, values in columns.items()}
+    trace["endpoints"] = list(endpoints)
+    trace["devices"] = list(devices)
+    return trace
+
+
+def analyze_traces(
+    paths: List[str], window: float, step: float, by_device: bool = False
+) -> Run:
+    """Return the sliding window series of trace files"""
+    trace = load_traces(paths)
+    start = trace["start"] - trace["start"].min()
+    duration = float(start.max()) + 1e-6
+    if by_device:
+        ndevices = len(trace["devices"])
+        group = trace["endpoint"] * ndevices + trace["device"]
+        names = [
+            f"{endpoint} @ {device}"
+            for endpoint in trace["endpoints"]
+            for device in trace["devices"]
+        ]
+    else:
+        group = trace["endpoint"]
+        names = trace["endpoints"]
+
+    # one sort, then every group and window is a slice
+    order = np.lexsort((start, group))
+    group = group[order]
+    start = start[order]
+    latency = trace["latency_ms"][order]
+    failed = trace["failed"][order]
+
+    window_start = np.arange(0.0, max(duration - window, 0.0) + step, step)
+    width = np.minimum(window, duration - window_start)
+    run = Run(" ".join(paths), duration, {}, {})
+    codes = np.unique(group)
+    bounds = np.searchsorted(group, codes), np.searchsorted(group, codes, "right")
+    for code, low, high in zip(codes, *bounds):
+        starts = start[low:high]
+        latencies = latency[low:high]
+        failures = np.concatenate(([0], np.cumsum(failed[low:high])))
+        first = np.searchsorted(starts, window_start)
+        last = np.searchsorted(starts, window_start + window)
+        requests = last - first
+        series = {percentile: np.full(len(first), np.nan) for percentile in PERCENTILES}
+        for index in np.flatnonzero(requests):
+            values = np.percentile(latencies[first[index] : last[index]], PERCENTILES)
+            for percentile, value in zip(PERCENTILES, values):
+                series[percentile][index] = value
+        name = names[code]
+        run.groups[name] = Windows(
+            start=window_start,
+            requests=requests,
+            failures=failures[last] - failures[first],
+            rps=requests / width,
+            percentiles=series,
+            latency_ms=latencies,
+            stride=max(1, math.ceil(window / step - 1e-9)),
+        )
+        run.totals[name] = {
+            "requests": int(high - low),
+            "failures": int(failures[-1]),
+            "rps": round((high - low) / duration, 3),
+            **{
+                f"p{percentile:g}": _number(value)
+                for percentile, value in zip(
+                    PERCENTILES, np.percentile(latencies, PERCENTILES)
+                )
+            },
+        }
+    return run
+
+
+def history_path(path: str) -> str:
+    """Return the stats history CSV of a Locust --csv prefix or CSV file"""
+    if path.endswith(".csv"):
+        return path
+    return f"{path}_stats_history.csv"
+
+
+def _float(value: str) -> float:
+    """Return a Locust CSV number, NaN for N/A"""
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def analyze_history(path: str, by_device: bool = False) -> Run:
+    """Return the window series of a Locust stats history CSV.
+    Locust writes one row per endpoint and reporting interval with the
+    percentiles of its current window.  Without by_device the rows of the
+    devices of an endpoint are combined: rates are summed and percentiles
+    are averaged weighted by rate (an approximation, the latencies of the
+    window are not in the CSV).
+    """
+    require_numpy()
+    rows: Dict[str, Dict[float, list]] = {}
+    with open(history_path(path), newline="", encoding="utf8") as infile:
+        for row in csv.DictReader(infile):
+            if row["Name"] == "Aggregated":
+                continue
+            name = ROOT_PATTERN.sub("", row["Name"])
+            match = DEVICE_PATTERN.search(name)
+            endpoint = f"{row['Type']} {name}"
+            if match is not None and not by_device:
+                endpoint = f"{row['Type']} " + (
+                    name[: match.start(1)] + "{device_name}" + name[match.end(1) :]
+                )
+            rows.setdefault(endpoint, {}).setdefault(
+                float(row["Timestamp"]), []
+            ).append(row)
+    if not rows:
+        raise AnalyzeError(f"No endpoint rows in {history_path(path)}")
+
+    first = min(min(series) for series in rows.values())
+    last = max(max(series) for series in rows.values())
+    run = Run(history_path(path), last - first, {}, {})
+    for endpoint, series in rows.items():
+        timestamps = sorted(series)
+        rps = np.array(
+            [sum(_float(row["Requests/s"]) for row in series[t]) for t in timestamps]
+        )
+        fps = np.array(
+            [sum(_float(row["Failures/s"]) for row in series[t]) for t in timestamps]
+        )
+        percentiles = {}
+        for percentile, column in HISTORY_PERCENTILES.items():
+            values = []
+            for timestamp in timestamps:
+                weights = np.array(
+                    [_float(row["Requests/s"]) for row in series[timestamp]]
+                )
+                latencies = np.array([_float(row[column]) for row in series[timestamp]])
+                valid = ~np.isnan(latencies) & (weights > 0)
+                values.append(
+                    np.average(latencies[valid], weights=weights[valid])
+                    if valid.any()
+                    else math.nan
+                )
+            percentiles[percentile] = np.array(values)
+        intervals = np.diff(np.array(timestamps), append=timestamps[-1])
+        interval = float(np.median(intervals[:-1])) if len(intervals) > 1 else 0.0
+        run.groups[endpoint] = Windows(
+            start=np.array(timestamps) - first,
+            requests=np.round(rps * intervals).astype(np.int64),
+            failures=np.round(fps * intervals).astype(np.int64),
+            rps=rps,
+            percentiles=percentiles,
+            stride=(
+                max(1, math.ceil(HISTORY_RATE_WINDOW / interval - 1e-9))
+                if interval > 0
+                else 1
+            ),
+        )
+        requests = sum(
+            int(_float(row["Total Request Count"])) for row in series[timestamps[-1]]
+        )
+        run.totals[endpoint] = {
+            "requests": requests,
+            "failures": sum(
+                int(_float(row["Total Failure Count"]))
+                for row in series[timestamps[-1]]
+            ),
+            "rps": round(requests / run.duration, 3) if run.duration else None,
+            **{
+                f"p{percentile:g}": _number(np.nanmedian(percentiles[percentile]))
+                for percentile in HISTORY_PERCENTILES
+            },
+        }
+    return run
+
+
+def analyze(path: str, window: float, step: float, by_device: bool = False) -> Run:
+    """Return the analysis of a trace file or directory or a Locust CSV"""
+    if path.endswith(".csv") or os.path.exists(history_path(path)):
+        return analyze_history(path, by_device)
+    return analyze_traces(trace_paths(path), window, step, by_device)
+
+
+# ----- Statistical tests ----- #
+
+
+def mann_whitney(baseline, candidate) -> tuple:
+    """Return (z, two sided p-value) of the Mann-Whitney U test, normal
+    approximation with tie correction.  z > 0 when candidate values tend to
+    be larger.
+    """
+    n1, n2 = len(candidate), len(baseline)
+    if not n1 or not n2:
+        return math.nan, math.nan
+    data = np.concatenate((candidate, baseline))
+    values, inverse, counts = np.unique(data, return_inverse=True, return_counts=True)
+    ranks = (np.cumsum(counts) - (counts - 1) / 2.0)[inverse.reshape(-1)]
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    ties = float((counts.astype(np.float64) ** 3 - counts).sum())
+    variance = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 0.0, 1.0
+    z = (u - n1 * n2 / 2.0) / math.sqrt(variance)
+    return z, math.erfc(abs(z) / math.sqrt(2))
+
+
+def welch(baseline, candidate) -> tuple:
+    """Return (t, two sided p-value) of the Welch test of the means, normal
+    approximation of the t distribution.  t > 0 when candidate mean is larger.
+    """
+    baseline = baseline[~np.isnan(baseline)]
+    candidate = candidate[~np.isnan(candidate)]
+    if len(baseline) < 2 or len(candidate) < 2:
+        return math.nan, math.nan
+    error = math.sqrt(
+        candidate.var(ddof=1) / len(candidate) + baseline.var(ddof=1) / len(baseline)
+    )
+    if error == 0:
+        return 0.0, 1.0
+    t = (candidate.mean() - baseline.mean()) / error
+    return t, math.erfc(abs(t) / math.sqrt(2))
+
+
+def _change(baseline: float, candidate: float) -> Optional[float]:
+    """Return relative change of candidate against baseline"""
+    if not baseline or math.isnan(baseline) or math.isnan(candidate):
+        return None
+    return round(candidate / baseline - 1, 4)
+
+
+def compare(
+    baseline: Run,
+    candidate: Run,
+    alpha: float = 0.01,
+    min_change: float = 0.05,
+    max_samples: int = 200000,
+    seed: int = 0,
+) -> dict:
+    """Return the per endpoint comparison of two runs"""
+    rng = np.random.default_rng(seed)
+    endpoints = {}
+    for name in sorted(set(baseline.groups) & set(candidate.groups)):
+        base, cand = baseline.groups[name], candidate.groups[name]
+        if base.latency_ms is not None and cand.latency_ms is not None:
+            base_latency = _sample(base.latency_ms, max_samples, rng)
+            cand_latency = _sample(cand.latency_ms, max_samples, rng)
+        else:  # CSV history: window p95 series
+            base_latency = base.percentiles[95][~np.isnan(base.percentiles[95])]
+            cand_latency = cand.percentiles[95][~np.isnan(cand.percentiles[95])]
+        z, latency_p = mann_whitney(base_latency, cand_latency)
+        t, rps_p = welch(base.independent_rps(), cand.independent_rps())
+        changes = {
+            "p50": _change(
+                baseline.totals[name]["p50"] or math.nan,
+                candidate.totals[name]["p50"] or math.nan,
+            ),
+            "p95": _change(
+                baseline.totals[name]["p95"] or math.nan,
+                candidate.totals[name]["p95"] or math.nan,
+            ),
+            "rps": _change(float(np.nanmean(base.rps)), float(np.nanmean(cand.rps))),
+        }
+        significant_latency = latency_p < alpha
+        significant_rps = rps_p < alpha
+        slower = significant_latency and any(
+            (changes[key] or 0) > min_change for key in ("p50", "p95")
+        )
+        faster = significant_latency and any(
+            (changes[key] or 0) < -min_change for key in ("p50", "p95")
+        )
+        endpoints[name] = {
+            "baseline": baseline.totals[name],
+            "candidate": candidate.totals[name],
+            "change": changes,
+            "latency_z": _number(z),
+            "latency_p": _number(latency_p),
+            "rps_t": _number(t),
+            "rps_p": _number(rps_p),
+            "latency_regression": slower,
+            "latency_improvement": faster and not slower,
+            "throughput_regression": significant_rps
+            and (changes["rps"] or 0) < -min_change,
+        }
+    return {
+        "baseline": baseline.source,
+        "candidate": candidate.source,
+        "alpha": alpha,
+        "min_change": min_change,
+        "only_baseline": sorted(set(baseline.groups) - set(candidate.groups)),
+        "only_candidate": sorted(set(candidate.groups) - set(baseline.groups)),
+        "endpoints": endpoints,
+        "regressions": sorted(
+            name
+            for name, result in endpoints.items()
+            if result["latency_regression"] or result["throughput_regression"]
+        ),
+    }
+
+
+def _sample(values, max_samples: int, rng):
+    """Return at most max_samples values drawn without replacement"""
+    if len(values) <= max_samples:
+        return values
+    return rng.choice(values, max_samples, replace=False)
+
+
+# ----- Command line ----- #
+
+
+def print_totals(run: Run):
+    """Print the whole run totals per group"""
+    print(f"{run.source}: {run.duration:.1f} s")
+    print(
+        f"{'requests':>10} {'failures':>9} {'rps':>9} "
+        + " ".join(f"{'p' + format(p, 'g'):>9}" for p in PERCENTILES)
+        + "  endpoint"
+    )
+    for name, total in sorted(run.totals.items()):
+        latencies = " ".join(
+            f"{'-' if total[f'p{p:g}'] is None else total[f'p{p:g}']:>9}"
+            for p in PERCENTILES
+        )
+        print(
+            f"{total['requests']:>10} {total['failures']:>9} {total['rps']:>9} "
+            f"{latencies}  {name}"
+        )
+
+
+def print_comparison(result: dict):
+    """Print the per endpoint comparison of two runs"""
+    print(f"baseline  {result['baseline']}\ncandidate {result['candidate']}")
+    print(f"{'p50':>8} {'p95':>8} {'rps':>8} {'lat p':>9} {'rps p':>9}  verdict")
+    for name, endpoint in result["endpoints"].items():
+        verdicts = []
+        if endpoint["latency_regression"]:
+            verdicts.append("SLOWER")
+        if endpoint["latency_improvement"]:
+            verdicts.append("faster")
+        if endpoint["throughput_regression"]:
+            verdicts.append("LOWER THROUGHPUT")
+        changes = " ".join(
+            "       -" if value is None else f"{value:>+8.1%}"
+            for value in endpoint["change"].values()
+        )
+        p_values = " ".join(
+            f"{'-' if value is None else format(value, '.2g'):>9}"
+            for value in (endpoint["latency_p"], endpoint["rps_p"])
+        )
+        print(f"{changes} {p_values}  {', '.join(verdicts) or 'ok'}  {name}")
+
+
+def main(argv=None):
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--window", type=float, default=60.0, help="Window seconds")
+    options.add_argument("--step", type=float, default=10.0, help="Window step seconds")
+    options.add_argument(
+        "--by-device", action="store_true", help="Group by endpoint and device"
+    )
+    options.add_argument("--json", default=None, help="Write the report to json file")
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser(
+        "summary", parents=[options], help="Window series of a run"
+    )
+    summary.add_argument("run", help="Trace file or directory, Locust CSV (prefix)")
+    comparison = commands.add_parser(
+        "compare", parents=[options], help="Compare two runs"
+    )
+    comparison.add_argument("baseline")
+    comparison.add_argument("candidate")
+    comparison.add_argument("--alpha", type=float, default=0.01)
+    comparison.add_argument("--min-change", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "summary":
+            run = analyze(args.run, args.window, args.step, args.by_device)
+            print_totals(run)
+            report = {
+                "source": run.source,
+                "duration": run.duration,
+                "window": args.window,
+                "step": args.step,
+                "totals": run.totals,
+                "windows": {name: w.report() for name, w in run.groups.items()},
+            }
+        else:
+            report = compare(
+                analyze(args.baseline, args.window, args.step, args.by_device),
+                analyze(args.candidate, args.window, args.step, args.by_device),
+                args.alpha,
+                args.min_change,
+            )
+            print_comparison(report)
+    except (AnalyzeError, smxtrace.TraceError, OSError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 2
+
+    if args.json:
+        directory = os.path.dirname(args.json)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.json, "w", encoding="utf8") as outfile:
+            json.dump(report, outfile, indent=2)
+    if args.command == "compare" and report["regressions"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Open model arrival rate scheduler of SMx operations.
+
+wait_time_between and rest_delay_time_between make a closed model: every
+user waits for its response before its next task, so when SMx slows down
+the offered load drops and the latency is under reported (coordinated
+omission).  ArrivalScheduler issues operations at a target arrival rate
+instead, whatever the SMx response times:
+
+    * the intended start time of every operation is fixed in advance by the
+      schedule, fixed interval or Poisson (exponential intervals)
+    * every operation runs in its own greenlet, at most max_in_flight at a
+      time.  When the cap is reached the scheduler waits for a free slot and
+      then issues the late operations immediately, their intended start
+      times unchanged
+    * the operation latency is measured from its intended start time and
+      reported as Locust request type OPEN, so the percentiles include the
+      time an operation waited to be issued, as a provisioning system
+      submitting at that rate would see it.  The SMx requests of the
+      operation keep their own service time entries
+
+The target arrival_rate is shared by the Locust workers: register from the
+locustfile init event lets the master tell the workers their count, and
+set_rate changes the rate of a running test (see smxcapacity).  The
+scheduler runs in the task of a single user per worker, the operations are
+callables (typically closures over an SMxFastHTTPUser and its client):
+
+    @events.init.add_listener
+    def on_locust_init(environment, **kwargs):
+        register(environment)
+
+    scheduler = ArrivalScheduler(
+        global_test_data.arrival_rate,
+        [("ont_create", create_ont, 1), ("perf_status", get_status, 4)],
+        global_test_data.arrival_distribution,
+        global_test_data.max_in_flight,
+    )
+
+    @task
+    def open_model(self):
+        scheduler.run(self.environment)
+"""
+
+import random
+import time
+import weakref
+from itertools import accumulate
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import gevent
+from gevent.pool import Pool
+from locust.runners import MasterRunner, WorkerRunner
+
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.errors import ToolboxError
+
+LOGGER = getlogger(__name__)
+
+DISTRIBUTIONS = ("fixed", "poisson")
+
+# Master to worker message of the worker count and the arrival rate
+RATE_MESSAGE = "smx_arrival_rate"
+
+# Workers sharing the arrival rate, set by the master (RATE_MESSAGE)
+_cluster = {"workers": 1}
+_schedulers = weakref.WeakSet()
+
+
+class ArrivalError(ToolboxError):
+    """Arrival schedule error"""
+
+    pass
+
+
+def arrival_times(
+    rate: float,
+    distribution: str = "poisson",
+    start: float = 0.0,
+    offset: float = 0.0,
+    rng: Optional[random.Random] = None,
+) -> Iterator[float]:
+    """Yield the intended start times of operations arriving at rate per
+    second from start.  offset (0 to 1) shifts a fixed schedule by a fraction
+    of the interval so several workers interleave.
+    """
+    if rate <= 0:
+        raise ArrivalError(f"Arrival rate {rate} invalid.  Must be > 0.")
+    if distribution == "fixed":
+        interval = 1.0 / rate
+        arrival = start + offset * interval
+        count = 0
+        while True:
+            # multiply instead of accumulating to avoid drift
+            yield arrival + count * interval
+            count += 1
+    elif distribution == "poisson":
+        rng = rng or random.Random()  # nosec B311 - arrival times, not security
+        arrival = start
+        while True:
+            arrival += rng.expovariate(rate)
+            yield arrival
+    else:
+        raise ArrivalError(
+            f"Arrival distribution {distribution} invalid.  Must be one of "
+            f"{DISTRIBUTIONS}."
+        )
+
+
+class ArrivalScheduler:
+    """Issue weighted operations at a target arrival rate"""
+
+    def __init__(
+        self,
+        rate: float,
+        operations: Sequence[Tuple[str, Callable[[], object], float]],
+        distribution: str = "poisson",
+        max_in_flight: int = 100,
+        seed: Optional[int] = None,
+    ):
+        if not operations:
+            raise ArrivalError("Arrival scheduler needs at least one operation")
+        if max_in_flight < 1:
+            raise ArrivalError(
+                f"Arrival max_in_flight {max_in_flight} invalid.  Must be >= 1."
+            )
+        if distribution not in DISTRIBUTIONS:
+            raise ArrivalError(
+                f"Arrival distribution {distribution} invalid.  Must be one of "
+                f"{DISTRIBUTIONS}."
+            )
+        self.rate = rate
+        self.names: List[str] = [name for name, _, _ in operations]
+        self.operations: List[Callable[[], object]] = [op for _, op, _ in operations]
+        self.cum_weights = list(accumulate(weight for _, _, weight in operations))
+        self.distribution = distribution
+        self.max_in_flight = max_in_flight
+        self.rng = random.Random(seed)  # nosec B311 - operation mix, not security
+        self.pool: Optional[Pool] = None
+        self.running = False
+        self.issued = 0
+        self.late = 0  # operations issued after their intended start
+        self.max_lag = 0.0  # seconds
+        _schedulers.add(self)
+
+    def run(self, environment, duration: Optional[float] = None):
+        """Issue operations until stop, duration seconds or the greenlet is
+        killed (Locust stop).  The rate is split among the Locust workers and
+        followed when changed by set_rate, a rate of 0 pauses the arrivals.
+        """
+        index = max(getattr(environment.runner, "worker_index", 0), 0)
+        fire = environment.events.request.fire
+        self.pool = Pool(self.max_in_flight)
+        self.running = True
+        intended = start = time.perf_counter()
+        end = None if duration is None else start + duration
+        setting = schedule = None
+        issued = None  # intended start of the last issued operation
+        try:
+            while self.running:
+                if setting != (self.rate, _cluster["workers"]):
+                    setting = (self.rate, _cluster["workers"])
+                    schedule = self._schedule(setting, index, intended)
+                if schedule is None:
+                    gevent.sleep(0.1)
+                    intended = time.perf_counter()
+                    continue
+                intended = next(schedule)
+                if issued is not None and intended <= issued:
+                    continue  # issued before the rate changed
+                if end is not None and intended >= end:
+                    break
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    gevent.sleep(delay)
+                # blocks while max_in_flight operations are running
+                self.pool.spawn(self._issue, fire, intended)
+                issued = intended
+        finally:
+            self.running = False
+            self.pool.join()
+            LOGGER.info(
+                f"Open model: {self.issued} operations issued, {self.late} late, "
+                f"max lag {self.max_lag * 1000:.0f} ms"
+            )
+
+    def _schedule(self, setting, index: int, start: float) -> Optional[Iterator]:
+        """Return the arrival times of this worker from start (the first one
+        may be start itself), None when the rate is 0
+        """
+        rate, workers = setting
+        if rate <= 0:
+            return None
+        LOGGER.info(
+            f"Open model: {rate / workers:g} operations/s {self.distribution} "
+            f"arrivals per worker, at most {self.max_in_flight} in flight"
+        )
+        offset = (index % workers) / workers
+        return arrival_times(rate / workers, self.distribution, start, offset, self.rng)
+
+    def stop(self):
+        """Stop issuing operations, the operations in flight complete"""
+        self.running = False
+
+    def _issue(self, fire, intended: float):
+        """Run one operation and report its latency from intended"""
+        index = self.rng.choices(
+            range(len(self.operations)), cum_weights=self.cum_weights
+        )[0]
+        lag = time.perf_counter() - intended
+        if lag > 0.001:
+            self.late += 1
+            self.max_lag = max(self.max_lag, lag)
+        self.issued += 1
+        exception = None
+        try:
+            self.operations[index]()
+        except Exception as error:  # reported, the schedule goes on
+            exception = error
+        fire(
+            request_type="OPEN",
+            name=self.names[index],
+            response_time=(time.perf_counter() - intended) * 1000,
+            response_length=0,
+            exception=exception,
+            context={"lag": lag},
+        )
+
+
+def _apply(data: dict):
+    """Apply a RATE_MESSAGE to this process"""
+    _cluster["workers"] = max(data.get("workers", 1), 1)
+    if data.get("rate") is not None:
+        for scheduler in list(_schedulers):
+            scheduler.rate = data["rate"]
+
+
+def set_rate(environment, rate: float):
+    """Change the total arrival rate of the running schedulers, sent to
+    the workers by the master
+    """
+    runner = environment.runner
+    if isinstance(runner, MasterRunner):
+        runner.send_message(
+            RATE_MESSAGE, {"rate": rate, "workers": max(runner.worker_count, 1)}
+        )
+    _apply({"rate": rate, "workers": _cluster["workers"]})
+
+
+def register(environment):
+    """Share the worker count of the master with the workers at test
+    start.  Call from the locustfile init event.
+    """
+    runner = environment.runner
+    if isinstance(runner, WorkerRunner):
+        runner.register_message(RATE_MESSAGE, lambda msg, **kwargs: _apply(msg.data))
+    elif isinstance(runner, MasterRunner):
+
+        def on_test_start(environment, **kwargs):
+            runner.send_message(
+                RATE_MESSAGE, {"rate": None, "workers": max(runner.worker_count, 1)}
+            )
+
+        environment.events.test_start.add_listener(on_test_start)
@@ -0,0 +1,274 @@
+"""
+Automatic SMx capacity search.
+
+CapacitySearchShape is a Locust load shape searching the highest load level
+(user count, or open model arrival rate, see smxarrival) that SMx sustains
+within an SLO, one workload (Locust user class) after the other:
+
+    * every step runs a level for warm_up seconds (after the users are
+      spawned), then measures for duration seconds
+    * a step passes when the p95 and p99 response times and the error rate
+      of the measured window are within the SLO.  Only the request types of
+      slo_request_types are measured: the SMx HTTP methods when searching
+      users, the OPEN operations when searching an arrival rate
+    * step mode raises the level by step until a step fails, binary mode
+      doubles the level until a step fails and then bisects between the
+      last passing and the first failing level down to resolution
+    * between workloads the users are stopped for cool_down seconds
+
+Every step is appended to the JSON capacity report as it completes, the
+capacity of a workload is its highest passing level (null when min_level
+fails).  The locustfile selects the shape and its configuration:
+
+    class CapacityShape(CapacitySearchShape):
+        config = global_test_data.capacity_search
+"""
+
+import json
+import math
+import os
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from locust import LoadTestShape
+
+from locustfiles.lib import smxarrival
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.errors import ToolboxError
+from locustfiles.lib.locustmodeldata.globallocustparams import CapacitySearchModel
+
+LOGGER = getlogger(__name__)
+
+HTTP_METHODS = ("GET", "POST", "PUT", "DELETE", "PATCH")
+
+
+class CapacityError(ToolboxError):
+    """Capacity search error"""
+
+    pass
+
+
+class Window:
+    """Request counts and response time histogram of selected stats entries"""
+
+    def __init__(self, stats, request_types):
+        self.time = time.perf_counter()
+        self.requests = self.failures = 0
+        self.response_times = Counter()
+        for entry in stats.entries.values():
+            if entry.method in request_types:
+                self.requests += entry.num_requests
+                self.failures += entry.num_failures
+                self.response_times.update(entry.response_times)
+
+    def since(self, start: "Window") -> dict:
+        """Return the step measures of the window from start to self"""
+        requests = self.requests - start.requests
+        failures = self.failures - start.failures
+        response_times = self.response_times - start.response_times
+        elapsed = self.time - start.time
+        return {
+            "requests": requests,
+            "failures": failures,
+            "rps": requests / elapsed if elapsed > 0 else 0.0,
+            "error_rate": failures / requests if requests else None,
+            "p95_ms": percentile(response_times, 0.95),
+            "p99_ms": percentile(response_times, 0.99),
+        }
+
+
+def percentile(response_times: Counter, fraction: float) -> Optional[float]:
+    """Return the response time percentile of a Locust rounded histogram"""
+    total = sum(response_times.values())
+    if not total:
+        return None
+    rank = math.ceil(total * fraction)
+    count = 0
+    for response_time in sorted(response_times):
+        count += response_times[response_time]
+        if count >= rank:
+            return response_time
+    return None
+
+
+class CapacitySearch:
+    """Step or binary search of the highest passing level of one workload"""
+
+    def __init__(self, config: CapacitySearchModel):
+        self.config = config
+        self.level = config.min_level
+        if config.target == "users":
+            self.level = round(self.level)
+        self.passed: Optional[float] = None  # highest passing level
+        self.failed: Optional[float] = None  # lowest failing level
+        self.done = False
+
+    def record(self, passed: bool):
+        """Record the result of the current level and choose the next one"""
+        config = self.config
+        if passed:
+            self.passed = self.level
+        else:
+            self.failed = self.level
+        if self.failed == config.min_level or self.passed == config.max_level:
+            self.done = True
+        elif config.mode == "step":
+            self.level = min(self.level + config.step, config.max_level)
+            self.done = not passed
+        elif self.failed is None:
+            self.level = min(self.level * 2, config.max_level)
+        elif self.failed - self.passed <= config.resolution:
+            self.done = True
+        else:
+            self.level = self.passed + (self.failed - self.passed) / 2
+        if config.target == "users":
+            self.level = round(self.level)
+            if self.level in (self.passed, self.failed):
+                self.done = True
+
+
+class CapacitySearchShape(LoadTestShape):
+    """Locust load shape searching the capacity of every workload"""
+
+    abstract = True
+    config: CapacitySearchModel = None
+
+    def __init__(self):
+        super().__init__()
+        if self.config is None:
+            raise CapacityError(f"{type(self).__name__} has no capacity_search config")
+        self.workloads: List[Optional[str]] = list(self.config.workloads) or [None]
+        self.request_types = self.config.slo_request_types or (
+            HTTP_METHODS if self.config.target == "users" else ("OPEN",)
+        )
+        self.report = {
+            "mode": self.config.mode,
+            "target": self.config.target,
+            "slo": {
+                "p95_ms": self.config.slo_p95_ms,
+                "p99_ms": self.config.slo_p99_ms,
+                "error_rate": self.config.slo_error_rate,
+                "request_types": list(self.request_types),
+            },
+            "workloads": {},
+        }
+        self.workload = -1
+        self.search: Optional[CapacitySearch] = None
+        self.step_start = 0.0
+        self.measure_start: Optional[Window] = None
+        self.cool_down_end: Optional[float] = None
+
+    def tick(self) -> Optional[Tuple]:
+        now = self.get_run_time()
+        if self.cool_down_end is not None:
+            if now < self.cool_down_end:
+                return (0, self.config.spawn_rate)
+            self.cool_down_end = None
+        if self.search is None or self.search.done:
+            if not self.next_workload(now):
+                return None
+            return self.tick()
+        config = self.config
+        users = self.users()
+        warm_up_end = self.step_start + config.warm_up
+        if config.target == "users":
+            warm_up_end += users / config.spawn_rate
+        if self.measure_start is None and now >= warm_up_end:
+            self.measure_start = Window(self.runner.stats, self.request_types)
+        elif self.measure_start is not None and now >= warm_up_end + config.duration:
+            self.end_step(now)
+            return self.tick()
+        return (users, config.spawn_rate, self.user_classes())
+
+    def users(self) -> int:
+        """Return the user count of the current step"""
+        if self.config.target == "users":
+            return int(self.search.level)
+        return self.config.users or max(getattr(self.runner, "worker_count", 1), 1)
+
+    def user_classes(self) -> Optional[list]:
+        """Return the user class of the current workload, None for all"""
+        name = self.workloads[self.workload]
+        if name is None:
+            return None
+        try:
+            return [self.runner.user_classes_by_name[name]]
+        except KeyError:
+            raise CapacityError(
+                f"Capacity search workload {name} is not a Locust user class"
+            ) from None
+
+    def next_workload(self, now: float) -> bool:
+        """Start the search of the next workload, False when all done"""
+        if self.search is not None:
+            self.cool_down_end = now + self.config.cool_down
+        self.workload += 1
+        if self.workload >= len(self.workloads):
+            self.write_report()
+            return False
+        name = self.workloads[self.workload] or "all"
+        self.report["workloads"][name] = {"capacity": None, "steps": []}
+        self.search = CapacitySearch(self.config)
+        self.start_step(now)
+        if self.cool_down_end is not None:
+            self.step_start = self.cool_down_end
+        return True
+
+    def start_step(self, now: float):
+        """Start measuring the current search level"""
+        self.step_start = now
+        self.measure_start = None
+        if self.config.target == "rate":
+            smxarrival.set_rate(self.runner.environment, self.search.level)
+        LOGGER.info(
+            f"Capacity search {self.workloads[self.workload] or 'all'}: "
+            f"{self.config.target} {self.search.level:g}"
+        )
+
+    def end_step(self, now: float):
+        """Evaluate the measured window against the SLO, record the step"""
+        config = self.config
+        step = {"level": self.search.level}
+        step.update(
+            Window(self.runner.stats, self.request_types).since(self.measure_start)
+        )
+        failed = []
+        if not step["requests"]:
+            failed.append("no requests")
+        else:
+            if config.slo_p95_ms is not None and step["p95_ms"] > config.slo_p95_ms:
+                failed.append(f"p95 {step['p95_ms']} ms > {config.slo_p95_ms} ms")
+            if config.slo_p99_ms is not None and step["p99_ms"] > config.slo_p99_ms:
+                failed.append(f"p99 {step['p99_ms']} ms > {config.slo_p99_ms} ms")
+            if step["error_rate"] > config.slo_error_rate:
+                failed.append(
+                    f"error rate {step['error_rate']:.4f} > {config.slo_error_rate}"
+                )
+        step["passed"] = not failed
+        step["failed"] = failed
+        name = self.workloads[self.workload] or "all"
+        workload = self.report["workloads"][name]
+        workload["steps"].append(step)
+        LOGGER.info(
+            f"Capacity search {name}: {config.target} {self.search.level:g} "
+            f"{'passed' if not failed else 'failed: ' + ', '.join(failed)}"
+        )
+        self.search.record(not failed)
+        workload["capacity"] = self.search.passed
+        self.write_report()
+        if not self.search.done:
+            self.start_step(now)
+        else:
+            LOGGER.info(
+                f"Capacity search {name}: capacity {self.search.passed} "
+                f"{config.target}"
+            )
+
+    def write_report(self):
+        """Write the capacity report JSON file"""
+        directory = os.path.dirname(self.config.report)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.config.report, "w", encoding="utf8") as outfile:
+            json.dump(self.report, outfile, indent=2)
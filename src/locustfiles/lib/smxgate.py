@@ -0,0 +1,158 @@
+"""
+Per device concurrency gate of the SMx requests.
+
+NETCONF on an E9 handles one request at a time, so Locust users piling onto
+the same device_name queue inside SMx and the measured response times are
+mostly load generator caused queueing.  DeviceGate lets at most limit
+requests per device in flight and queues the others on the load generator,
+so the request response time is the SMx service time and the queue wait is
+reported separately (harness metrics type QUEUE, see SMxFastHTTPUser and
+smxmetrics).
+
+    * per worker: a gevent semaphore per device shared by all users of the
+      worker process, waiting users are released in FIFO order
+    * across workers: with a lock_directory every device also has limit slot
+      lock files (fcntl.flock) shared by all workers on the same host.  A
+      request holds its device semaphore and one slot file lock.  Slot locks
+      are polled without blocking so the gevent hub keeps running.
+
+Example:
+    gate = register(limit=1, lock_directory="/tmp/smxgate")
+    with gate.hold("olt1") as wait:
+        ...  # request, wait is the queue time in seconds
+"""
+
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import gevent
+from gevent.lock import Semaphore
+
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.errors import ToolboxError
+
+LOGGER = getlogger(__name__)
+
+
+class GateError(ToolboxError):
+    """Device gate error"""
+
+    pass
+
+
+class DeviceGate:
+    """Limit the requests in flight per device"""
+
+    def __init__(
+        self,
+        limit: int,
+        lock_directory: Optional[str] = None,
+        poll_interval: float = 0.01,
+        max_poll_interval: float = 0.1,
+    ):
+        if limit < 1:
+            raise GateError(f"Device gate limit {limit} invalid.  Must be >= 1.")
+        self.limit = limit
+        self.lock_directory = lock_directory
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.semaphores: Dict[str, Semaphore] = {}
+        # device: (slot lock file descriptors, indexes not held in this process)
+        self.slots: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.fcntl = None
+        if lock_directory is not None:
+            try:
+                import fcntl
+            except ImportError:
+                raise GateError(
+                    "Device gate lock_directory needs fcntl (not available on "
+                    "this platform)"
+                ) from None
+            self.fcntl = fcntl
+            os.makedirs(lock_directory, exist_ok=True)
+
+    @contextmanager
+    def hold(self, device_name: str) -> Iterator[float]:
+        """Wait for a free request slot of device_name and hold it.
+        Yield the queue wait in seconds.
+        """
+        start = time.perf_counter()
+        semaphore = self.semaphores.get(device_name)
+        if semaphore is None:
+            semaphore = self.semaphores[device_name] = Semaphore(self.limit)
+        semaphore.acquire()
+        try:
+            slot = None
+            if self.fcntl is not None:
+                slot = self._lock_slot(device_name)
+            try:
+                yield time.perf_counter() - start
+            finally:
+                if slot is not None:
+                    self._unlock_slot(device_name, slot)
+        finally:
+            semaphore.release()
+
+    def in_flight(self, device_name: str) -> int:
+        """Return the requests in flight on device_name in this process"""
+        semaphore = self.semaphores.get(device_name)
+        return 0 if semaphore is None else self.limit - semaphore.counter
+
+    def _device_slots(self, device_name: str) -> Tuple[List[int], List[int]]:
+        """Return the slot lock files of a device, opened on first use"""
+        slots = self.slots.get(device_name)
+        if slots is None:
+            name = re.sub(r"[^A-Za-z0-9_.-]", "_", device_name)
+            files = [
+                os.open(
+                    os.path.join(self.lock_directory, f"{name}.{index}.lock"),
+                    os.O_RDWR | os.O_CREAT,
+                    0o666,
+                )
+                for index in range(self.limit)
+            ]
+            slots = self.slots[device_name] = (files, list(range(self.limit)))
+        return slots
+
+    def _lock_slot(self, device_name: str) -> int:
+        """Lock a slot file of device_name not held by another worker.
+        The device semaphore guarantees a slot not held in this process.
+        """
+        files, free = self._device_slots(device_name)
+        fcntl = self.fcntl
+        interval = self.poll_interval
+        while True:
+            for slot in free:
+                try:
+                    fcntl.flock(files[slot], fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                free.remove(slot)
+                return slot
+            gevent.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def _unlock_slot(self, device_name: str, slot: int):
+        files, free = self.slots[device_name]
+        self.fcntl.flock(files[slot], self.fcntl.LOCK_UN)
+        free.append(slot)
+
+
+_gates: Dict[Tuple[int, Optional[str]], DeviceGate] = {}
+
+
+def register(limit: int, lock_directory: Optional[str] = None) -> Optional[DeviceGate]:
+    """Return the device gate of this process shared by all users.
+    None when limit is 0 (no gate).
+    """
+    if not limit:
+        return None
+    gate = _gates.get((limit, lock_directory))
+    if gate is None:
+        gate = _gates[(limit, lock_directory)] = DeviceGate(limit, lock_directory)
+        scope = "worker" if lock_directory is None else f"host ({lock_directory})"
+        LOGGER.info(f"Requests limited to {limit} per device per {scope}")
+    return gate
@@ -0,0 +1,217 @@
+"""
+Unique test data lease pool shared by the users of a worker.
+
+User types mapping one record (ont_id, VLAN ID) to one user fail when more
+users are spawned than records, and an ephemeral user cannot hand its ONT
+to the next user after teardown.  LeasePool hands out the validated records
+(ont_config, vlan_ids, after sharding, see smxshard) to the users:
+
+    pool = LeasePool(test_data.onts.ont_config, key="device_name")
+
+    with pool.lease() as ont:
+        ...  # create, use and clean up the ONT
+
+    ont = pool.checkout()  # or explicitly
+    pool.release(ont)      # back to the pool after cleanup
+    pool.retire(ont)       # broken record, never handed out again
+
+    * O(1) checkout and release: records wait in FIFO deques, so a returned
+      record is reused last (least recently used) and every record gets the
+      same share of the churn
+    * with a key (field name or callable, e.g. device_name) the available
+      records are queued per key and checkout takes the next key round
+      robin, so the users are spread over the devices
+    * when no record is available checkout waits (FIFO, a returned record is
+      handed to the longest waiting user) up to timeout seconds
+    * no locks: gevent greenlets only switch on I/O and the pool never
+      yields while updating, a greenlet only yields while waiting
+    * occupancy metrics (see metrics), the checkout wait is recorded as type
+      LEASE of the harness metrics (see smxmetrics, not counted in the
+      Locust request statistics) when an environment is given
+"""
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, Optional, Union
+
+from gevent.event import AsyncResult
+from gevent.timeout import Timeout
+
+from locustfiles.lib import smxmetrics
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.errors import ToolboxError
+
+LOGGER = getlogger(__name__)
+
+
+class LeaseError(ToolboxError):
+    """Lease pool error"""
+
+    pass
+
+
+class LeasePool:
+    """O(1) FIFO lease pool of unique records, optionally balanced per key"""
+
+    def __init__(
+        self,
+        records: Iterable[Any],
+        key: Union[str, Callable[[Any], Hashable], None] = None,
+        name: str = "records",
+        environment=None,
+    ):
+        if key is None:
+            self.key = lambda record: None
+        elif isinstance(key, str):
+            self.key = lambda record: getattr(record, key)
+        else:
+            self.key = key
+        self.name = name
+        self.environment = environment
+        self.available: Dict[Hashable, Deque[Any]] = {}
+        self.ring: Deque[Hashable] = deque()  # keys with available records
+        self.waiters: Deque[AsyncResult] = deque()
+        self.leased: Dict[int, Any] = {}  # id(record): record
+        self.size = 0
+        self.retired = 0
+        self.checkouts = 0
+        self.waits = 0  # checkouts that had to wait
+        self.wait_time = 0.0  # seconds
+        self.timeouts = 0
+        self.max_in_use = 0
+        for record in records:
+            self._put(record)
+            self.size += 1
+
+    def _put(self, record):
+        """Queue an available record"""
+        key = self.key(record)
+        queue = self.available.get(key)
+        if queue is None:
+            queue = self.available[key] = deque()
+        if not queue:
+            self.ring.append(key)
+        queue.append(record)
+
+    def _take(self):
+        """Dequeue the next available record, round robin over the keys"""
+        key = self.ring.popleft()
+        queue = self.available[key]
+        record = queue.popleft()
+        if queue:
+            self.ring.append(key)
+        return record
+
+    def _lease(self, record):
+        self.leased[id(record)] = record
+        self.checkouts += 1
+        self.max_in_use = max(self.max_in_use, len(self.leased))
+        return record
+
+    def checkout(self, timeout: Optional[float] = None, block: bool = True):
+        """Lease the next available record.  Wait up to timeout seconds
+        (forever when None) for a record when none is available.  None when
+        not block and no record is available.
+        """
+        if self.ring and not self.waiters:
+            self._report(0.0, None)
+            return self._lease(self._take())
+        if not block:
+            return None
+        if not self.size - self.retired:
+            raise LeaseError(f"Lease pool {self.name} has no records")
+        waiter = AsyncResult()
+        self.waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            record = waiter.get(timeout=timeout)
+        except Timeout:
+            self._abandon(waiter)
+            self.timeouts += 1
+            error = LeaseError(
+                f"Lease pool {self.name}: no record available after {timeout} s"
+            )
+            self._report(time.perf_counter() - start, error)
+            raise error from None
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        wait = time.perf_counter() - start
+        self.waits += 1
+        self.wait_time += wait
+        self._report(wait, None)
+        return record
+
+    def _abandon(self, waiter: AsyncResult):
+        """Remove a waiter that stopped waiting, requeue a record handed
+        to it meanwhile.  A waiter woken with an exception holds no record.
+        """
+        if waiter.ready():
+            if not waiter.successful():
+                return
+            record = waiter.value
+            del self.leased[id(record)]
+            self.checkouts -= 1
+            self._give(record)
+        else:
+            self.waiters.remove(waiter)
+
+    def _give(self, record):
+        """Hand a record to the longest waiting user or queue it"""
+        if self.waiters:
+            self.waiters.popleft().set(self._lease(record))
+        else:
+            self._put(record)
+
+    def release(self, record):
+        """Return a leased record to the pool (after cleanup)"""
+        if self.leased.pop(id(record), None) is None:
+            raise LeaseError(f"Lease pool {self.name}: record not leased {record}")
+        self._give(record)
+
+    def retire(self, record):
+        """Remove a leased record from the pool for good"""
+        if self.leased.pop(id(record), None) is None:
+            raise LeaseError(f"Lease pool {self.name}: record not leased {record}")
+        self.retired += 1
+        LOGGER.warning(f"Lease pool {self.name}: retired {record}")
+        if self.waiters and self.size == self.retired:
+            error = LeaseError(f"Lease pool {self.name} has no records")
+            while self.waiters:
+                self.waiters.popleft().set_exception(error)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        """Lease a record for the with block, released when the block ends"""
+        record = self.checkout(timeout)
+        try:
+            yield record
+        finally:
+            self.release(record)
+
+    def metrics(self) -> dict:
+        """Return the occupancy metrics of the pool"""
+        in_use = len(self.leased)
+        size = self.size - self.retired
+        return {
+            "size": size,
+            "in_use": in_use,
+            "available": size - in_use,
+            "occupancy": in_use / size if size else 0.0,
+            "max_in_use": self.max_in_use,
+            "waiting": len(self.waiters),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "avg_wait_ms": self.wait_time / self.waits * 1000 if self.waits else 0.0,
+            "timeouts": self.timeouts,
+            "retired": self.retired,
+        }
+
+    def _report(self, wait: float, exception):
+        """Record a checkout wait in the harness metrics (LEASE)"""
+        if self.environment is None:
+            return
+        smxmetrics.register(self.environment).record(
+            "LEASE", self.name, wait, exception
+        )
@@ -0,0 +1,175 @@
+"""
+Harness timings kept out of the Locust request statistics.
+
+The connection phases of a request (DNS, CONNECT, TLS, TTFB, DOWNLOAD, see
+smxtiming), the device gate wait (QUEUE, see smxgate) and the lease pool
+checkout wait (LEASE, see smxlease) are parts of a request or load generator
+waits, not requests.  Fired as Locust request events each request would add
+up to six entries to the Aggregated request count, RPS and average response
+time.  HarnessMetrics records them in a separate Locust RequestStats instead
+(type column DNS, QUEUE, LEASE, ...), so the Locust statistics only count the
+SMx requests:
+
+    * workers send their entries to the master with every stats report
+    * the master (or the local runner) logs the table and percentiles when
+      it quits, and writes <csv prefix>_smx_metrics.csv with --csv
+    * the statistics are cleared at test start like the Locust statistics
+
+The master side is set up by register from the locustfile init event, the
+users of a worker or local run register on first use:
+
+    @events.init.add_listener
+    def on_locust_init(environment, **kwargs):
+        smxmetrics.register(environment)
+
+    smxmetrics.register(environment).record("QUEUE", name, wait)
+"""
+
+import csv
+import weakref
+from typing import Any, Dict, List
+
+from locustfiles.lib.base_logger import getlogger
+
+LOGGER = getlogger(__name__)
+
+# Worker report key of the harness timings
+REPORT_KEY = "smx_metrics"
+
+CSV_COLUMNS = (
+    "Type",
+    "Name",
+    "Count",
+    "Failure Count",
+    "Average (ms)",
+    "Min (ms)",
+    "Max (ms)",
+    "50%",
+    "90%",
+    "99%",
+)
+
+
+class HarnessMetrics:
+    """Request statistics of the harness timings of a Locust environment"""
+
+    def __init__(self):
+        # imported here, locust monkey patches the process with gevent
+        from locust.stats import RequestStats
+
+        self.stats = RequestStats(use_response_times_cache=False)
+
+    def record(self, kind: str, name: str, seconds: float, exception=None):
+        """Add a timing in seconds, kind is the type column (e.g. QUEUE)"""
+        self.stats.log_request(kind, name, seconds * 1000, 0)
+        if exception is not None:
+            self.stats.log_error(kind, name, exception)
+
+    def report(self) -> Dict[str, Any]:
+        """Return the entries logged since the last report and reset them
+        (worker side)
+        """
+        report = {
+            "stats": self.stats.serialize_stats(),
+            "total": self.stats.total.get_stripped_report(),
+            "errors": self.stats.serialize_errors(),
+        }
+        self.stats.errors = {}
+        return report
+
+    def merge(self, report: Dict[str, Any]):
+        """Add the entries of a worker report (master side)"""
+        from locust.stats import StatsEntry, StatsError
+
+        stats = self.stats
+        for data in report["stats"]:
+            entry = StatsEntry.unserialize(data)
+            key = (entry.name, entry.method)
+            if key not in stats.entries:
+                stats.entries[key] = StatsEntry(stats, entry.name, entry.method)
+            stats.entries[key].extend(entry)
+        for key, error in report["errors"].items():
+            if key in stats.errors:
+                stats.errors[key].occurrences += error["occurrences"]
+            else:
+                stats.errors[key] = StatsError.unserialize(error)
+        stats.total.extend(StatsEntry.unserialize(report["total"]))
+
+    def summary(self) -> List[str]:
+        """Return the statistics and percentiles table lines"""
+        from locust.stats import get_percentile_stats_summary, get_stats_summary
+
+        return get_stats_summary(self.stats, False) + get_percentile_stats_summary(
+            self.stats
+        )
+
+    def write_csv(self, path: str):
+        """Write the statistics of every entry to a CSV file"""
+        with open(path, "w", encoding="utf8", newline="") as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(CSV_COLUMNS)
+            for (name, kind), entry in sorted(self.stats.entries.items()):
+                writer.writerow(
+                    (
+                        kind,
+                        name,
+                        entry.num_requests,
+                        entry.num_failures,
+                        round(entry.avg_response_time, 3),
+                        round(entry.min_response_time or 0, 3),
+                        round(entry.max_response_time, 3),
+                        entry.get_response_time_percentile(0.5),
+                        entry.get_response_time_percentile(0.9),
+                        entry.get_response_time_percentile(0.99),
+                    )
+                )
+
+
+_metrics = weakref.WeakKeyDictionary()
+
+
+def register(environment) -> HarnessMetrics:
+    """Return the harness metrics of a Locust environment, set up on first
+    call
+    """
+    metrics = _metrics.get(environment)
+    if metrics is not None:
+        return metrics
+    from locust.runners import MasterRunner, WorkerRunner
+
+    metrics = _metrics[environment] = HarnessMetrics()
+    runner = environment.runner
+    events = environment.events
+
+    def on_test_start(**kwargs):
+        metrics.stats.clear_all()
+
+    events.test_start.add_listener(on_test_start)
+    if isinstance(runner, WorkerRunner):
+
+        def on_report_to_master(client_id, data):
+            data[REPORT_KEY] = metrics.report()
+
+        events.report_to_master.add_listener(on_report_to_master)
+        return metrics
+    if isinstance(runner, MasterRunner):
+
+        def on_worker_report(client_id, data):
+            if REPORT_KEY in data:
+                metrics.merge(data[REPORT_KEY])
+
+        events.worker_report.add_listener(on_worker_report)
+
+    def on_quitting(environment, **kwargs):
+        if not metrics.stats.total.num_requests:
+            return
+        LOGGER.info("Harness timings (not counted in the request statistics):")
+        for line in metrics.summary():
+            LOGGER.info(line)
+        options = environment.parsed_options
+        prefix = getattr(options, "csv_prefix", None)
+        if prefix:
+            metrics.write_csv(f"{prefix}_smx_metrics.csv")
+
+    events.quitting.add_listener(on_quitting)
+    return metrics
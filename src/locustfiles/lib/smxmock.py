@@ -0,0 +1,790 @@
+"""
+Local SMx REST API mock for benchmarking the load generator itself.
+
+An asyncio HTTP/1.1 keep-alive server implementing the routes used by
+smxuserapi and smxrestapi with an in-memory store: ONTs, ONT ports, VLANs,
+subscribers, services, EMS profiles, profile sync, service templates,
+device state, ONT performance status and the paginated gui/ont listing.
+It needs no network access and no SMx, so client side changes can be
+benchmarked on one box.
+
+Timing model:
+
+    * device operations (anything under /config/device/<device>,
+      /performance/device/<device>, services and profile sync) are
+      serialized per device like the single NETCONF session SMx keeps with
+      an OLT, each holding the device queue for latency (+ jitter) seconds
+    * database reads (gui/ont, list reads, EMS profiles) take db_latency
+      seconds and are not serialized
+    * error_rate of the requests are answered with error_status
+    * payload_size bytes of padding are added to every returned record
+
+With certfile and keyfile the mock serves HTTPS (self_signed_certificate
+makes a throwaway pair with the openssl command), so the TLS handshake and
+record costs of the client can be benchmarked too.
+
+Example:
+    python -m locustfiles.lib.smxmock --port 8080 --latency 0.05 --devices olt1,olt2 --onts-per-device 2000
+
+    mock = start_mock_server(MockSettings(latency=0.01))
+    smx = SMxRequests(mock.base_url, "admin", "admin", headers)
+    ...
+    mock.stop()
+
+    certfile, keyfile = self_signed_certificate(directory)
+    mock = start_mock_server(MockSettings(certfile=certfile, keyfile=keyfile))
+    smx = SMxRequests(mock.base_url, "admin", "admin", headers)  # https://
+    ...
+    mock.stop()
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import ssl
+import subprocess  # nosec B404 - runs the openssl command only
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.smxroutes import PROFILES
+
+LOGGER = getlogger(__name__)
+
+DEFAULT_API_ROOT = "/rest/v1"
+MAX_HEADER_SIZE = 64 * 1024
+
+# Device profile path of a profile sync path, the sync path itself when SMx
+# has no device endpoint for the profile
+SYNC_DEVICE_KINDS = {
+    sync_path: device_path or sync_path
+    for _, sync_path, device_path in PROFILES.values()
+    if sync_path is not None
+}
+
+
+@dataclass
+class MockSettings:
+    """Behavior of the mock server"""
+
+    latency: float = 0.0  # seconds a device operation holds the device queue
+    jitter: float = 0.0  # uniform random seconds added to latency
+    db_latency: float = 0.0  # seconds of a database only request
+    error_rate: float = 0.0  # fraction of requests answered with error_status
+    error_status: int = 500
+    payload_size: int = 0  # padding bytes added to each returned record
+    device_queue: bool = True  # serialize device operations per device
+    devices: Tuple[str, ...] = ()  # devices preloaded at start
+    onts_per_device: int = 0  # ONTs preloaded per device
+    api_root: str = DEFAULT_API_ROOT
+    seed: Optional[int] = None
+    certfile: Optional[str] = None  # PEM certificate, serve HTTPS when set
+    keyfile: Optional[str] = None  # PEM private key of certfile
+
+
+@dataclass
+class MockStats:
+    """Counters of the mock server"""
+
+    requests: int = 0
+    injected_errors: int = 0
+    device_operations: int = 0
+    max_queue_wait: float = 0.0
+    by_route: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class Request:
+    """Parsed HTTP request"""
+
+    method: str
+    path: str
+    query: Dict[str, str]
+    body: object
+
+
+class MockStore:
+    """In-memory SMx state"""
+
+    def __init__(self):
+        self.devices: Dict[str, dict] = {}
+        self.onts: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        self.vlans: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        self.subscribers: Dict[tuple, dict] = {}
+        self.services: Dict[tuple, dict] = {}
+        self.profiles: Dict[tuple, dict] = {}
+        self.device_profiles: Dict[tuple, dict] = {}
+        self.service_templates: Dict[str, dict] = {}
+
+    def device(self, device_name: str) -> dict:
+        """Return device record, any device name is known to the mock"""
+        if device_name not in self.devices:
+            self.devices[device_name] = {
+                "device-name": device_name,
+                "state": "connected",
+                "model": "E9-2",
+            }
+        return self.devices[device_name]
+
+    def preload(self, devices, onts_per_device: int):
+        """Create onts_per_device ONTs on every device"""
+        for device_name in devices:
+            self.device(device_name)
+            for index in range(onts_per_device):
+                ont_id = str(index + 1)
+                self.onts[device_name][ont_id] = {
+                    "ont-id": ont_id,
+                    "serial-number": f"CXNK{index:08X}",
+                    "vendor-id": "CXNK",
+                    "profile-id": "GP1100X",
+                    "subscriber-id": f"{device_name}-{ont_id}",
+                    "admin-state": "enabled",
+                }
+
+
+def _profile_name(configuration: dict) -> str:
+    """Return name of a profile configuration"""
+    for name_field in ("name", "pool-name", "profile-name"):
+        if name_field in configuration:
+            return str(configuration[name_field])
+    return json.dumps(configuration, sort_keys=True)
+
+
+def _service_key(record: dict) -> tuple:
+    """Return identity of a service"""
+    return (
+        str(record.get("device-name")),
+        str(record.get("ont-id")),
+        str(record.get("ont-port-id")),
+        str(record.get("service-name")),
+    )
+
+
+def _fields(query: dict) -> List[str]:
+    """Return requested fields of a read"""
+    return [name for name in query.get("fields", "").split(",") if name]
+
+
+def _page(records: List[dict], query: dict) -> List[dict]:
+    """Return the offset/limit page of records"""
+    offset = int(query.get("offset", 0))
+    limit = int(query.get("limit", len(records)))
+    return records[offset : offset + limit]
+
+
+class SMxMock:
+    """Route table and handlers of the mock"""
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.store = MockStore()
+        self.store.preload(settings.devices, settings.onts_per_device)
+        self.stats = MockStats()
+        self.random = random.Random(settings.seed)  # nosec B311 - simulated jitter
+        self.device_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.padding = "x" * settings.payload_size
+        # (method, path pattern, handler, device operation)
+        self.routes = [
+            ("GET", r"/config/device", self.get_devices, False),
+            ("GET", r"/config/device/(?P<device>[^/]+)", self.get_device, True),
+            ("GET", r"/config/device/(?P<device>[^/]+)/gui/ont", self.gui_onts, False),
+            ("GET", r"/config/device/(?P<device>[^/]+)/ont", self.get_ont, False),
+            ("POST", r"/config/device/(?P<device>[^/]+)/ont", self.create_ont, True),
+            ("PUT", r"/config/device/(?P<device>[^/]+)/ont", self.update_ont, True),
+            ("DELETE", r"/config/device/(?P<device>[^/]+)/ont", self.delete_ont, True),
+            ("GET", r"/config/device/(?P<device>[^/]+)/ontport", self.ontport, False),
+            ("POST", r"/config/device/(?P<device>[^/]+)/vlan", self.save_vlan, True),
+            ("PUT", r"/config/device/(?P<device>[^/]+)/vlan", self.save_vlan, True),
+            (
+                "GET",
+                r"/config/device/(?P<device>[^/]+)/vlan/(?P<vlan>[^/]+)",
+                self.get_vlan,
+                True,
+            ),
+            (
+                "DELETE",
+                r"/config/device/(?P<device>[^/]+)/vlan/(?P<vlan>[^/]+)",
+                self.delete_vlan,
+                True,
+            ),
+            (
+                "DELETE",
+                r"/config/device/(?P<device>[^/]+)/(?P<kind>[^/]+)/(?P<name>[^/]+)",
+                self.delete_device_profile,
+                True,
+            ),
+            (
+                "GET",
+                r"/performance/device/(?P<device>[^/]+)/ont/(?P<ont>[^/]+)/status",
+                self.ont_status,
+                True,
+            ),
+            ("GET", r"/ems/subscriber", self.get_subscribers, False),
+            ("POST", r"/ems/subscriber", self.create_subscriber, False),
+            ("PUT", r"/ems/subscriber", self.update_subscriber, False),
+            (
+                "DELETE",
+                r"/ems/subscriber/org/(?P<org>[^/]+)/account/(?P<account>[^/]+)",
+                self.delete_subscriber,
+                False,
+            ),
+            ("GET", r"/ems/service", self.get_services, False),
+            ("POST", r"/ems/service", self.create_service, True),
+            ("PUT", r"/ems/service", self.update_service, True),
+            ("DELETE", r"/ems/service", self.delete_service, True),
+            (
+                "PUT",
+                r"/ems/service/device/(?P<device>[^/]+)/ont/(?P<ont>[^/]+)"
+                r"/port/(?P<port>[^/]+)/vlan/(?P<vlan>[^/]+)",
+                self.service_activation,
+                True,
+            ),
+            ("POST", r"/ems/profile/(?P<kind>[^/]+)", self.create_profile, False),
+            (
+                "DELETE",
+                r"/ems/profile/(?P<kind>[^/]+)/(?P<name>[^/]+)",
+                self.delete_profile,
+                False,
+            ),
+            (
+                "POST",
+                r"/config/profile/sync/(?P<kind>[^/]+)/(?P<name>[^/]+)",
+                self.sync_profile,
+                True,
+            ),
+            ("POST", r"/config/service-template", self.create_template, False),
+            (
+                "GET",
+                r"/config/service-template/(?P<name>[^/]+)",
+                self.get_template,
+                False,
+            ),
+            (
+                "DELETE",
+                r"/config/service-template/(?P<name>[^/]+)",
+                self.delete_template,
+                False,
+            ),
+        ]
+        self.routes = [
+            (method, re.compile(pattern + r"/?"), handler, device_operation)
+            for method, pattern, handler, device_operation in self.routes
+        ]
+
+    # ----- Dispatch ----- #
+
+    def match(self, request: Request):
+        """Return (handler, match, device operation) of a request"""
+        path_found = False
+        for method, pattern, handler, device_operation in self.routes:
+            match = pattern.fullmatch(request.path)
+            if match is None:
+                continue
+            path_found = True
+            if method == request.method:
+                return handler, match, device_operation
+        status = HTTPStatus.METHOD_NOT_ALLOWED if path_found else HTTPStatus.NOT_FOUND
+        return status, None, False
+
+    def device_names(self, request: Request, match) -> List[str]:
+        """Return devices a device operation is executed on"""
+        if "device" in match.groupdict():
+            return [unquote(match["device"])]
+        body = request.body if isinstance(request.body, dict) else {}
+        if "device-names" in body:
+            return sorted(set(body["device-names"]))
+        device_name = body.get("device-name") or request.query.get("device-name")
+        return [device_name] if device_name else []
+
+    async def device_wait(self, device_name: str):
+        """Hold the device queue for one operation"""
+        latency = self.settings.latency
+        if self.settings.jitter:
+            latency += self.random.uniform(0, self.settings.jitter)
+        if not self.settings.device_queue:
+            if latency:
+                await asyncio.sleep(latency)
+            return
+        queued = time.perf_counter()
+        async with self.device_locks[device_name]:
+            wait = time.perf_counter() - queued
+            self.stats.max_queue_wait = max(self.stats.max_queue_wait, wait)
+            if latency:
+                await asyncio.sleep(latency)
+
+    async def dispatch(self, request: Request) -> Tuple[int, object]:
+        """Return (status, body) of a request"""
+        self.stats.requests += 1
+        if request.path == "/mock/stats":
+            return HTTPStatus.OK, asdict(self.stats)
+        handler, match, device_operation = self.match(request)
+        if match is None:
+            return handler, {
+                "message": f"No mock route {request.method} {request.path}"
+            }
+        route = f"{request.method} {match.re.pattern}"
+        self.stats.by_route[route] = self.stats.by_route.get(route, 0) + 1
+        if self.settings.error_rate and self.random.random() < self.settings.error_rate:
+            self.stats.injected_errors += 1
+            return self.settings.error_status, {"message": "Mock injected error"}
+        if device_operation:
+            self.stats.device_operations += 1
+            for device_name in self.device_names(request, match):
+                await self.device_wait(device_name)
+        elif self.settings.db_latency:
+            await asyncio.sleep(self.settings.db_latency)
+        kwargs = {name: unquote(value) for name, value in match.groupdict().items()}
+        try:
+            return handler(request, **kwargs)
+        except Exception as error:
+            LOGGER.error(f"Mock {request.method} {request.path} failed: {error!r}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"message": str(error)}
+
+    def records(self, records: List[dict], query: dict) -> List[dict]:
+        """Return records projected on the requested fields with padding"""
+        fields = _fields(query)
+        if fields:
+            records = [
+                {name: record.get(name) for name in fields} for record in records
+            ]
+        if self.padding:
+            records = [{**record, "mock-padding": self.padding} for record in records]
+        return records
+
+    def record(self, record: dict, query: dict) -> dict:
+        """Return a single record projected on the requested fields"""
+        return self.records([record], query)[0]
+
+    # ----- Devices ----- #
+
+    def get_devices(self, request: Request):
+        records = _page(list(self.store.devices.values()), request.query)
+        return HTTPStatus.OK, self.records(records, request.query)
+
+    def get_device(self, request: Request, device: str):
+        return HTTPStatus.OK, self.record(self.store.device(device), request.query)
+
+    def delete_device_profile(
+        self, request: Request, device: str, kind: str, name: str
+    ):
+        if self.store.device_profiles.pop((device, kind, name), None) is None:
+            return HTTPStatus.NOT_FOUND, {"message": f"{kind} {name} not on {device}"}
+        return HTTPStatus.OK, {}
+
+    # ----- ONTs ----- #
+
+    def gui_onts(self, request: Request, device: str):
+        records = _page(list(self.store.onts[device].values()), request.query)
+        return HTTPStatus.OK, self.records(records, request.query)
+
+    def get_ont(self, request: Request, device: str):
+        ont = self.store.onts[device].get(request.query.get("ont-id"))
+        if ont is None:
+            return HTTPStatus.NOT_FOUND, {"message": "ONT not found"}
+        return HTTPStatus.OK, self.record(ont, request.query)
+
+    def create_ont(self, request: Request, device: str):
+        ont_id = str(request.body.get("ont-id"))
+        if ont_id in self.store.onts[device]:
+            return HTTPStatus.CONFLICT, {"message": f"ONT {ont_id} already exists"}
+        self.store.onts[device][ont_id] = request.body
+        return HTTPStatus.OK, request.body
+
+    def update_ont(self, request: Request, device: str):
+        ont_id = str(request.body.get("ont-id"))
+        if ont_id not in self.store.onts[device]:
+            return HTTPStatus.NOT_FOUND, {"message": f"ONT {ont_id} not found"}
+        self.store.onts[device][ont_id] = request.body
+        return HTTPStatus.OK, request.body
+
+    def delete_ont(self, request: Request, device: str):
+        ont_id = request.query.get("ont-id")
+        if self.store.onts[device].pop(ont_id, None) is None:
+            return HTTPStatus.NOT_FOUND, {"message": f"ONT {ont_id} not found"}
+        return HTTPStatus.OK, {}
+
+    def ontport(self, request: Request, device: str):
+        ont_id = request.query.get("ont-id")
+        if ont_id not in self.store.onts[device]:
+            return HTTPStatus.NOT_FOUND, {"message": f"ONT {ont_id} not found"}
+        ports = [
+            {"ont-id": ont_id, "ont-port-id": port, "admin-state": "enabled"}
+            for port in ("g1", "x1", "p1", "p2")
+        ]
+        return HTTPStatus.OK, self.records(ports, request.query)
+
+    def ont_status(self, request: Request, device: str, ont: str):
+        if ont not in self.store.onts[device]:
+            return HTTPStatus.NOT_FOUND, {"message": f"ONT {ont} not found"}
+        status = {
+            "ont-id": ont,
+            "oper-state": "present",
+            "opt-signal-level": round(self.random.uniform(-25.0, -15.0), 2),
+            "uptime": int(time.monotonic()),
+        }
+        return HTTPStatus.OK, self.record(status, request.query)
+
+    # ----- VLANs ----- #
+
+    def save_vlan(self, request: Request, device: str):
+        vlan_id = str(request.body.get("vlan-id"))
+        vlans = self.store.vlans[device]
+        if request.method == "POST" and vlan_id in vlans:
+            return HTTPStatus.CONFLICT, {"message": f"VLAN {vlan_id} already exists"}
+        if request.method == "PUT" and vlan_id not in vlans:
+            return HTTPStatus.NOT_FOUND, {"message": f"VLAN {vlan_id} not found"}
+        vlans[vlan_id] = request.body
+        return HTTPStatus.OK, request.body
+
+    def get_vlan(self, request: Request, device: str, vlan: str):
+        if vlan not in self.store.vlans[device]:
+            return HTTPStatus.NOT_FOUND, {"message": f"VLAN {vlan} not found"}
+        return HTTPStatus.OK, self.record(self.store.vlans[device][vlan], request.query)
+
+    def delete_vlan(self, request: Request, device: str, vlan: str):
+        if self.store.vlans[device].pop(vlan, None) is None:
+            return HTTPStatus.NOT_FOUND, {"message": f"VLAN {vlan} not found"}
+        return HTTPStatus.OK, {}
+
+    # ----- Subscribers ----- #
+
+    def get_subscribers(self, request: Request):
+        org_id = request.query.get("org-id")
+        records = [
+            record
+            for (org, _), record in self.store.subscribers.items()
+            if org_id is None or org == org_id
+        ]
+        return HTTPStatus.OK, self.records(_page(records, request.query), request.query)
+
+    def create_subscriber(self, request: Request):
+        key = (str(request.body.get("org-id")), str(request.body.get("account-name")))
+        if key in self.store.subscribers:
+            return HTTPStatus.CONFLICT, {"message": f"Subscriber {key} already exists"}
+        self.store.subscribers[key] = request.body
+        return HTTPStatus.OK, request.body
+
+    def update_subscriber(self, request: Request):
+        key = (str(request.body.get("org-id")), str(request.body.get("account-name")))
+        if key not in self.store.subscribers:
+            return HTTPStatus.NOT_FOUND, {"message": f"Subscriber {key} not found"}
+        self.store.subscribers[key] = request.body
+        return HTTPStatus.OK, request.body
+
+    def delete_subscriber(self, request: Request, org: str, account: str):
+        if self.store.subscribers.pop((org, account), None) is None:
+            return HTTPStatus.NOT_FOUND, {"message": f"Subscriber {account} not found"}
+        return HTTPStatus.OK, {}
+
+    # ----- Services ----- #
+
+    def get_services(self, request: Request):
+        query = request.query
+        records = [
+            record
+            for (device, ont, _, _), record in self.store.services.items()
+            if query.get("device-name", device) == device
+            and query.get("ont-id", ont) == ont
+        ]
+        return HTTPStatus.OK, self.records(_page(records, query), query)
+
+    def create_service(self, request: Request):
+        key = _service_key(request.body)
+        if key in self.store.services:
+            return HTTPStatus.CONFLICT, {"message": f"Service {key} already exists"}
+        self.store.services[key] = request.body
+        return HTTPStatus.OK, request.body
+
+    def update_service(self, request: Request):
+        key = _service_key(request.body)
+        if key not in self.store.services:
+            return HTTPStatus.NOT_FOUND, {"message": f"Service {key} not found"}
+        self.store.services[key] = request.body
+        return HTTPStatus.OK, request.body
+
+    def delete_service(self, request: Request):
+        key = _service_key(request.query)
+        if self.store.services.pop(key, None) is None:
+            return HTTPStatus.NOT_FOUND, {"message": f"Service {key} not found"}
+        return HTTPStatus.OK, {}
+
+    def service_activation(
+        self, request: Request, device: str, ont: str, port: str, vlan: str
+    ):
+        services = [
+            record
+            for (service_device, service_ont, service_port, _), record in (
+                self.store.services.items()
+            )
+            if (service_device, service_ont, service_port) == (device, ont, port)
+        ]
+        if not services:
+            return HTTPStatus.NOT_FOUND, {"message": f"No service on {ont}/{port}"}
+        for record in services:
+            record["admin-state"] = request.query.get("action", "activate")
+        return HTTPStatus.OK, {}
+
+    # ----- Profiles and templates ----- #
+
+    def create_profile(self, request: Request, kind: str):
+        key = (kind, _profile_name(request.body))
+        if key in self.store.profiles:
+            return HTTPStatus.CONFLICT, {"message": f"Profile {key} already exists"}
+        self.store.profiles[key] = request.body
+        return HTTPStatus.OK, request.body
+
+    def delete_profile(self, request: Request, kind: str, name: str):
+        if self.store.profiles.pop((kind, name), None) is None:
+            return HTTPStatus.NOT_FOUND, {"message": f"Profile {kind} {name} not found"}
+        return HTTPStatus.OK, {}
+
+    def sync_profile(self, request: Request, kind: str, name: str):
+        device_kind = SYNC_DEVICE_KINDS.get(kind, kind)
+        for device_name in request.body.get("device-names", []):
+            self.store.device_profiles[(device_name, device_kind, name)] = {
+                "name": name
+            }
+        return HTTPStatus.OK, {}
+
+    def create_template(self, request: Request):
+        name = _profile_name(request.body)
+        if name in self.store.service_templates:
+            return HTTPStatus.CONFLICT, {"message": f"Template {name} already exists"}
+        self.store.service_templates[name] = request.body
+        return HTTPStatus.OK, request.body
+
+    def get_template(self, request: Request, name: str):
+        if name not in self.store.service_templates:
+            return HTTPStatus.NOT_FOUND, {"message": f"Template {name} not found"}
+        return HTTPStatus.OK, self.record(
+            self.store.service_templates[name], request.query
+        )
+
+    def delete_template(self, request: Request, name: str):
+        if self.store.service_templates.pop(name, None) is None:
+            return HTTPStatus.NOT_FOUND, {"message": f"Template {name} not found"}
+        return HTTPStatus.OK, {}
+
+    # ----- HTTP ----- #
+
+    def parse(self, head: bytes, body: bytes) -> Request:
+        """Return a Request from the request line and body"""
+        method, target, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+        url = urlsplit(target)
+        path = url.path
+        root = self.settings.api_root
+        if root and path.startswith(root):
+            path = path[len(root) :] or "/"
+        decoded = None
+        if body:
+            try:
+                decoded = json.loads(body)
+            except ValueError:
+                decoded = None
+        if decoded is None:
+            decoded = {}
+        return Request(method, path, dict(parse_qsl(url.query)), decoded)
+
+    async def handle_connection(self, reader, writer):
+        """Serve keep-alive requests of one connection"""
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self.dispatch(self.parse(head, body))
+                content = json.dumps(payload).encode()
+                close = headers.get("connection", "").lower() == "close"
+                writer.write(
+                    f"HTTP/1.1 {int(status)} {HTTPStatus(status).phrase}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: {'close' if close else 'keep-alive'}\r\n"
+                    "\r\n".encode("latin-1") + content
+                )
+                await writer.drain()
+                if close:
+                    break
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            ConnectionError,
+            ssl.SSLError,
+            asyncio.CancelledError,  # server stopped
+        ):
+            pass
+        finally:
+            writer.close()
+
+    def ssl_context(self) -> Optional[ssl.SSLContext]:
+        """Return the server TLS context, None without certfile"""
+        if not self.settings.certfile:
+            return None
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(self.settings.certfile, self.settings.keyfile)
+        return context
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 0):
+        """Return the started asyncio server"""
+        return await asyncio.start_server(
+            self.handle_connection,
+            host,
+            port,
+            limit=MAX_HEADER_SIZE,
+            ssl=self.ssl_context(),
+        )
+
+
+class MockServerThread:
+    """Mock server running its own event loop in a daemon thread"""
+
+    def __init__(self, settings: MockSettings, host: str = "127.0.0.1", port: int = 0):
+        self.mock = SMxMock(settings)
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(self.mock.serve(host, port))
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait()
+        host, port = self.server.sockets[0].getsockname()[:2]
+        self.base_url = f"{scheme(settings)}://{host}:{port}{settings.api_root}"
+
+    def stop(self):
+        """Stop the server, close open connections and the event loop"""
+
+        async def shutdown():
+            self.server.close()
+            tasks = [
+                task
+                for task in asyncio.all_tasks()
+                if task is not asyncio.current_task()
+            ]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+
+
+def scheme(settings: MockSettings) -> str:
+    """Return the URL scheme served with settings"""
+    return "https" if settings.certfile else "http"
+
+
+def self_signed_certificate(directory: str, host: str = "127.0.0.1") -> tuple:
+    """Write a self-signed certificate and key of host (IP address) in
+    directory with the openssl command and return (certfile, keyfile)
+    """
+    certfile = os.path.join(directory, "smxmock.crt")
+    keyfile = os.path.join(directory, "smxmock.key")
+    subprocess.run(  # nosec B603 B607 - fixed argv, no shell
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            f"/CN={host}",
+            "-addext",
+            f"subjectAltName=IP:{host}",
+            "-keyout",
+            keyfile,
+            "-out",
+            certfile,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def start_mock_server(
+    settings: MockSettings = None, host: str = "127.0.0.1", port: int = 0
+) -> MockServerThread:
+    """Start the mock in a background thread, port 0 picks a free port"""
+    return MockServerThread(settings or MockSettings(), host, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--payload-size", type=int, default=0)
+    parser.add_argument(
+        "--no-device-queue",
+        action="store_true",
+        help="Do not serialize device operations per device",
+    )
+    parser.add_argument("--devices", default="", help="Comma separated device names")
+    parser.add_argument("--onts-per-device", type=int, default=0)
+    parser.add_argument("--api-root", default=DEFAULT_API_ROOT)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--certfile", default=None, help="Serve HTTPS, PEM file")
+    parser.add_argument("--keyfile", default=None, help="PEM key of --certfile")
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        db_latency=args.db_latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        payload_size=args.payload_size,
+        device_queue=not args.no_device_queue,
+        devices=tuple(name for name in args.devices.split(",") if name),
+        onts_per_device=args.onts_per_device,
+        api_root=args.api_root,
+        seed=args.seed,
+        certfile=args.certfile,
+        keyfile=args.keyfile,
+    )
+
+    async def run():
+        server = await SMxMock(settings).serve(args.host, args.port)
+        LOGGER.info(
+            f"SMx mock listening on "
+            f"{scheme(settings)}://{args.host}:{args.port}{args.api_root}"
+        )
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+SMx request body builders for the validated locustmodeldata test data.
+
+Shared by the Locust users (smxuserapi) and the untracked setup/teardown
+client (smxrestapi) so both send the same configuration for an ONT,
+subscriber or service.  Fields that are None in the test data are left out
+of the body and SMx applies its own defaults.
+
+PayloadCache keeps the encoded bytes body of the recently used ONT and
+service records so the Locust write path encodes a record once per use
+burst instead of on every request.  It is an LRU cache of at most maxsize
+bodies (DEFAULT_MAX_BODIES), so its memory does not grow with the ONT
+count of the test data.  Encoding uses the stdlib json module unless the
+faster orjson backend is selected.
+
+Example:
+    payloads = payload_cache("orjson")
+    smx.create_config_device_ont(client, device_name, ont.vendor_id, payloads.ont(ont))
+"""
+
+import json
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+from locustfiles.lib.errors import ToolboxError
+
+try:
+    import orjson
+except ImportError:  # optional faster encoder
+    orjson = None
+
+JSON_ENCODERS = ("json", "orjson")
+
+# Bodies kept per payload cache, least recently used dropped first
+DEFAULT_MAX_BODIES = 10000
+
+
+class PayloadError(ToolboxError):
+    """Request body encoding error"""
+
+    pass
+
+
+def json_dumps(data) -> bytes:
+    """Encode data as JSON bytes with the stdlib json module"""
+    return json.dumps(data).encode("utf8")
+
+
+def get_json_encoder(name: str = "json") -> Callable[[object], bytes]:
+    """Return the JSON bytes encoder of a backend name (json or orjson)"""
+    if name == "json":
+        return json_dumps
+    if name == "orjson":
+        if orjson is None:
+            raise PayloadError("JSON encoder orjson selected but not installed")
+        return orjson.dumps
+    raise PayloadError(f"Unknown JSON encoder {name}, expected one of {JSON_ENCODERS}")
+
+
+def get_ont_serial_number(vendor_id, serial_number):
+    """Return ONT serial number"""
+    if vendor_id.upper() == "CXNK" and len(serial_number) < 12:
+        serial_number = (
+            vendor_id
+            + ("0" * (12 - len(vendor_id) - len(serial_number)))
+            + serial_number
+        )
+    return serial_number
+
+
+def _without_none(configuration: dict) -> dict:
+    """Return configuration without None values"""
+    return {key: value for key, value in configuration.items() if value is not None}
+
+
+def ont_configuration(ont) -> dict:
+    """Return ONT create body for an ONT config model"""
+    serial_number = ont.serial_number
+    if ont.vendor_id is not None:
+        serial_number = get_ont_serial_number(ont.vendor_id, serial_number)
+    return _without_none(
+        {
+            "ont-id": ont.ont_id,
+            "serial-number": serial_number,
+            "vendor-id": ont.vendor_id,
+            "profile-id": ont.profile_id,
+            "subscriber-id": getattr(ont, "subscriber_id", None),
+        }
+    )
+
+
+def subscriber_configuration(subscriber_id: str, org_id: str) -> dict:
+    """Return basic subscriber create body.
+    Only the account name and customer ID are required.
+    """
+    return {
+        "org-id": org_id,
+        "account-name": subscriber_id,
+        "customer-id": subscriber_id,
+    }
+
+
+def service_configuration(device_name: str, ont_id: str, service) -> dict:
+    """Return subscriber service create body for a data or voice service model"""
+    return _without_none(
+        {
+            "device-name": device_name,
+            "ont-id": ont_id,
+            "ont-port-id": service.ont_port_id,
+            "service-name": service.service_name,
+            "vlan": service.vlan,
+            "c-vlan": getattr(service, "c_vlan", None),
+            "sip-user": getattr(service, "user", None),
+            "sip-password": getattr(service, "password", None),
+            "sip-uri": getattr(service, "uri", None),
+        }
+    )
+
+
+class PayloadCache:
+    """Encoded request bodies keyed by the record fields they encode, the
+    maxsize most recently used kept.  The cache is shared by all the users
+    and test data sections of a worker: records with the same ONT ID but
+    another profile, vendor or service get their own body.
+    """
+
+    def __init__(self, encoder: str = "json", maxsize: int = DEFAULT_MAX_BODIES):
+        self.encode = get_json_encoder(encoder)
+        self.maxsize = maxsize
+        self._bodies: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def clear(self):
+        """Drop all cached bodies"""
+        self._bodies.clear()
+
+    def body(self, key: Hashable, build: Callable[[], dict]) -> bytes:
+        """Return cached body of key, encoding build() when not cached"""
+        bodies = self._bodies
+        body = bodies.get(key)
+        if body is not None:
+            bodies.move_to_end(key)
+            return body
+        body = bodies[key] = self.encode(build())
+        if len(bodies) > self.maxsize:
+            bodies.popitem(last=False)
+        return body
+
+    def ont(self, ont) -> bytes:
+        """Return ONT create body of an ONT config model"""
+        key = (
+            "ont",
+            ont.ont_id,
+            ont.serial_number,
+            ont.vendor_id,
+            ont.profile_id,
+            getattr(ont, "subscriber_id", None),
+        )
+        return self.body(key, lambda: ont_configuration(ont))
+
+    def service(self, device_name: str, ont_id: str, service) -> bytes:
+        """Return subscriber service create body of a service model"""
+        key = (
+            "service",
+            device_name,
+            ont_id,
+            service.ont_port_id,
+            service.service_name,
+            service.vlan,
+            getattr(service, "c_vlan", None),
+            getattr(service, "user", None),
+            getattr(service, "password", None),
+            getattr(service, "uri", None),
+        )
+        return self.body(
+            key, lambda: service_configuration(device_name, ont_id, service)
+        )
+
+
+_payload_caches: Dict[str, PayloadCache] = {}
+
+
+def payload_cache(encoder: str = "json") -> PayloadCache:
+    """Return the payload cache of an encoder shared by all users of a worker"""
+    if encoder not in _payload_caches:
+        _payload_caches[encoder] = PayloadCache(encoder)
+    return _payload_caches[encoder]
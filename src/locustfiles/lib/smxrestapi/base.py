@@ -1,21 +1,90 @@
 """
 Module containing requests to SMx API that should not be tracked by Locust.
 Basic requests response is returned.
+
+All requests share a single keep-alive session so that setup and teardown of
+large data sets do not pay a TCP and TLS handshake per request.  The session
+can be closed explicitly or by using the class as a context manager:
+
+    with SMxRequests(base_url, username, password, headers) as smx:
+        smx.create_config_device_ont(device_name, configuration)
 """
+
 import requests
+from requests.adapters import HTTPAdapter
 import json
+from typing import Union
+
+from locustfiles.lib.smxpayloads import get_json_encoder, payload_cache
+from locustfiles.lib.smxroutes import RouteRegistry
+from locustfiles.lib.smxtiming import TimedHTTPAdapter
 
 # Suppress SSL certificate verification errors
 requests.packages.urllib3.disable_warnings()
 
+DEFAULT_POOL_SIZE = 10
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class SmxRequest:
-    def __init__(self, base_url, username, password, headers, verify=False, timeout=60):
+    def __init__(
+        self,
+        base_url,
+        username,
+        password,
+        headers,
+        verify=False,
+        timeout=60,
+        pool_size=DEFAULT_POOL_SIZE,
+        connection_phases=False,
+        json_encoder="json",
+    ):
         self.base_url = base_url
         self.auth = (username, password)
         self.headers = headers
         self.verify = verify
         self.timeout = timeout
+        self.pool_size = pool_size
+        self.connection_phases = connection_phases
+        self.encode = get_json_encoder(json_encoder)
+        self.payloads = payload_cache(json_encoder)
+        self.routes = RouteRegistry(base_url)
+        self.session = self.new_session()
+
+    def new_session(self) -> requests.Session:
+        """Return a keep-alive session with a connection pool of pool_size.
+        Connections (and their TLS sessions) are re-used between requests.
+        pool_block keeps the pool bounded when more threads than pool_size
+        share the session instead of opening throw-away connections.
+        With connection_phases responses of call have a phases attribute
+        with the DNS, connect, TLS, TTFB and download times (see smxtiming).
+        verify is passed with every request as well: requests replaces the
+        session verify with REQUESTS_CA_BUNDLE or CURL_CA_BUNDLE when set.
+        """
+        session = requests.Session()
+        session.auth = self.auth
+        session.verify = self.verify
+        if self.headers:
+            session.headers.update(self.headers)
+        adapter_class = TimedHTTPAdapter if self.connection_phases else HTTPAdapter
+        adapter = adapter_class(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        """Close the session and all pooled connections"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def get_url(self, route: str) -> str:
         """Return api url"""
@@ -24,10 +93,8 @@ class SmxRequest:
     def delete(self, route: str):
         """Delete request"""
         url = self.get_url(route)
-        response = requests.delete(
+        response = self.session.delete(
             url=url,
-            auth=self.auth,
-            headers=self.headers,
             verify=self.verify,
             timeout=self.timeout,
         )
@@ -36,10 +103,8 @@ class SmxRequest:
     def get(self, route: str, params: dict = {}):
         """Get request"""
         url = self.get_url(route)
-        response = requests.get(
+        response = self.session.get(
             url=url,
-            auth=self.auth,
-            headers=self.headers,
             params=params,
             verify=self.verify,
             timeout=self.timeout,
@@ -53,10 +118,8 @@ class SmxRequest:
         url = self.get_url(route)
         # Following is in place to diagnose issue with SMx API
         # swagger_body=json.dumps(params)
-        response = requests.post(
+        response = self.session.post(
             url=url,
-            auth=self.auth,
-            headers=self.headers,
             data=json.dumps(params),
             verify=self.verify,
             timeout=self.timeout,
@@ -66,12 +129,45 @@ class SmxRequest:
     def put(self, route: str, params: dict = {}):
         """HTTP PUT function to mainly used to update."""
         url = self.get_url(route)
-        response = requests.put(
+        response = self.session.put(
             url=url,
-            auth=self.auth,
-            headers=self.headers,
             data=json.dumps(params),
             verify=self.verify,
             timeout=self.timeout,
         )
         return response
+
+    def call(
+        self,
+        operation: str,
+        params: dict = None,
+        data: Union[dict, bytes, str] = None,
+        stream: bool = False,
+        **values,
+    ):
+        """Request of a registered route (see smxroutes).
+        values are the route template fields, params the query string of
+        reads and data the JSON body of creates and updates, encoded with
+        json_encoder.  bytes and str bodies (e.g. payloads bodies of
+        smxpayloads) are sent as is.
+        """
+        method, url, _ = self.routes.resolve(operation, values)
+        kwargs = {}
+        if params is not None:
+            kwargs["params"] = params
+        if data is not None:
+            if not isinstance(data, (bytes, str)):
+                data = self.encode(data)
+            kwargs["data"] = data
+        if stream:
+            kwargs["stream"] = stream
+        response = self.session.request(
+            method,
+            url,
+            timeout=self.timeout,
+            verify=self.verify,
+            **kwargs,
+        )
+        if self.connection_phases and not stream:
+            response.phases.finish()
+        return response
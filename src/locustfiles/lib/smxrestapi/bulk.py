@@ -0,0 +1,225 @@
+"""
+Asyncio bulk execution of SMxRequests calls.
+
+Runs a batch of create/delete/update calls concurrently while honoring a
+global concurrency limit and a separate per-device limit.  NETCONF on an E9
+handles one request at a time so the per-device limit defaults to 1; work
+spread over many OLTs scales with the number of devices.
+
+The underlying SMxRequests client is synchronous (requests), each call is
+run in a worker thread sharing the client's pooled session.  Keep the client
+pool_size >= max_concurrency so threads do not wait on the connection pool.
+When a ProvisioningJournal is given every call and its outcome is journaled.
+
+Example:
+    items = [
+        bulk_item("create_config_device_ont", ont["device"], ont["configuration"])
+        for ont in onts
+    ]
+    with SMxRequests(base_url, username, password, headers, pool_size=40) as smx:
+        results = SMxBulkRequests(smx, max_concurrency=40).execute(items)
+    print(summarize(results))
+"""
+
+import asyncio
+import inspect
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from locustfiles.lib.smxrestapi.smxapi import SMxRequests
+
+
+@dataclass
+class BulkItem:
+    """Single SMxRequests call to execute as part of a batch"""
+
+    operation: str
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    device_name: Optional[str] = None
+    key: Optional[str] = None
+    ignore_status: tuple = ()
+    undo: Optional["BulkItem"] = None
+
+
+@dataclass
+class BulkResult:
+    """Outcome and timing of a single BulkItem.
+    Times are in seconds, started is relative to the start of the batch.
+    """
+
+    item: BulkItem
+    ok: bool
+    status_code: Optional[int] = None
+    started: float = 0.0
+    queued: float = 0.0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+
+def get_item_device_name(operation: str, args: tuple, kwargs: dict) -> Optional[str]:
+    """Return the device an SMxRequests call targets or None.
+    Uses the device_name argument when the method has one otherwise the
+    device-name field of a service configuration.
+    """
+    method = getattr(SMxRequests, operation, None)
+    if method is None:
+        raise ValueError(f"SMxRequests has no operation {operation}")
+    bound = inspect.signature(method).bind_partial(None, *args, **kwargs)
+    arguments = bound.arguments
+    if "device_name" in arguments:
+        return arguments["device_name"]
+    configuration = arguments.get("configuration")
+    if isinstance(configuration, dict):
+        return configuration.get("device-name")
+    return None
+
+
+def bulk_item(
+    operation: str, *args, key: str = None, ignore_status: tuple = (), **kwargs
+) -> BulkItem:
+    """Return a BulkItem with the target device resolved from the arguments.
+    Responses with a status in ignore_status are counted as successful.
+    """
+    return BulkItem(
+        operation=operation,
+        args=args,
+        kwargs=kwargs,
+        device_name=get_item_device_name(operation, args, kwargs),
+        key=key,
+        ignore_status=ignore_status,
+    )
+
+
+class SMxBulkRequests:
+    """Execute batches of SMxRequests calls concurrently"""
+
+    def __init__(
+        self,
+        smx: SMxRequests,
+        max_concurrency: int = None,
+        max_per_device: int = 1,
+        journal=None,
+    ):
+        self.smx = smx
+        self.max_concurrency = max_concurrency or smx.pool_size
+        self.max_per_device = max_per_device
+        self.journal = journal
+        self._executor = None
+
+    def execute(self, items: Iterable[BulkItem]) -> List[BulkResult]:
+        """Run the batch to completion returning results in item order"""
+        return asyncio.run(self.run(items))
+
+    async def run(self, items: Iterable[BulkItem]) -> List[BulkResult]:
+        """Run the batch returning results in item order"""
+        async with self.open():
+            return await asyncio.gather(*(self.submit(item) for item in items))
+
+    @asynccontextmanager
+    async def open(self):
+        """Open the worker threads and concurrency limits used by submit.
+        Items submitted while open share the same global and device limits.
+        """
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self._device_limits = {}
+        self._batch_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            self._executor = executor
+            try:
+                yield self
+            finally:
+                self._executor = None
+
+    async def submit(self, item: BulkItem) -> BulkResult:
+        """Run a single item once a device slot and global slot are free.
+        The device slot is taken first so items queued behind a busy device
+        do not hold global slots idle.
+        """
+        if self._executor is None:
+            raise RuntimeError("SMxBulkRequests.submit called outside of open()")
+        device_limit = None
+        if item.device_name is not None and self.max_per_device:
+            device_limit = self._device_limits.get(item.device_name)
+            if device_limit is None:
+                device_limit = asyncio.Semaphore(self.max_per_device)
+                self._device_limits[item.device_name] = device_limit
+        loop = asyncio.get_running_loop()
+        queued_start = time.perf_counter()
+        if device_limit is not None:
+            await device_limit.acquire()
+        try:
+            async with self._global_limit:
+                started = time.perf_counter()
+                result = await loop.run_in_executor(
+                    self._executor, self._call, item, started - self._batch_start
+                )
+                result.queued = started - queued_start
+        finally:
+            if device_limit is not None:
+                device_limit.release()
+        if self.journal is not None and self.journal.record(result):
+            # write and fsync in a worker thread, off the event loop
+            await loop.run_in_executor(self._executor, self.journal.flush)
+        return result
+
+    def _call(self, item: BulkItem, started: float) -> BulkResult:
+        """Blocking SMxRequests call executed in a worker thread"""
+        start = time.perf_counter()
+        try:
+            response = getattr(self.smx, item.operation)(*item.args, **item.kwargs)
+        except Exception as error:  # pylint: disable=broad-except
+            return BulkResult(
+                item=item,
+                ok=False,
+                started=started,
+                elapsed=time.perf_counter() - start,
+                error=repr(error),
+            )
+        elapsed = time.perf_counter() - start
+        ok = (
+            200 <= response.status_code <= 299
+            or response.status_code in item.ignore_status
+        )
+        return BulkResult(
+            item=item,
+            ok=ok,
+            status_code=response.status_code,
+            started=started,
+            elapsed=elapsed,
+            error=None if ok else response.text,
+        )
+
+
+def summarize(results: List[BulkResult]) -> dict:
+    """Return counts and timing summary for a batch"""
+    summary = {
+        "total": len(results),
+        "ok": 0,
+        "failed": 0,
+        "seconds": 0.0,
+        "rps": 0.0,
+        "operations": {},
+        "devices": {},
+    }
+    if not results:
+        return summary
+    end = 0.0
+    for result in results:
+        summary["ok" if result.ok else "failed"] += 1
+        end = max(end, result.started + result.elapsed)
+        for group, name in (
+            ("operations", result.item.operation),
+            ("devices", result.item.device_name),
+        ):
+            counts = summary[group].setdefault(
+                name, {"ok": 0, "failed": 0, "elapsed": 0.0}
+            )
+            counts["ok" if result.ok else "failed"] += 1
+            counts["elapsed"] += result.elapsed
+    summary["seconds"] = round(end, 3)
+    summary["rps"] = round(len(results) / end, 1) if end else 0.0
+    return summary
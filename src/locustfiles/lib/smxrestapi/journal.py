@@ -0,0 +1,202 @@
+"""
+Append-only provisioning journal with crash safe checkpoints.
+
+Every create and delete executed through SMxBulkRequests (and therefore the
+planner and reconcile) is appended to a JSON lines file together with its
+outcome and, for creates, the call that undoes it.  Records are buffered and
+written with an fsync every batch_size records or sync_interval seconds, so
+a crash loses at most the last unsynced batch; a partially written last line
+is ignored when the journal is re-opened.  record only buffers and tells
+when a sync is due, SMxBulkRequests then runs flush in a worker thread so
+the write and fsync do not block the event loop.
+
+Re-opening the same file resumes the run:
+
+    * setup skips keys the journal already shows as created
+    * teardown deletes exactly what the journal shows as created and not yet
+      deleted, nothing else on the system is touched
+
+Example:
+    with ProvisioningJournal("results/setup.journal") as journal:
+        bulk = SMxBulkRequests(smx, max_concurrency=20, journal=journal)
+        plan.setup(bulk, skip=journal.created_keys())
+        ...
+        plan.teardown(bulk, only=journal.created_keys())
+        # or without the plan, in reverse creation order:
+        journal_teardown(bulk, journal)
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from locustfiles.lib.smxrestapi.bulk import (
+    BulkItem,
+    BulkResult,
+    SMxBulkRequests,
+    bulk_item,
+)
+
+
+def _item_to_dict(item: BulkItem) -> Optional[dict]:
+    """Return the serializable call of an item"""
+    if item is None:
+        return None
+    return {
+        "operation": item.operation,
+        "args": list(item.args),
+        "kwargs": item.kwargs,
+    }
+
+
+def _item_from_dict(key: str, call: dict) -> BulkItem:
+    """Return a BulkItem from a journaled call"""
+    return bulk_item(call["operation"], *call["args"], key=key, **call["kwargs"])
+
+
+def _created(status_code: Optional[int]) -> bool:
+    """Return True when a create status shows the resource was created"""
+    return status_code is not None and 200 <= status_code <= 299
+
+
+class ProvisioningJournal:
+    """Append-only JSON lines journal of provisioning calls"""
+
+    def __init__(self, path: str, batch_size: int = 100, sync_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.seq = 0
+        # key: undo call of successfully created resources not yet deleted
+        self.live: Dict[str, Optional[dict]] = {}
+        self._buffer: List[str] = []
+        self._unsynced = 0  # records since the last sync was due
+        self._last_sync = time.monotonic()
+        self._buffer_lock = threading.Lock()  # record and the buffer swap
+        self._write_lock = threading.Lock()  # keeps the batches in order
+        self._partial_last_line = False
+        self._replay()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf8")
+        if self._partial_last_line:
+            self._file.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _replay(self):
+        """Rebuild state from an existing journal file"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf8") as infile:
+            for line in infile:
+                self._partial_last_line = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # partially written record from a crash
+                    continue
+                self._apply(entry)
+                self.seq = max(self.seq, entry["seq"])
+
+    def _apply(self, entry: dict):
+        """Update live resources with a journal entry.  A create is live only
+        when SMx created the resource (2xx): a create accepted with an
+        ignore_status (409 already exists) did not create it, teardown must
+        not delete it.
+        """
+        if not entry["ok"] or entry["key"] is None:
+            return
+        if entry["action"] == "create":
+            if _created(entry.get("status_code")):
+                self.live[entry["key"]] = entry["undo"]
+        elif entry["action"] == "delete":
+            self.live.pop(entry["key"], None)
+
+    def record(self, result: BulkResult) -> bool:
+        """Buffer the outcome of a call, the action (create, delete, update)
+        is the prefix of the SMxRequests operation name.  Return True when a
+        sync is due (batch_size records or sync_interval seconds since the
+        last one): the caller must then flush, True is returned once per
+        sync.
+        """
+        self.seq += 1
+        item = result.item
+        entry = {
+            "seq": self.seq,
+            "time": round(time.time(), 3),
+            "action": item.operation.split("_", 1)[0],
+            "key": item.key,
+            "call": _item_to_dict(item),
+            "undo": _item_to_dict(item.undo),
+            "ok": result.ok,
+            "status_code": result.status_code,
+            "error": result.error,
+        }
+        self._apply(entry)
+        line = json.dumps(entry)
+        with self._buffer_lock:
+            self._buffer.append(line)
+        self._unsynced += 1
+        now = time.monotonic()
+        if (
+            self._unsynced >= self.batch_size
+            or now - self._last_sync >= self.sync_interval
+        ):
+            self._unsynced = 0
+            self._last_sync = now
+            return True
+        return False
+
+    def flush(self):
+        """Write buffered records and fsync the journal file, safe to call
+        from a worker thread while records are buffered
+        """
+        with self._write_lock:
+            with self._buffer_lock:
+                lines, self._buffer = self._buffer, []
+            if lines:
+                self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Flush and close the journal file"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def created_keys(self) -> List[str]:
+        """Return keys created and not yet deleted in creation order"""
+        return list(self.live)
+
+    def teardown_items(self) -> List[BulkItem]:
+        """Return undo calls of live resources in reverse creation order"""
+        return [
+            _item_from_dict(key, undo)
+            for key, undo in reversed(self.live.items())
+            if undo is not None
+        ]
+
+
+def journal_teardown(
+    bulk: SMxBulkRequests, journal: ProvisioningJournal
+) -> List[BulkResult]:
+    """Delete everything the journal shows as created, one call at a time in
+    reverse creation order.  Use ProvisioningPlan.teardown(only=) when the
+    plan is available to delete independent resources in parallel.
+    """
+
+    async def run(items):
+        async with bulk.open():
+            return [await bulk.submit(item) for item in items]
+
+    return asyncio.run(run(journal.teardown_items()))
@@ -0,0 +1,427 @@
+"""
+Dependency aware provisioning planner for test fixtures.
+
+Setup is described as a graph of nodes, each node owning the SMxRequests
+call that creates it, the call that deletes it and the nodes it depends on.
+Setup starts every node as soon as its dependencies are created, so
+independent work (for example all DHCP, SIP and class-map profiles) runs in
+parallel and total time is bound by the critical path instead of the sum of
+all calls.  Teardown runs in reverse dependency order: a node is deleted
+once everything depending on it has been deleted.
+
+Calls are executed by SMxBulkRequests so the global and per-device
+concurrency limits apply to the whole plan.
+
+Example:
+    plan = ProvisioningPlan()
+    add_profile(plan, "dhcp-v4-server-pool", "pool1", pool_cfg, ["olt1"])
+    add_profile(plan, "dhcp-v4-server-profile", "dhcp1", dhcp_cfg, ["olt1"],
+                depends_on=["dhcp-v4-server-pool:pool1"])
+    add_service_template(plan, "LocustBNGDataService", template_cfg,
+                         depends_on=["dhcp-v4-server-profile:dhcp1"], device_names=["olt1"])
+    add_l3_one2one_service_data(plan, l3one2oneservicecrud.validate_test_data(params), "olt1")
+    bulk = SMxBulkRequests(smx, max_concurrency=20)
+    results = plan.setup(bulk)
+    ...
+    plan.teardown(bulk)
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from locustfiles.lib.errors import ToolboxError
+from locustfiles.lib.smxpayloads import (
+    ont_configuration,
+    service_configuration,
+    subscriber_configuration,
+)
+from locustfiles.lib.smxrestapi.bulk import (
+    BulkItem,
+    BulkResult,
+    SMxBulkRequests,
+    bulk_item,
+)
+
+
+class PlanError(ToolboxError):
+    """Provisioning plan is not a valid dependency graph"""
+
+    pass
+
+
+@dataclass
+class PlanNode:
+    """Single resource in a provisioning plan"""
+
+    key: str
+    create: BulkItem
+    delete: Optional[BulkItem] = None
+    depends_on: List[str] = field(default_factory=list)
+
+
+class ProvisioningPlan:
+    """Graph of resources to create and delete in dependency order"""
+
+    def __init__(self):
+        self.nodes: Dict[str, PlanNode] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.nodes
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(
+        self,
+        key: str,
+        create: BulkItem,
+        delete: BulkItem = None,
+        depends_on: Iterable[str] = (),
+    ) -> PlanNode:
+        """Add a node, keys must be unique within the plan"""
+        if key in self.nodes:
+            raise PlanError(f"Duplicate plan node {key}")
+        create.key = key
+        create.undo = delete
+        if delete is not None:
+            delete.key = key
+        node = PlanNode(key, create, delete, list(depends_on))
+        self.nodes[key] = node
+        return node
+
+    def dependents(self) -> Dict[str, List[str]]:
+        """Return map of node key to the keys depending on it"""
+        dependents = {key: [] for key in self.nodes}
+        for node in self.nodes.values():
+            for dependency in node.depends_on:
+                if dependency not in self.nodes:
+                    raise PlanError(
+                        f"Plan node {node.key} depends on unknown node {dependency}"
+                    )
+                dependents[dependency].append(node.key)
+        return dependents
+
+    def levels(self) -> List[List[str]]:
+        """Return nodes grouped by depth (Kahn's algorithm).
+        Nodes in the same level are independent of each other and the number
+        of levels is the length of the critical path.
+        """
+        dependents = self.dependents()
+        pending = {key: len(node.depends_on) for key, node in self.nodes.items()}
+        level = [key for key, count in pending.items() if count == 0]
+        levels = []
+        placed = 0
+        while level:
+            levels.append(level)
+            placed += len(level)
+            next_level = []
+            for key in level:
+                for dependent in dependents[key]:
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        next_level.append(dependent)
+            level = next_level
+        if placed != len(self.nodes):
+            cyclic = sorted(key for key, count in pending.items() if count > 0)
+            raise PlanError(f"Plan has a dependency cycle between {cyclic}")
+        return levels
+
+    def topological_order(self) -> List[str]:
+        """Return node keys in creation order"""
+        return [key for level in self.levels() for key in level]
+
+    def setup(
+        self, bulk: SMxBulkRequests, skip: Iterable[str] = ()
+    ) -> Dict[str, BulkResult]:
+        """Create all nodes returning the result per node key"""
+        return asyncio.run(self.run_setup(bulk, skip))
+
+    def teardown(
+        self, bulk: SMxBulkRequests, only: Iterable[str] = None
+    ) -> Dict[str, BulkResult]:
+        """Delete all nodes (or the nodes in only) returning the result per
+        node key
+        """
+        return asyncio.run(self.run_teardown(bulk, only))
+
+    async def run_setup(
+        self, bulk: SMxBulkRequests, skip: Iterable[str] = ()
+    ) -> Dict[str, BulkResult]:
+        """Create every node after the nodes it depends on.
+        Nodes in skip are treated as already created.
+        Nodes whose dependencies failed are skipped and reported as failed.
+        """
+        self.levels()  # validate before issuing any request
+        skip = set(skip)
+        waits_on = {key: node.depends_on for key, node in self.nodes.items()}
+        items = {
+            key: None if key in skip else node.create
+            for key, node in self.nodes.items()
+        }
+        return await self._run_ordered(bulk, items, waits_on)
+
+    async def run_teardown(
+        self, bulk: SMxBulkRequests, only: Iterable[str] = None
+    ) -> Dict[str, BulkResult]:
+        """Delete every node after all nodes depending on it are deleted.
+        Nodes without a delete call or not in only (when given) are treated
+        as already removed.
+        """
+        waits_on = self.dependents()
+        self.levels()
+        only = None if only is None else set(only)
+        items = {
+            key: node.delete if only is None or key in only else None
+            for key, node in self.nodes.items()
+        }
+        return await self._run_ordered(bulk, items, waits_on)
+
+    async def _run_ordered(self, bulk, items, waits_on) -> Dict[str, BulkResult]:
+        """Run items as soon as all items they wait on have succeeded"""
+        done = {key: asyncio.get_running_loop().create_future() for key in items}
+        results = {}
+
+        async def run_node(key):
+            for other in waits_on[key]:
+                if not await done[other]:
+                    result = BulkResult(
+                        item=items[key] or BulkItem("skip", key=key),
+                        ok=False,
+                        error=f"skipped: {other} failed",
+                    )
+                    results[key] = result
+                    done[key].set_result(False)
+                    return
+            if items[key] is None:
+                done[key].set_result(True)
+                return
+            result = await bulk.submit(items[key])
+            results[key] = result
+            done[key].set_result(result.ok)
+
+        async with bulk.open():
+            await asyncio.gather(*(run_node(key) for key in items))
+        return results
+
+
+# ----- Profiles and service templates ----- #
+
+# profile kind: (create, delete, sync to device, delete from device)
+PROFILE_OPERATIONS = {
+    "dhcp-v4-server-pool": (
+        "create_ems_profile_dhcp_v4_server_pool",
+        "delete_ems_profile_dhcp_v4_server_pool",
+        "create_config_profile_sync_dhcp_v4_server_pool_to_device",
+        "delete_config_device_dhcp_v4_server_pool",
+    ),
+    "dhcp-v4-server-profile": (
+        "create_ems_profile_dhcp_v4_server_profile",
+        "delete_ems_profile_dhcp_v4_server_profile",
+        "create_config_profile_sync_dhcp_v4_server_profile_to_device",
+        "delete_config_device_dhcp_v4_server_profile",
+    ),
+    "dhcp-v6-server-pool": (
+        "create_ems_profile_dhcp_v6_server_pool",
+        "delete_ems_profile_dhcp_v6_server_pool",
+        "create_config_profile_sync_dhcp_v6_server_pool_to_device",
+        "delete_config_device_dhcp_v6_server_pool",
+    ),
+    "dhcp-v6-server-profile": (
+        "create_ems_profile_dhcp_v6_server_profile",
+        "delete_ems_profile_dhcp_v6_server_profile",
+        "create_config_profile_sync_dhcp_v6_server_profile_to_device",
+        "delete_config_device_dhcp_v6_server_profile",
+    ),
+    "class-map": (
+        "create_ems_profile_class_map",
+        "delete_ems_profile_class_map",
+        "create_config_profile_sync_class_map_to_device",
+        None,
+    ),
+    "class-map-ip": (
+        "create_ems_profile_class_map",
+        "delete_ems_profile_class_map",
+        "create_config_profile_sync_class_map_ip_to_device",
+        "delete_config_device_class_map",
+    ),
+    "policy-map": (
+        "create_ems_profile_policy_map",
+        "delete_ems_profile_policy_map",
+        "create_config_profile_sync_policy_map_to_device",
+        "delete_config_device_policy_map",
+    ),
+    "control-policy": (
+        "create_ems_profile_control_policy",
+        "delete_ems_profile_control_policy",
+        "create_config_profile_sync_control_policy_to_device",
+        "delete_config_device_control_policy",
+    ),
+    "sip-profile": (
+        "create_ems_profile_sip_profile",
+        "delete_ems_profile_sip_profile",
+        "create_config_profile_sync_sip_profile_to_device",
+        "delete_config_device_sip_profile",
+    ),
+}
+
+
+def profile_key(kind: str, name: str, device_name: str = None) -> str:
+    """Return plan key of a profile or of its sync to a device"""
+    if device_name is None:
+        return f"{kind}:{name}"
+    return f"{kind}:{name}@{device_name}"
+
+
+def add_profile(
+    plan: ProvisioningPlan,
+    kind: str,
+    name: str,
+    configuration: dict,
+    device_names: Iterable[str] = (),
+    depends_on: Iterable[str] = (),
+) -> str:
+    """Add an EMS profile and its sync to each device.
+    depends_on lists profile keys (without device) this profile references;
+    the sync to a device also waits for their sync to the same device.
+    Returns the profile key.
+    """
+    if kind not in PROFILE_OPERATIONS:
+        raise PlanError(f"Unknown profile kind {kind}")
+    create, delete, sync, device_delete = PROFILE_OPERATIONS[kind]
+    depends_on = list(depends_on)
+    key = profile_key(kind, name)
+    plan.add(
+        key,
+        bulk_item(create, configuration),
+        bulk_item(delete, name),
+        depends_on=depends_on,
+    )
+    for device_name in device_names:
+        sync_depends_on = [key]
+        for dependency in depends_on:
+            if f"{dependency}@{device_name}" in plan:
+                sync_depends_on.append(f"{dependency}@{device_name}")
+        plan.add(
+            profile_key(kind, name, device_name),
+            bulk_item(sync, device_name, name),
+            bulk_item(device_delete, device_name, name) if device_delete else None,
+            depends_on=sync_depends_on,
+        )
+    return key
+
+
+def add_service_template(
+    plan: ProvisioningPlan,
+    name: str,
+    configuration: dict,
+    depends_on: Iterable[str] = (),
+    device_names: Iterable[str] = (),
+) -> str:
+    """Add a service template depending on profiles synced to device_names.
+    Returns the service template key.
+    """
+    key = f"service-template:{name}"
+    template_depends_on = []
+    for dependency in depends_on:
+        template_depends_on.append(dependency)
+        for device_name in device_names:
+            if f"{dependency}@{device_name}" in plan:
+                template_depends_on.append(f"{dependency}@{device_name}")
+    plan.add(
+        key,
+        bulk_item("create_config_service_template", configuration),
+        bulk_item("delete_config_service_template", name),
+        depends_on=template_depends_on,
+    )
+    return key
+
+
+# ----- Test data from locustmodeldata ----- #
+
+
+def _service_depends_on(plan: ProvisioningPlan, service, depends_on: list) -> list:
+    """Add the service template dependency when the template is in the plan"""
+    template_key = f"service-template:{service.service_name}"
+    if template_key in plan:
+        return depends_on + [template_key]
+    return depends_on
+
+
+def _add_service(
+    plan: ProvisioningPlan, device_name: str, ont_id: str, service, depends_on: list
+):
+    """Add a subscriber service node for a data or voice service model"""
+    plan.add(
+        f"service:{device_name}/{ont_id}/{service.ont_port_id}/{service.service_name}",
+        bulk_item(
+            "create_ems_service",
+            service_configuration(device_name, ont_id, service),
+        ),
+        bulk_item(
+            "delete_ems_service",
+            device_name,
+            ont_id,
+            service.ont_port_id,
+            service.service_name,
+        ),
+        depends_on=_service_depends_on(plan, service, depends_on),
+    )
+
+
+def add_ont_crud_data(plan: ProvisioningPlan, data, device_name: str):
+    """Add ONTs from ontcrud test data (ont_crud_data)"""
+    for ont in data.onts.ont_config:
+        plan.add(
+            f"ont:{device_name}/{ont.ont_id}",
+            bulk_item("create_config_device_ont", device_name, ont_configuration(ont)),
+            bulk_item(
+                "delete_config_device_ont",
+                device_name,
+                ont.ont_id,
+                data.onts.force_delete,
+            ),
+        )
+
+
+def add_l3_one2one_service_data(plan: ProvisioningPlan, data, device_name: str):
+    """Add ONTs with their data and voice services from
+    l3one2oneservicecrud test data (l3_one2one_service_data).
+    """
+    for ont in data.onts.ont_config:
+        ont_key = f"ont:{device_name}/{ont.ont_id}"
+        plan.add(
+            ont_key,
+            bulk_item("create_config_device_ont", device_name, ont_configuration(ont)),
+            bulk_item(
+                "delete_config_device_ont",
+                device_name,
+                ont.ont_id,
+                data.onts.force_delete,
+            ),
+        )
+        for service in (ont.data_service, ont.voice_service):
+            if service is not None:
+                _add_service(plan, device_name, ont.ont_id, service, [ont_key])
+
+
+def add_ont_data_service_data(plan: ProvisioningPlan, data, org_id: str):
+    """Add subscribers with their data service from ontl3121dataservicecd
+    (ont_l3121_data_service_data) or ontl2tpdataservicecd
+    (ont_l2tp_data_service_data) test data.  ONTs are expected to exist.
+    """
+    for ont in data.onts.ont_config:
+        subscriber_key = f"subscriber:{org_id}/{ont.subscriber_id}"
+        if subscriber_key not in plan:
+            plan.add(
+                subscriber_key,
+                bulk_item(
+                    "create_ems_subscriber",
+                    subscriber_configuration(ont.subscriber_id, org_id),
+                ),
+                bulk_item("delete_ems_subscriber", org_id, ont.subscriber_id),
+            )
+        if ont.data_service is not None:
+            _add_service(
+                plan, ont.device_name, ont.ont_id, ont.data_service, [subscriber_key]
+            )
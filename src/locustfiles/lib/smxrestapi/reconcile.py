@@ -0,0 +1,250 @@
+"""
+Idempotent, diff based setup of a ProvisioningPlan.
+
+Instead of firing every create of a plan (and collecting 409s after a
+partial run) reconcile reads the existing ONTs, subscribers and services
+once with streaming paginated reads, computes a set based diff against the plan and
+only issues the calls needed:
+
+    * create - plan nodes missing on SMx (dependencies already present
+      are treated as created)
+    * update - plan nodes present on SMx with different field values
+    * delete - resources present on SMx, not in the plan and selected by the
+      prune filter (nothing is deleted unless prune is given)
+
+Profiles and service templates are not read back; their creates accept a
+409 (already exists) as success.
+
+Example:
+    plan = ProvisioningPlan()
+    add_l3_one2one_service_data(plan, l3one2oneservicecrud.validate_test_data(params), "olt1")
+    bulk = SMxBulkRequests(smx, max_concurrency=20)
+    diff, results = reconcile(plan, bulk, prune=lambda key: "/E9_" in key)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from locustfiles.lib.smxrestapi.bulk import (
+    BulkItem,
+    BulkResult,
+    SMxBulkRequests,
+    bulk_item,
+)
+from locustfiles.lib.smxrestapi.planner import ProvisioningPlan
+from locustfiles.lib.smxrestapi.smxapi import SMxRequests
+
+ALREADY_EXISTS = 409
+ONT_FIELDS = ("ont-id", "serial-number", "vendor-id", "profile-id", "subscriber-id")
+SUBSCRIBER_FIELDS = ("org-id", "account-name", "customer-id")
+SERVICE_FIELDS = (
+    "device-name",
+    "ont-id",
+    "ont-port-id",
+    "service-name",
+    "vlan",
+    "c-vlan",
+)
+# Plan node kind that are read back from SMx: update operation
+UPDATE_OPERATIONS = {
+    "ont": "update_config_device_ont",
+    "subscriber": "update_ems_subscriber",
+    "service": "update_ems_service",
+}
+
+
+@dataclass
+class ReconcileDiff:
+    """Plan keys to create, update or leave alone and extra resources to delete"""
+
+    create: List[str] = field(default_factory=list)
+    update: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    delete: List[BulkItem] = field(default_factory=list)
+
+
+def ont_key(device_name: str, ont_id: str) -> str:
+    """Return plan key of an ONT"""
+    return f"ont:{device_name}/{ont_id}"
+
+
+def subscriber_key(org_id: str, subscriber_id: str) -> str:
+    """Return plan key of a subscriber"""
+    return f"subscriber:{org_id}/{subscriber_id}"
+
+
+def service_key(record: dict) -> str:
+    """Return plan key of a service record or service configuration"""
+    return (
+        f"service:{record.get('device-name')}/{record.get('ont-id')}/"
+        f"{record.get('ont-port-id')}/{record.get('service-name')}"
+    )
+
+
+def read_existing(
+    smx: SMxRequests,
+    device_names: Iterable[str],
+    org_ids: Iterable[str] = (),
+    limit: int = 2000,
+) -> Dict[str, dict]:
+    """Read existing ONTs and services per device and subscribers per
+    organization in parallel.  Returns map of plan key to record.
+    """
+
+    def read_onts(device_name):
+        records = smx.iter_config_device_gui_ont(device_name, ONT_FIELDS, limit=limit)
+        return {
+            ont_key(device_name, record.get("ont-id")): record for record in records
+        }
+
+    def read_services(device_name):
+        records = smx.iter_ems_service(device_name, SERVICE_FIELDS, limit=limit)
+        return {
+            service_key({"device-name": device_name, **record}): record
+            for record in records
+        }
+
+    def read_subscribers(org_id):
+        records = smx.iter_ems_subscriber(org_id, SUBSCRIBER_FIELDS, limit=limit)
+        return {
+            subscriber_key(org_id, record.get("account-name")): record
+            for record in records
+        }
+
+    jobs = [partial(read_onts, device_name) for device_name in device_names]
+    jobs += [partial(read_services, device_name) for device_name in device_names]
+    jobs += [partial(read_subscribers, org_id) for org_id in org_ids]
+    existing = {}
+    with ThreadPoolExecutor(max_workers=max(1, smx.pool_size)) as executor:
+        for records in executor.map(lambda job: job(), jobs):
+            existing.update(records)
+    return existing
+
+
+def _node_kind(key: str) -> str:
+    """Return kind part of a plan key"""
+    return key.split(":", 1)[0]
+
+
+def _configuration(item: BulkItem) -> dict:
+    """Return the configuration dict argument of a create call"""
+    for value in (*item.args, *item.kwargs.values()):
+        if isinstance(value, dict):
+            return value
+    return {}
+
+
+def _delete_item(key: str, force_delete: str) -> BulkItem:
+    """Return delete call for an existing resource not in the plan"""
+    kind, identity = key.split(":", 1)
+    if kind == "ont":
+        device_name, ont_id = identity.split("/", 1)
+        return bulk_item(
+            "delete_config_device_ont", device_name, ont_id, force_delete, key=key
+        )
+    if kind == "subscriber":
+        org_id, subscriber_id = identity.split("/", 1)
+        return bulk_item("delete_ems_subscriber", org_id, subscriber_id, key=key)
+    device_name, ont_id, ont_port_id, service_name = identity.split("/", 3)
+    return bulk_item(
+        "delete_ems_service", device_name, ont_id, ont_port_id, service_name, key=key
+    )
+
+
+def diff_plan(
+    plan: ProvisioningPlan,
+    existing: Dict[str, dict],
+    prune: Callable[[str], bool] = None,
+    force_delete: str = "false",
+) -> ReconcileDiff:
+    """Compute the calls needed to bring SMx in line with the plan.
+    prune(key) selects which existing resources not in the plan are deleted.
+    """
+    diff = ReconcileDiff()
+    for key, node in plan.nodes.items():
+        kind = _node_kind(key)
+        if kind not in UPDATE_OPERATIONS:
+            diff.create.append(key)
+            continue
+        record = existing.get(key)
+        if record is None:
+            diff.create.append(key)
+            continue
+        desired = _configuration(node.create)
+        if any(
+            field_name in record and record[field_name] != value
+            for field_name, value in desired.items()
+        ):
+            diff.update.append(key)
+        else:
+            diff.unchanged.append(key)
+
+    if prune is not None:
+        extra = [key for key in existing.keys() - plan.nodes.keys() if prune(key)]
+        diff.delete = [_delete_item(key, force_delete) for key in sorted(extra)]
+    return diff
+
+
+def apply_diff(
+    plan: ProvisioningPlan, bulk: SMxBulkRequests, diff: ReconcileDiff
+) -> Dict[str, BulkResult]:
+    """Issue deletes, then updates, then creates of the diff.
+    Services are deleted before the ONTs and subscribers they belong to.
+    """
+    results = {}
+    services = [item for item in diff.delete if _node_kind(item.key) == "service"]
+    others = [item for item in diff.delete if _node_kind(item.key) != "service"]
+    for items in (services, others):
+        for result in bulk.execute(items):
+            results[result.item.key] = result
+
+    updates = []
+    for key in diff.update:
+        create = plan.nodes[key].create
+        updates.append(
+            bulk_item(
+                UPDATE_OPERATIONS[_node_kind(key)],
+                *create.args,
+                key=key,
+                **create.kwargs,
+            )
+        )
+    for result in bulk.execute(updates):
+        results[result.item.key] = result
+
+    create = set(diff.create)
+    for key in create:
+        node = plan.nodes[key]
+        if (
+            _node_kind(key) not in UPDATE_OPERATIONS
+            and ALREADY_EXISTS not in node.create.ignore_status
+        ):
+            node.create.ignore_status = (*node.create.ignore_status, ALREADY_EXISTS)
+    skip = [key for key in plan.nodes if key not in create]
+    results.update(plan.setup(bulk, skip=skip))
+    return results
+
+
+def reconcile(
+    plan: ProvisioningPlan,
+    bulk: SMxBulkRequests,
+    prune: Callable[[str], bool] = None,
+    force_delete: str = "false",
+    limit: int = 2000,
+) -> Tuple[ReconcileDiff, Dict[str, BulkResult]]:
+    """Read existing state once, diff against the plan and apply the diff.
+    Devices and subscriber organizations read are the ones used by the plan.
+    """
+    device_names = set()
+    org_ids = set()
+    for key, node in plan.nodes.items():
+        kind = _node_kind(key)
+        if kind in ("ont", "service") and node.create.device_name:
+            device_names.add(node.create.device_name)
+        elif kind == "subscriber":
+            org_ids.add(key.split(":", 1)[1].split("/", 1)[0])
+    existing = read_existing(bulk.smx, sorted(device_names), sorted(org_ids), limit)
+    diff = diff_plan(plan, existing, prune, force_delete)
+    return diff, apply_diff(plan, bulk, diff)
@@ -4,11 +4,15 @@ The intention is that these are re-usable for any use-case.
 Eventually it may make sense further modularize the API calls
 as the class grows.
 """
+
 # TODO Reduce profile create that have commonalities to a single function
 # TODO Reduce profile delete that have commonalities to a single function
 
 
 import locustfiles.lib.smxrestapi.base as Base
+from locustfiles.lib import jsonstream
+from locustfiles.lib.pagination import iter_pages
+from locustfiles.lib.smxpayloads import get_ont_serial_number
 
 
 class SMxRequests(Base.SmxRequest):
@@ -18,30 +22,47 @@ class SMxRequests(Base.SmxRequest):
 
     def delete_config_device_ont(self, device_name, ont_id, forced_delete="false"):
         """Delete config device ONT by ont_id."""
-
-        route = f"/config/device/{device_name}/ont?ont-id={ont_id}&force-delete={forced_delete}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_ont",
+            device_name=device_name,
+            ont_id=ont_id,
+            forced_delete=forced_delete,
+        )
 
     def delete_config_device_vlan(self, device_name, vlan_id):
         """Delete config device VLAN by vlan_id"""
-
-        route = f"/config/device/{device_name}/vlan/{vlan_id}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_vlan", device_name=device_name, vlan_id=vlan_id
+        )
 
     def get_ont_serial_number(self, vendor_id, serial_number):
         """Return ONT serial number"""
-        if vendor_id.upper() == "CXNK" and len(serial_number) < 12:
-            serial_number = (
-                vendor_id
-                + ("0" * (12 - len(vendor_id) - len(serial_number)))
-                + serial_number
-            )
-        return serial_number
+        return get_ont_serial_number(vendor_id, serial_number)
 
     def create_config_device_ont(self, device_name: str, configuration: dict):
         """Create an ONT"""
-        route = f"/config/device/{device_name}/ont"
+        if (
+            "vendor-id" in configuration.keys()
+            and "serial-number" in configuration.keys()
+        ):
+            configuration["serial-number"] = self.get_ont_serial_number(
+                configuration["vendor-id"], configuration["serial-number"]
+            )
+
+        return self.call(
+            "create_config_device_ont", data=configuration, device_name=device_name
+        )
+
+    def create_config_device_ont_record(self, device_name: str, ont):
+        """Create an ONT from an ONT config model with the cached encoded body"""
+        return self.call(
+            "create_config_device_ont",
+            data=self.payloads.ont(ont),
+            device_name=device_name,
+        )
 
+    def update_config_device_ont(self, device_name: str, configuration: dict):
+        """Update an ONT"""
         if (
             "vendor-id" in configuration.keys()
             and "serial-number" in configuration.keys()
@@ -50,323 +71,416 @@ class SMxRequests(Base.SmxRequest):
                 configuration["vendor-id"], configuration["serial-number"]
             )
 
-        return self.post(route, params=configuration)
+        return self.call(
+            "update_config_device_ont", data=configuration, device_name=device_name
+        )
 
     def create_config_device_vlan(self, device_name: str, configuration: dict):
         """Create a VLAN"""
-
-        route = f"/config/device/{device_name}/vlan"
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_device_vlan", data=configuration, device_name=device_name
+        )
 
     def create_ems_profile_dhcp_v4_server_pool(self, configuration: dict):
         """Create a DHCPv4 server pool"""
-
-        route = "/ems/profile/dhcp-v4-server-pool"
-        return self.post(route, params=configuration)
+        return self.call("create_ems_profile_dhcp_v4_server_pool", data=configuration)
 
     def delete_ems_profile_dhcp_v4_server_pool(self, pool_name: str):
         """Delete a DHCPv4 server pool"""
-
-        route = f"/ems/profile/dhcp-v4-server-pool/{pool_name}"
-        return self.delete(route)
+        return self.call("delete_ems_profile_dhcp_v4_server_pool", name=pool_name)
 
     def create_ems_profile_dhcp_v4_server_profile(self, configuration: dict):
         """Create a DHCPv4 server profile"""
-
-        route = "/ems/profile/dhcp-v4-server-profile"
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_ems_profile_dhcp_v4_server_profile", data=configuration
+        )
 
     def delete_ems_profile_dhcp_v4_server_profile(self, dhcp_profile: str):
         """Delete a DHCPv4 server profile"""
-
-        route = f"/ems/profile/dhcp-v4-server-profile/{dhcp_profile}"
-        return self.delete(route)
+        return self.call("delete_ems_profile_dhcp_v4_server_profile", name=dhcp_profile)
 
     def create_ems_profile_dhcp_v6_server_pool(self, configuration: dict):
         """Create a DHCPv6 server pool"""
-
-        route = "/ems/profile/dhcp-v6-server-pool"
-        return self.post(route, params=configuration)
+        return self.call("create_ems_profile_dhcp_v6_server_pool", data=configuration)
 
     def delete_ems_profile_dhcp_v6_server_pool(self, name: str):
         """Delete a DHCPv6 server pool"""
-
-        route = f"/ems/profile/dhcp-v6-server-pool/{name}"
-        return self.delete(route)
+        return self.call("delete_ems_profile_dhcp_v6_server_pool", name=name)
 
     def create_ems_profile_dhcp_v6_server_profile(self, configuration: dict):
         """Create a DHCPv6 server profile"""
-
-        route = "/ems/profile/dhcp-v6-server-profile"
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_ems_profile_dhcp_v6_server_profile", data=configuration
+        )
 
     def delete_ems_profile_dhcp_v6_server_profile(self, dhcp_profile: str):
         """Delete a DHCPv6 server profile"""
-
-        route = f"/ems/profile/dhcp-v6-server-profile/{dhcp_profile}"
-        return self.delete(route)
+        return self.call("delete_ems_profile_dhcp_v6_server_profile", name=dhcp_profile)
 
     def create_ems_profile_class_map(self, configuration: dict):
         """Create a class-map"""
-
-        route = "/ems/profile/class-map"
-        return self.post(route, params=configuration)
+        return self.call("create_ems_profile_class_map", data=configuration)
 
     def delete_ems_profile_class_map(self, name: str):
         """Delete a class-map"""
-
-        route = f"/ems/profile/class-map/{name}"
-        return self.delete(route)
+        return self.call("delete_ems_profile_class_map", name=name)
 
     def create_ems_profile_policy_map(self, configuration: dict):
         """Create a policy-map"""
-
-        route = "/ems/profile/policy-map"
-        return self.post(route, params=configuration)
+        return self.call("create_ems_profile_policy_map", data=configuration)
 
     def delete_ems_profile_policy_map(self, name: str):
         """Delete a policy-map"""
-
-        route = f"/ems/profile/policy-map/{name}"
-        return self.delete(route)
+        return self.call("delete_ems_profile_policy_map", name=name)
 
     def create_ems_profile_control_policy(self, configuration: dict):
         """Create a control_policy"""
-
-        route = "/ems/profile/control-policy"
-        return self.post(route, params=configuration)
+        return self.call("create_ems_profile_control_policy", data=configuration)
 
     def delete_ems_profile_control_policy(self, name: str):
         """Delete a control_policy"""
-
-        route = f"/ems/profile/control-policy/{name}"
-        return self.delete(route)
+        return self.call("delete_ems_profile_control_policy", name=name)
 
     def create_ems_profile_sip_profile(self, configuration: dict):
         """Create a SIP profile"""
-
-        route = "/ems/profile/sip-profile"
-        return self.post(route, params=configuration)
+        return self.call("create_ems_profile_sip_profile", data=configuration)
 
     def delete_ems_profile_sip_profile(self, name: str):
         """Delete a SIP profile"""
-
-        route = f"/ems/profile/sip-profile/{name}"
-        return self.delete(route)
+        return self.call("delete_ems_profile_sip_profile", name=name)
 
     def create_config_service_template(self, configuration: dict):
         """Create a service template"""
-
-        route = "/config/service-template"
-        return self.post(route, params=configuration)
+        return self.call("create_config_service_template", data=configuration)
 
     def get_config_service_template(self, name: str):
         """Get real time status for an ONT"""
-
-        route = f"/config/service-template/{name}"
-        return self.get(route)
+        return self.call("get_config_service_template", name=name)
 
     def delete_config_service_template(self, name: str):
         """Delete a service template"""
-
-        route = f"/config/service-template/{name}"
-        return self.delete(route)
+        return self.call("delete_config_service_template", name=name)
 
     def create_config_profile_sync_class_map_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync class map ethernet to device"""
-
-        route = f"/config/profile/sync/class-map/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_class_map_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_config_profile_sync_class_map_ip_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync class map ip to device"""
-
-        route = f"/config/profile/sync/classMap-ip/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_class_map_ip_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_config_profile_sync_policy_map_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync policy map to device"""
-
-        route = f"/config/profile/sync/policy-map/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_policy_map_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_config_profile_sync_control_policy_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync policy map to device"""
-
-        route = f"/config/profile/sync/control-policy/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_control_policy_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_config_profile_sync_sip_profile_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync sip profile to device"""
-
-        route = f"/config/profile/sync/sip-profile/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_sip_profile_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_config_profile_sync_dhcp_v4_server_pool_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync dhcp v4 server pool to device"""
-
-        route = f"/config/profile/sync/dhcp-v4-server-pool/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_dhcp_v4_server_pool_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_config_profile_sync_dhcp_v4_server_profile_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync dhcp v4 server profile to device"""
-
-        route = f"/config/profile/sync/dhcp-v4-server-profile/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_dhcp_v4_server_profile_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_config_profile_sync_dhcp_v6_server_pool_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync dhcp v6 server pool to device"""
-
-        route = f"/config/profile/sync/dhcp-v6-server-pool/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_dhcp_v6_server_pool_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_config_profile_sync_dhcp_v6_server_profile_to_device(
         self, device_name: str, profile_name: str
     ):
         """Create a profile sync dhcp v6 server profile to device"""
-
-        route = f"/config/profile/sync/dhcp-v6-server-profile/{profile_name}"
         configuration = {
             "device-names": [device_name],
         }
-        return self.post(route, params=configuration)
+        return self.call(
+            "create_config_profile_sync_dhcp_v6_server_profile_to_device",
+            data=configuration,
+            name=profile_name,
+        )
 
     def create_ems_subscriber(self, configuration: dict):
         """Create a subscriber"""
-
-        route = f"/ems/subscriber"
-        return self.post(route, params=configuration)
+        return self.call("create_ems_subscriber", data=configuration)
 
     def delete_ems_subscriber(self, org_id: str, account_name: str):
         """Delete a subscriber"""
+        return self.call(
+            "delete_ems_subscriber", org_id=org_id, account_name=account_name
+        )
 
-        route = f"/ems/subscriber/org/{org_id}/account/{account_name}"
-        return self.delete(route)
+    def update_ems_subscriber(self, configuration: dict):
+        """Update a subscriber"""
+        return self.call("update_ems_subscriber", data=configuration)
+
+    def get_ems_subscriber(
+        self, org_id: str, fields: dict, offset=0, limit=2000, stream=False
+    ):
+        """Get subscribers of an organization"""
+        params = {
+            "org-id": org_id,
+            "fields": ",".join(fields),
+            "offset": offset,
+            "limit": limit,
+        }
+        return self.call("get_ems_subscriber", params, stream=stream)
 
     def delete_config_device_sip_profile(self, device_name: str, name: str):
         """Delete a sip_profile"""
-
-        route = f"/config/device/{device_name}/sip-profile/{name}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_sip_profile", device_name=device_name, name=name
+        )
 
     def delete_config_device_control_policy(self, device_name: str, name: str):
         """Delete a control policy"""
-
-        route = f"/config/device/{device_name}/control-policy/{name}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_control_policy", device_name=device_name, name=name
+        )
 
     def delete_config_device_policy_map(self, device_name: str, name: str):
         """Delete a policy map"""
-
-        route = f"/config/device/{device_name}/policy-map/{name}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_policy_map", device_name=device_name, name=name
+        )
 
     def delete_config_device_class_map(self, device_name: str, name: str):
         """Delete a class map"""
-
-        route = f"/config/device/{device_name}/classMap-ip/{name}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_class_map", device_name=device_name, name=name
+        )
 
     def delete_config_device_dhcp_v6_server_profile(self, device_name: str, name: str):
         """Delete a DHCPv6 server profile"""
-
-        route = f"/config/device/{device_name}/dhcp-v6-server-profile/{name}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_dhcp_v6_server_profile",
+            device_name=device_name,
+            name=name,
+        )
 
     def delete_config_device_dhcp_v6_server_pool(self, device_name: str, name: str):
         """Delete a DHCPv6 server pool"""
-
-        route = f"/config/device/{device_name}/dhcp-v6-server-pool/{name}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_dhcp_v6_server_pool",
+            device_name=device_name,
+            name=name,
+        )
 
     def delete_config_device_dhcp_v4_server_profile(self, device_name: str, name: str):
         """Delete a DHCPv4 server profile"""
-
-        route = f"/config/device/{device_name}/dhcp-v4-server-profile/{name}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_dhcp_v4_server_profile",
+            device_name=device_name,
+            name=name,
+        )
 
     def delete_config_device_dhcp_v4_server_pool(self, device_name: str, name: str):
         """Delete a DHCPv4 server pool"""
-
-        route = f"/config/device/{device_name}/dhcp-v4-server-pool/{name}"
-        return self.delete(route)
+        return self.call(
+            "delete_config_device_dhcp_v4_server_pool",
+            device_name=device_name,
+            name=name,
+        )
 
     def create_ems_service(self, configuration: dict):
         """Create a service"""
+        return self.call("create_ems_service", data=configuration)
 
-        route = "/ems/service"
-        return self.post(route, params=configuration)
+    def create_ems_service_record(self, device_name: str, ont_id: str, service):
+        """Create a service from a service model with the cached encoded body"""
+        return self.call(
+            "create_ems_service",
+            data=self.payloads.service(device_name, ont_id, service),
+        )
 
     def delete_ems_service(
         self, device_name: str, ont_id: str, ont_port_id: str, service_name: str
     ):
-        route = f"/ems/service?device-name={device_name}&ont-id={ont_id}&ont-port-id={ont_port_id}&service-name={service_name}"
-        return self.delete(route)
+        return self.call(
+            "delete_ems_service",
+            device_name=device_name,
+            ont_id=ont_id,
+            ont_port_id=ont_port_id,
+            service_name=service_name,
+        )
 
     def update_ems_service(self, configuration: dict):
         """Update a service"""
+        return self.call("update_ems_service", data=configuration)
 
-        route = "/ems/service"
-        return self.put(route, params=configuration)
+    def get_ems_service(
+        self, device_name: str, fields: dict, offset=0, limit=2000, stream=False
+    ):
+        """Get subscriber services of a device"""
+        params = {
+            "device-name": device_name,
+            "fields": ",".join(fields),
+            "offset": offset,
+            "limit": limit,
+        }
+        return self.call("get_ems_service", params, stream=stream)
 
-    def get_config_device(self, fields: dict, offset=0, limit=2000):
+    def get_config_device(self, fields: dict, offset=0, limit=2000, stream=False):
         """Get device info"""
-        route = f"/config/device"
         params = {
             "fields": ",".join(fields),
             "offset": offset,
             "limit": limit,
         }
-        return self.get(route, params)
+        return self.call("get_config_device", params, stream=stream)
 
     def get_config_device_gui_ont(
-        self, device_name: str, fields: dict, offset=0, limit=20
+        self, device_name: str, fields: dict, offset=0, limit=20, stream=False
     ):
         """Get ONT info stored in SMx database"""
-        route = f"/config/device/{device_name}/gui/ont"
         params = {
             "fields": ",".join(fields),
             "offset": offset,
             "limit": limit,
         }
-        return self.get(route, params)
+        return self.call(
+            "get_config_device_gui_ont", params, stream=stream, device_name=device_name
+        )
+
+    # ----- Streaming paginated reads ----- #
+
+    def iter_records(self, get_page, *args, fields, limit=2000, **page_options):
+        """Yield records across all pages of a paginated get method called as
+        get_page(*args, fields, offset=, limit=, stream=True).
+        Each page is parsed incrementally as it downloads keeping only fields.
+        page_options are passed to iter_pages (min_limit, max_limit,
+        target_seconds, prefetch).
+        """
+
+        def fetch_page(offset, limit):
+            with get_page(
+                *args, fields, offset=offset, limit=limit, stream=True
+            ) as response:
+                response.raise_for_status()
+                return list(
+                    jsonstream.iter_records(
+                        response.iter_content(Base.STREAM_CHUNK_SIZE), fields
+                    )
+                )
+
+        return iter_pages(fetch_page, limit, **page_options)
+
+    def iter_config_device(self, fields: dict, limit=2000, **page_options):
+        """Yield device info of all devices"""
+        return self.iter_records(
+            self.get_config_device, fields=fields, limit=limit, **page_options
+        )
+
+    def iter_config_device_gui_ont(
+        self, device_name: str, fields: dict, limit=200, **page_options
+    ):
+        """Yield ONT info stored in SMx database of all device ONTs"""
+        return self.iter_records(
+            self.get_config_device_gui_ont,
+            device_name,
+            fields=fields,
+            limit=limit,
+            **page_options,
+        )
+
+    def iter_ems_service(
+        self, device_name: str, fields: dict, limit=2000, **page_options
+    ):
+        """Yield subscriber services of a device"""
+        return self.iter_records(
+            self.get_ems_service,
+            device_name,
+            fields=fields,
+            limit=limit,
+            **page_options,
+        )
+
+    def iter_ems_subscriber(
+        self, org_id: str, fields: dict, limit=2000, **page_options
+    ):
+        """Yield subscribers of an organization"""
+        return self.iter_records(
+            self.get_ems_subscriber,
+            org_id,
+            fields=fields,
+            limit=limit,
+            **page_options,
+        )
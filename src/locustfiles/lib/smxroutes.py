@@ -0,0 +1,334 @@
+"""
+Declarative registry of the SMx REST API routes.
+
+Every endpoint used by the Locust users (smxuserapi) and the untracked
+setup/teardown client (smxrestapi) is declared once in ROUTES with its HTTP
+method, path template, inline query parameters and the Locust stats group
+name template.  Templates use str.format fields named after the arguments
+of the API methods; a group template replaces the per request fields with
+[placeholders].
+
+Routes are parsed once at import.  The first registry of a root url binds
+each route to a function rendering the fully qualified url and group name
+with %-templates of the templates (root included), so a request only looks
+up its route and calls it:
+
+    routes = RouteRegistry("https://smx/rest/v1")
+    method, url, group_name = routes.resolve(
+        "read_config_device_vlan", {"device_name": "olt1", "vlan_id": 100}
+    )
+    # GET https://smx/rest/v1/config/device/olt1/vlan/100
+    # https://smx/rest/v1/config/device/olt1/vlan/[vlan_id]
+
+New endpoints are added to ROUTES (or the profile table) only.
+"""
+
+from dataclasses import dataclass
+from operator import itemgetter
+from string import Formatter
+from typing import Callable, Dict, Optional, Tuple
+
+from locustfiles.lib.errors import ToolboxError
+
+
+class RouteError(ToolboxError):
+    """Route declaration error"""
+
+    pass
+
+
+@dataclass(frozen=True)
+class Route:
+    """SMx endpoint declaration"""
+
+    operation: str
+    method: str
+    path: str
+    query: Tuple[Tuple[str, str], ...] = ()  # (query parameter, argument)
+    group: Optional[str] = None
+
+
+def _parse(template: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """Return (literal, field) parts of a format template"""
+    return tuple(
+        (literal, field) for literal, field, _, _ in Formatter().parse(template)
+    )
+
+
+def _percent(template: str, root: str) -> Tuple[str, Callable[[dict], tuple]]:
+    """Return the %-template of root followed by a format template and the
+    function returning its field values
+    """
+    parts = _parse(template)
+    text = root.replace("%", "%%") + "".join(
+        literal.replace("%", "%%") + ("" if field is None else "%s")
+        for literal, field in parts
+    )
+    fields = tuple(field for _, field in parts if field is not None)
+    if not fields:
+        return text, lambda values: ()
+    if len(fields) == 1:
+        field = fields[0]
+        return text, lambda values: (values[field],)
+    return text, itemgetter(*fields)
+
+
+class CompiledRoute:
+    """Route with its templates parsed, bound to a root url by bind.  The
+    renderer of a root costs one %-format per string and request.
+    """
+
+    __slots__ = ("route", "method", "template", "query")
+
+    def __init__(self, route: Route):
+        self.route = route
+        self.method = route.method
+        self.query = route.query
+        self.template = route.path
+        if route.query:
+            self.template += "?" + "&".join(
+                f"{parameter}={{{argument}}}" for parameter, argument in route.query
+            )
+        fields = {field for _, field in _parse(self.template) if field is not None}
+        if route.group is not None:
+            for _, field in _parse(route.group):
+                if field is not None and field not in fields:
+                    raise RouteError(
+                        f"Route {route.operation} group field {field} is not a "
+                        f"path or query field"
+                    )
+
+    def bind(self, root: str) -> Callable[[dict], tuple]:
+        """Return render(values) -> (method, url, group name) of root"""
+        method = self.method
+        url, url_values = _percent(self.template, root)
+        optional = tuple(argument for _, argument in self.query)
+        omit_none = self._url_omit_none
+        if self.route.group is None:
+            if not optional:
+                return lambda values: (method, url % url_values(values), None)
+            group, group_values = "", None
+        else:
+            group, group_values = _percent(self.route.group, root)
+            if not optional:
+                return lambda values: (
+                    method,
+                    url % url_values(values),
+                    group % group_values(values),
+                )
+
+        def render(values: dict) -> tuple:
+            name = None if group_values is None else group % group_values(values)
+            for argument in optional:
+                if values[argument] is None:
+                    return method, omit_none(root, values), name
+            return method, url % url_values(values), name
+
+        return render
+
+    def _url_omit_none(self, root: str, values: dict) -> str:
+        """Return the url with the query parameters with a None value left
+        out
+        """
+        path = root + self.route.path.format_map(values)
+        query = "&".join(
+            f"{parameter}={values[argument]}"
+            for parameter, argument in self.query
+            if values.get(argument) is not None
+        )
+        return f"{path}?{query}" if query else path
+
+
+# ----- Route declarations ----- #
+
+ROUTES = [
+    # ----- Devices ----- #
+    Route("get_config_device", "GET", "/config/device"),
+    Route("get_config_device_state", "GET", "/config/device/{device_name}"),
+    Route("get_config_device_gui_ont", "GET", "/config/device/{device_name}/gui/ont"),
+    # ----- VLANs ----- #
+    Route("create_config_device_vlan", "POST", "/config/device/{device_name}/vlan"),
+    Route("update_config_device_vlan", "PUT", "/config/device/{device_name}/vlan"),
+    Route(
+        "read_config_device_vlan",
+        "GET",
+        "/config/device/{device_name}/vlan/{vlan_id}",
+        group="/config/device/{device_name}/vlan/[vlan_id]",
+    ),
+    Route(
+        "delete_config_device_vlan",
+        "DELETE",
+        "/config/device/{device_name}/vlan/{vlan_id}",
+        group="/config/device/{device_name}/vlan/[vlan_id]",
+    ),
+    # ----- ONTs ----- #
+    Route("create_config_device_ont", "POST", "/config/device/{device_name}/ont"),
+    Route("update_config_device_ont", "PUT", "/config/device/{device_name}/ont"),
+    Route("get_config_device_ont", "GET", "/config/device/{device_name}/ont"),
+    Route(
+        "delete_config_device_ont",
+        "DELETE",
+        "/config/device/{device_name}/ont",
+        query=(("ont-id", "ont_id"), ("force-delete", "forced_delete")),
+        group="/config/device/{device_name}/ont/[ont_id]",
+    ),
+    Route("get_config_device_ontport", "GET", "/config/device/{device_name}/ontport"),
+    Route(
+        "get_performance_device_ont",
+        "GET",
+        "/performance/device/{device_name}/ont/{ont_id}/status",
+        group="/performance/device/{device_name}/ont/[ont_id]/status",
+    ),
+    # ----- Subscribers ----- #
+    Route("create_ems_subscriber", "POST", "/ems/subscriber"),
+    Route("update_ems_subscriber", "PUT", "/ems/subscriber"),
+    Route("get_ems_subscriber", "GET", "/ems/subscriber"),
+    Route(
+        "delete_ems_subscriber",
+        "DELETE",
+        "/ems/subscriber/org/{org_id}/account/{account_name}",
+        query=(("force-delete", "forced_delete"),),
+        group="/ems/subscriber/org/{org_id}/account/[account_id]",
+    ),
+    # ----- Subscriber services ----- #
+    Route("create_ems_service", "POST", "/ems/service"),
+    Route("update_ems_service", "PUT", "/ems/service"),
+    Route("get_ems_service", "GET", "/ems/service"),
+    Route(
+        "delete_ems_service",
+        "DELETE",
+        "/ems/service",
+        query=(
+            ("device-name", "device_name"),
+            ("ont-id", "ont_id"),
+            ("ont-port-id", "ont_port_id"),
+            ("service-name", "service_name"),
+        ),
+        group=(
+            "/ems/service?device-name={device_name}&ont-id=[ont_id]"
+            "&ont-port-id=[ont_port_id]&service-name=[service]"
+        ),
+    ),
+    Route(
+        "update_ems_service_device_activation",
+        "PUT",
+        "/ems/service/device/{device_name}/ont/{ont_id}/port/{ont_port_id}"
+        "/vlan/{vlan_id}",
+        query=(("cTag", "c_tag"), ("action", "action")),
+        group=(
+            "/ems/service/device/{device_name}/ont/[ont_id]/port/[ont_port_id]"
+            "/vlan/[vlan_id]?cTag=[c_tag]&action=[action]"
+        ),
+    ),
+    # ----- Service templates ----- #
+    Route("create_config_service_template", "POST", "/config/service-template"),
+    Route("get_config_service_template", "GET", "/config/service-template/{name}"),
+    Route(
+        "delete_config_service_template", "DELETE", "/config/service-template/{name}"
+    ),
+]
+
+# Profile operation suffix: (EMS profile path, sync path, device profile path)
+# None when SMx has no such endpoint for the profile
+PROFILES = {
+    "dhcp_v4_server_pool": (
+        "dhcp-v4-server-pool",
+        "dhcp-v4-server-pool",
+        "dhcp-v4-server-pool",
+    ),
+    "dhcp_v4_server_profile": (
+        "dhcp-v4-server-profile",
+        "dhcp-v4-server-profile",
+        "dhcp-v4-server-profile",
+    ),
+    "dhcp_v6_server_pool": (
+        "dhcp-v6-server-pool",
+        "dhcp-v6-server-pool",
+        "dhcp-v6-server-pool",
+    ),
+    "dhcp_v6_server_profile": (
+        "dhcp-v6-server-profile",
+        "dhcp-v6-server-profile",
+        "dhcp-v6-server-profile",
+    ),
+    "class_map": ("class-map", "class-map", "classMap-ip"),
+    "class_map_ip": (None, "classMap-ip", None),
+    "policy_map": ("policy-map", "policy-map", "policy-map"),
+    "control_policy": ("control-policy", "control-policy", "control-policy"),
+    "sip_profile": ("sip-profile", "sip-profile", "sip-profile"),
+}
+
+for suffix, (ems_path, sync_path, device_path) in PROFILES.items():
+    if ems_path is not None:
+        ROUTES.append(
+            Route(f"create_ems_profile_{suffix}", "POST", f"/ems/profile/{ems_path}")
+        )
+        ROUTES.append(
+            Route(
+                f"delete_ems_profile_{suffix}",
+                "DELETE",
+                f"/ems/profile/{ems_path}/{{name}}",
+            )
+        )
+    if sync_path is not None:
+        ROUTES.append(
+            Route(
+                f"create_config_profile_sync_{suffix}_to_device",
+                "POST",
+                f"/config/profile/sync/{sync_path}/{{name}}",
+            )
+        )
+    if device_path is not None:
+        ROUTES.append(
+            Route(
+                f"delete_config_device_{suffix}",
+                "DELETE",
+                f"/config/device/{{device_name}}/{device_path}/{{name}}",
+            )
+        )
+
+COMPILED_ROUTES: Dict[str, CompiledRoute] = {
+    route.operation: CompiledRoute(route) for route in ROUTES
+}
+
+
+_renderers: Dict[str, Dict[str, Callable[[dict], tuple]]] = {}
+
+
+def _bound_routes(rooturl: str) -> Dict[str, Callable[[dict], tuple]]:
+    """Return the renderers of the routes bound to a root url, shared by
+    the registries of the root
+    """
+    renderers = _renderers.get(rooturl)
+    if renderers is None:
+        renderers = _renderers[rooturl] = {
+            operation: compiled.bind(rooturl)
+            for operation, compiled in COMPILED_ROUTES.items()
+        }
+    return renderers
+
+
+class RouteRegistry:
+    """Compiled routes bound to a root url"""
+
+    def __init__(self, rooturl: str):
+        self.rooturl = rooturl
+        self.renderers = _bound_routes(rooturl)
+
+    def method(self, operation: str) -> str:
+        """Return HTTP method of an operation"""
+        return COMPILED_ROUTES[operation].method
+
+    def template(self, operation: str) -> str:
+        """Return path and query template of an operation"""
+        return COMPILED_ROUTES[operation].template
+
+    def resolve(self, operation: str, values: dict) -> Tuple[str, str, Optional[str]]:
+        """Return (HTTP method, fully qualified url, group name) of an
+        operation.  Group name is None when the route has no group template.
+        """
+        return self.renderers[operation](values)
+
+    def url(self, operation: str, **values) -> str:
+        """Return fully qualified url of an operation"""
+        return self.resolve(operation, values)[1]
@@ -0,0 +1,159 @@
+"""
+Deterministic test data sharding across Locust workers.
+
+In distributed mode every worker loads the whole test data, so two workers
+can hand out the same ONT, VLAN or device.  A Shard (worker index, worker
+count) selects the items of a worker: round robin by position after removing
+duplicate keys (first occurrence kept), so shards are balanced, disjoint and
+identical on every run.  The test data models take the shard as validation
+context and only validate the items of their shard:
+
+    validate_test_data(params, shard=smxshard.current(environment))
+
+The shard of a process is, in order:
+
+    * SMX_SHARD_INDEX / SMX_SHARD_COUNT environment variables, for workers
+      started by a deployment knowing their ordinal (e.g. Kubernetes)
+    * the rank of the worker among the connected workers and the worker
+      count, sent by the master at test start (register from the locustfile
+      init event).  Test data is then validated in a test_start listener of
+      the worker.  The Locust worker index is not used: it only grows, a
+      restarted or late worker gets an index past the worker count
+    * Shard(0, 1), the whole test data
+"""
+
+import os
+from typing import Any, Callable, Hashable, NamedTuple, Optional, Sequence
+
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.errors import ToolboxError
+
+LOGGER = getlogger(__name__)
+
+# Master to worker message of the worker rank and count
+SHARD_MESSAGE = "smx_shard"
+
+_cluster = {"index": None, "count": None}
+
+
+class ShardError(ToolboxError):
+    """Test data shard error"""
+
+    pass
+
+
+class Shard(NamedTuple):
+    """Worker index and worker count"""
+
+    index: int
+    count: int
+
+    def take(self, items: Sequence) -> list:
+        """Return the items of this shard"""
+        return list(items[self.index :: self.count])
+
+
+def unique(items: Sequence, key: Callable[[Any], Hashable] = None) -> list:
+    """Return items without duplicate keys, first occurrence kept"""
+    if key is None:
+        return list(dict.fromkeys(items))
+    seen = set()
+    result = []
+    for item in items:
+        item_key = key(item)
+        if item_key not in seen:
+            seen.add(item_key)
+            result.append(item)
+    return result
+
+
+def context_shard(info) -> Optional[Shard]:
+    """Return the shard of a pydantic validation context, None for all"""
+    context = info.context or {}
+    return context.get("shard")
+
+
+def shard_items(items, info, key: str = None, wrap: bool = False):
+    """Return the raw items of the validation context shard (pydantic before
+    validator helper).  Items are deduplicated by their key field first.
+    With wrap a shard left empty gets one item (index modulo item count),
+    for read only data such as device pools smaller than the worker count.
+    """
+    shard = context_shard(info)
+    if shard is None or not isinstance(items, list):
+        return items
+    if key is not None:
+        items = unique(items, lambda item: _key(item, key))
+    selected = shard.take(items)
+    if not selected and wrap and items:
+        selected = [items[shard.index % len(items)]]
+    return selected
+
+
+def _key(item, key: str) -> Hashable:
+    """Return the key of a raw dict item, the item itself when not a dict"""
+    if isinstance(item, dict):
+        return item.get(key)
+    return getattr(item, key, item)
+
+
+def current(environment=None) -> Shard:
+    """Return the shard of this process"""
+    count = os.environ.get("SMX_SHARD_COUNT")
+    if count is not None:
+        try:
+            shard = Shard(int(os.environ.get("SMX_SHARD_INDEX", "0")), int(count))
+        except ValueError:
+            raise ShardError(
+                f"SMX_SHARD_INDEX / SMX_SHARD_COUNT invalid: "
+                f"{os.environ.get('SMX_SHARD_INDEX')} / {count}"
+            ) from None
+    else:
+        # locust monkey patches the process with gevent, imported here only
+        # so the offline tools importing the test data models stay unpatched
+        from locust.runners import WorkerRunner
+
+        runner = getattr(environment, "runner", None)
+        if isinstance(runner, WorkerRunner) and _cluster["count"]:
+            shard = Shard(_cluster["index"], _cluster["count"])
+        else:
+            shard = Shard(0, 1)
+    if not 0 <= shard.index < shard.count:
+        raise ShardError(f"Shard index {shard.index} not in count {shard.count}")
+    return shard
+
+
+def register(environment):
+    """Send each worker its rank among the connected workers and the worker
+    count at test start.  Call from the locustfile init event.
+    """
+    from locust.runners import MasterRunner, WorkerRunner
+
+    runner = environment.runner
+    if isinstance(runner, WorkerRunner):
+
+        def on_shard(msg, **kwargs):
+            _cluster["index"] = msg.data["index"]
+            _cluster["count"] = msg.data["count"]
+            LOGGER.info(f"Test data shard {current(environment)}")
+
+        runner.register_message(SHARD_MESSAGE, on_shard)
+    elif isinstance(runner, MasterRunner):
+
+        def on_test_start(environment, **kwargs):
+            clients = runner.clients
+            workers = sorted(
+                (
+                    client.id
+                    for client in clients.ready + clients.spawning + clients.running
+                ),
+                key=runner.get_worker_index,
+            )
+            for index, client_id in enumerate(workers):
+                runner.send_message(
+                    SHARD_MESSAGE,
+                    {"index": index, "count": len(workers)},
+                    client_id=client_id,
+                )
+
+        environment.events.test_start.add_listener(on_test_start)
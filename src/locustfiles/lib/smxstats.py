@@ -0,0 +1,179 @@
+"""
+Bounded-cardinality Locust request statistics.
+
+With group_requests off every ONT ID, VLAN ID and subscriber gets its own
+Locust stats entry, so on a soak run the stats tables, the worker to master
+reports and the web UI grow with the number of unique IDs exercised.
+
+StatsNameLimiter keeps an exact stats entry for at most max_names request
+names, the most frequently requested ones, and folds every other request
+into the group name of its route (see smxroutes), e.g.
+/config/device/olt1/vlan/[vlan_id].  Locust stats entries keep the response
+times as a rounded histogram, so folding an entry into its bucket with
+StatsEntry.extend keeps the bucket percentiles exact to that rounding.
+
+Request frequencies are tracked in a fixed size counter table
+(sketch_size names).  The table is rebalanced every rebalance_every
+requests: counts are halved so the top names follow the current load,
+names counted once are dropped to make room, exact names that fell out of
+the top max_names are folded into their bucket and the top names not yet
+exact are promoted.  Between rebalances a request costs two dict lookups.
+
+A worker tells the master which of its names are exact, the master folds
+its own least requested exact names when more than max_names are reported
+so the master tables stay bounded as well.  Both sides are set up by
+register from the locustfile init event:
+
+    @events.init.add_listener
+    def on_locust_init(environment, **kwargs):
+        register(environment, global_test_data.stats_max_names)
+"""
+
+import heapq
+import weakref
+from typing import Dict, Optional
+
+from locust.runners import MasterRunner, WorkerRunner
+from locust.stats import RequestStats, StatsError
+
+from locustfiles.lib.base_logger import getlogger
+
+LOGGER = getlogger(__name__)
+
+# Worker report key of the {exact name: bucket} of the reported entries
+REPORT_KEY = "smx_stats_buckets"
+
+
+class StatsNameLimiter:
+    """Choose the Locust stats name of a request within max_names exact names"""
+
+    def __init__(
+        self,
+        max_names: int,
+        sketch_size: int = None,
+        rebalance_every: int = 10000,
+    ):
+        self.max_names = max_names
+        self.sketch_size = sketch_size or max_names * 8
+        self.rebalance_every = rebalance_every
+        self.counts: Dict[str, int] = {}  # name: decayed request count
+        self.buckets: Dict[str, str] = {}  # name: bucket of counted names
+        self.exact: Dict[str, str] = {}  # exact name: bucket
+        self.countdown = rebalance_every
+        self.stats: Optional[RequestStats] = None
+        self.folded = 0  # exact names folded into their bucket
+
+    def name(self, name: str, bucket: str) -> str:
+        """Return the stats name of a request, name itself or its bucket"""
+        count = self.counts.get(name)
+        if count is not None:
+            self.counts[name] = count + 1
+        elif len(self.counts) < self.sketch_size:
+            self.counts[name] = 1
+            self.buckets[name] = bucket
+        self.countdown -= 1
+        if not self.countdown:
+            self.rebalance()
+        if name in self.exact:
+            return name
+        if len(self.exact) < self.max_names and name in self.counts:
+            self.exact[name] = bucket
+            return name
+        return bucket
+
+    def rebalance(self):
+        """Decay the counts and swap exact names out of the top max_names
+        for the top names folded so far.
+        """
+        self.countdown = self.rebalance_every
+        counts = self.counts
+        top = heapq.nlargest(self.max_names, counts, key=counts.get)
+        self.counts = {name: count // 2 for name, count in counts.items() if count > 1}
+        self.buckets = {name: self.buckets[name] for name in self.counts}
+        demoted = [name for name in self.exact if name not in self.counts]
+        top = set(top)
+        demoted += [
+            name for name in self.exact if name not in top and name in self.counts
+        ]
+        if self.stats is not None:
+            fold(self.stats, {name: self.exact[name] for name in demoted})
+        for name in demoted:
+            del self.exact[name]
+        self.folded += len(demoted)
+        for name in top:
+            if len(self.exact) >= self.max_names:
+                break
+            if name in self.counts:
+                self.exact[name] = self.buckets[name]
+
+    def compact(self, stats: RequestStats, reported: Dict[str, str]):
+        """Fold the least requested reported exact names over max_names
+        into their bucket (master side).
+        """
+        self.exact.update(reported)
+        excess = len(self.exact) - self.max_names
+        if excess <= 0:
+            return
+        request_counts = {}
+        for (name, _), entry in stats.entries.items():
+            if name in self.exact:
+                request_counts[name] = request_counts.get(name, 0) + entry.num_requests
+        demoted = heapq.nsmallest(
+            excess, self.exact, key=lambda name: request_counts.get(name, 0)
+        )
+        fold(stats, {name: self.exact.pop(name) for name in demoted})
+        self.folded += len(demoted)
+
+
+def fold(stats: RequestStats, buckets: Dict[str, str]):
+    """Merge the stats entries and errors of names into their bucket"""
+    if not buckets:
+        return
+    for key in [key for key in stats.entries if key[0] in buckets]:
+        entry = stats.entries.pop(key)
+        if entry.num_requests or entry.num_failures:
+            stats.entries[(buckets[key[0]], key[1])].extend(entry)
+    for key in [key for key, error in stats.errors.items() if error.name in buckets]:
+        error = stats.errors.pop(key)
+        error.name = buckets[error.name]
+        key = StatsError.create_key(error.method, error.name, error.error)
+        if key in stats.errors:
+            stats.errors[key].occurrences += error.occurrences
+        else:
+            stats.errors[key] = error
+
+
+_limiters = weakref.WeakKeyDictionary()
+
+
+def register(environment, max_names: int) -> Optional[StatsNameLimiter]:
+    """Return the stats name limiter of a Locust environment, set up on
+    first call.  None when max_names is 0 (unbounded stats).
+    """
+    if not max_names:
+        return None
+    limiter = _limiters.get(environment)
+    if limiter is not None:
+        return limiter
+    limiter = _limiters[environment] = StatsNameLimiter(max_names)
+    runner = environment.runner
+    if isinstance(runner, MasterRunner):
+
+        def on_worker_report(client_id, data):
+            limiter.compact(environment.stats, data.get(REPORT_KEY, {}))
+
+        environment.events.worker_report.add_listener(on_worker_report)
+    else:
+        limiter.stats = environment.stats
+    if isinstance(runner, WorkerRunner):
+
+        def on_report_to_master(client_id, data):
+            data[REPORT_KEY] = {
+                entry["name"]: limiter.exact[entry["name"]]
+                for entry in data.get("stats", [])
+                if entry["name"] in limiter.exact
+            }
+
+        environment.events.report_to_master.add_listener(on_report_to_master)
+    LOGGER.info(f"Request stats limited to {max_names} exact names")
+    return limiter
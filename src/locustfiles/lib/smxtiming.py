@@ -0,0 +1,238 @@
+"""
+Connection phase timing of SMx requests.
+
+Splits the response time of a request in:
+
+    * dns       name resolution (new connections only)
+    * connect   TCP connect (new connections only)
+    * tls       TLS handshake (new https connections only)
+    * ttfb      request sent until the response headers are parsed, the SMx
+                server processing time plus one network round trip
+    * download  response body transfer
+
+so SMx server slowness can be told apart from network or TLS overhead on
+the load generator (network_timeout bounds the first three phases,
+connection_timeout the last two).
+
+The phases of the request in progress are kept in a greenlet (or thread)
+local Phases object filled by hooks in the connection layer:
+
+    * Locust FastHttpSession: instrument_fasthttp wraps the geventhttpclient
+      client and connection pool of the session
+    * requests (SmxRequest): TimedHTTPAdapter mounts urllib3 pools of
+      TimedHTTPConnection / TimedHTTPSConnection and sets response.phases
+"""
+
+import socket
+from time import perf_counter
+from typing import Optional
+
+from gevent.local import local
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import (
+    ConnectTimeoutError,
+    NameResolutionError,
+    NewConnectionError,
+)
+from urllib3.util.connection import allowed_gai_family
+
+PHASES = ("dns", "connect", "tls", "ttfb", "download")
+
+_current = local()
+
+
+class Phases:
+    """Phase durations in seconds of one request"""
+
+    __slots__ = PHASES + ("start", "mark", "connected", "headers")
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.mark = self.connected = self.headers = 0.0
+        self.dns = self.connect = self.tls = self.ttfb = self.download = 0.0
+
+    def response_started(self):
+        """Mark the response headers parsed"""
+        self.headers = perf_counter()
+        self.ttfb = self.headers - max(self.start, self.connected)
+
+    def finish(self, end: float = None):
+        """Mark the response body read"""
+        if self.headers:
+            self.download = (end or perf_counter()) - self.headers
+
+    def items(self):
+        """Return (phase, seconds) pairs"""
+        return [(phase, getattr(self, phase)) for phase in PHASES]
+
+
+def begin() -> Phases:
+    """Start the phases of a new request in this greenlet"""
+    phases = _current.phases = Phases()
+    return phases
+
+
+def current() -> Optional[Phases]:
+    """Return the phases of the last request started in this greenlet"""
+    return getattr(_current, "phases", None)
+
+
+# ----- Locust FastHttpSession (geventhttpclient) ----- #
+
+
+def instrument_fasthttp(session):
+    """Time the connection phases of the requests of a FastHttpSession"""
+    clientpool = getattr(getattr(session, "client", None), "clientpool", None)
+    if clientpool is None or getattr(clientpool, "smx_timed", False):
+        return
+    get_client = clientpool.get_client
+
+    def timed_get_client(url):
+        client = get_client(url)
+        if not getattr(client, "smx_timed", False):
+            _time_http_client(client)
+        return client
+
+    clientpool.get_client = timed_get_client
+    clientpool.smx_timed = True
+
+
+def _time_http_client(client):
+    """Wrap the request and connection pool methods of a geventhttpclient
+    HTTPClient.  The pool calls _resolve, then _connect_socket which calls
+    _setup_proxy right after the TCP connect and before the TLS handshake.
+    """
+    request = client.request
+    pool = client._connection_pool
+    resolve = pool._resolve
+    connect_socket = pool._connect_socket
+    setup_proxy = pool._setup_proxy
+
+    def timed_request(method, request_uri, body=b"", headers=None):
+        phases = begin()
+        response = request(method, request_uri, body=body, headers=headers)
+        phases.response_started()
+        return response
+
+    def timed_resolve():
+        start = perf_counter()
+        try:
+            return resolve()
+        finally:
+            current().dns += perf_counter() - start
+
+    secure = hasattr(pool, "ssl_context")
+
+    def timed_connect_socket(sock, address):
+        phases = current()
+        phases.mark = perf_counter()
+        sock = connect_socket(sock, address)
+        phases.connected = perf_counter()
+        if secure:
+            phases.tls += phases.connected - phases.mark
+        return sock
+
+    def timed_setup_proxy(sock):
+        phases = current()
+        now = perf_counter()
+        phases.connect += now - phases.mark
+        phases.mark = now
+        return setup_proxy(sock)
+
+    client.request = timed_request
+    pool._resolve = timed_resolve
+    pool._connect_socket = timed_connect_socket
+    pool._setup_proxy = timed_setup_proxy
+    client.smx_timed = True
+
+
+# ----- requests (urllib3) ----- #
+
+
+class TimedConnectionMixin:
+    """urllib3 connection recording its phases in the current Phases"""
+
+    def _new_conn(self) -> socket.socket:
+        phases = current() or begin()
+        start = perf_counter()
+        host = self._dns_host
+        try:
+            addresses = socket.getaddrinfo(
+                host.strip("[]"), self.port, allowed_gai_family(), socket.SOCK_STREAM
+            )
+        except socket.gaierror as error:
+            raise NameResolutionError(self.host, self, error) from error
+        resolved = perf_counter()
+        phases.dns += resolved - start
+        # connect to the resolved addresses in order like urllib3, the host
+        # name is kept for TLS
+        error = None
+        try:
+            for address in dict.fromkeys(info[4][0] for info in addresses):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                except ConnectTimeoutError as address_error:  # and NewConnectionError
+                    error = address_error
+                    continue
+                phases.mark = perf_counter()
+                phases.connect += phases.mark - resolved
+                return sock
+        finally:
+            self._dns_host = host
+        phases.connect += perf_counter() - resolved
+        if error is None:
+            raise NewConnectionError(self, "getaddrinfo returns an empty list")
+        raise error
+
+    def connect(self):
+        super().connect()
+        phases = current()
+        if phases is not None:
+            phases.connected = perf_counter()
+            if isinstance(self, HTTPSConnection):
+                phases.tls += phases.connected - phases.mark
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        phases = current()
+        if phases is not None:
+            phases.response_started()
+        return response
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """requests adapter setting response.phases (download is measured by
+    the caller, see Phases.finish)
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, *args, **kwargs):
+        phases = begin()
+        response = super().send(request, *args, **kwargs)
+        response.phases = phases
+        return response
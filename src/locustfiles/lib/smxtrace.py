@@ -0,0 +1,278 @@
+"""
+Per request trace of the SMxFastHTTPUser requests.
+
+Locust CSVs only keep aggregates.  TraceRecorder keeps one row per request
+(start timestamp, method, route template, device, status, latency, response
+bytes, user type and the connection phases of smxtiming when measured) for
+post-mortems of soak runs.
+
+Rows are appended to typed arrays, one per column, and string columns hold
+ids of a string table (dictionary encoding), so a row costs 54 bytes and a
+handful of array appends.  When buffer_size rows are buffered the columns
+are handed over to a writer running in a real OS thread (not a greenlet, so
+disk I/O never blocks the gevent hub) and fresh columns are started.  When
+max_pending batches are already waiting for the writer the batch is dropped
+and counted instead of growing memory or waiting.
+
+File format (one file per worker process, <directory>/smxtrace-<pid>.bin):
+
+    header  MAGIC, byte order ("little"/"big") and a newline
+    block   BLOCK struct (rows, strings length), the JSON list of strings
+            added to the string table since the previous block, then the
+            columns in COLUMNS order, rows values each
+
+Example:
+    for row in iter_rows("traces/smxtrace-1234.bin"):
+        print(row["template"], row["latency_us"])
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+from gevent import monkey
+
+from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.errors import ToolboxError
+
+# Real OS thread, lock and queue even when gevent monkey patched the stdlib
+start_new_thread = monkey.get_original("_thread", "start_new_thread")
+allocate_lock = monkey.get_original("_thread", "allocate_lock")
+SimpleQueue = monkey.get_original("queue", "SimpleQueue")
+
+LOGGER = getlogger(__name__)
+
+MAGIC = b"SMXTRACE2"
+BLOCK = struct.Struct("<II")  # rows, strings length
+
+# (column, array typecode); string columns hold string table ids
+COLUMNS = (
+    ("start", "d"),  # request start, seconds since epoch
+    ("latency_us", "I"),
+    ("bytes", "I"),
+    ("status", "H"),  # 0 when no HTTP response (connection error)
+    ("method", "I"),
+    ("template", "I"),
+    ("device", "I"),
+    ("user", "I"),
+    # connection phases (smxtiming), 0 when not measured
+    ("dns_us", "I"),
+    ("connect_us", "I"),
+    ("tls_us", "I"),
+    ("ttfb_us", "I"),
+    ("download_us", "I"),
+)
+STRING_COLUMNS = ("method", "template", "device", "user")
+
+
+class TraceError(ToolboxError):
+    """Trace file error"""
+
+    pass
+
+
+class TraceRecorder:
+    """Buffered columnar request trace written by a background OS thread"""
+
+    def __init__(self, path: str, buffer_size: int = 8192, max_pending: int = 4):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.max_pending = max_pending
+        self.strings: Dict[str, int] = {"": 0}
+        self.new_strings: List[str] = [""]
+        self.recorded = 0
+        self.dropped = 0
+        self.queued = 0  # batches handed to the writer
+        self.written = 0  # batches written, updated by the writer only
+        self.closed = False
+        self._new_columns()
+        self._queue = SimpleQueue()
+        self._running = allocate_lock()  # held by the writer until it ends
+        self._running.acquire()
+        start_new_thread(self._write, ())
+
+    def _new_columns(self):
+        (
+            self.start,
+            self.latency_us,
+            self.bytes,
+            self.status,
+            self.method,
+            self.template,
+            self.device,
+            self.user,
+            self.dns_us,
+            self.connect_us,
+            self.tls_us,
+            self.ttfb_us,
+            self.download_us,
+        ) = self.columns = [array(typecode) for _, typecode in COLUMNS]
+
+    def string_id(self, value: Optional[str]) -> int:
+        """Return the string table id of value, None is the empty string"""
+        if value is None:
+            return 0
+        string_id = self.strings.get(value)
+        if string_id is None:
+            string_id = self.strings[value] = len(self.strings)
+            self.new_strings.append(value)
+        return string_id
+
+    def record(
+        self,
+        perf_start: float,
+        method: str,
+        template: str,
+        device: Optional[str],
+        status: int,
+        size: int,
+        user: Optional[str],
+        phases=None,
+    ):
+        """Buffer one request started at time.perf_counter() perf_start.
+        phases are the smxtiming.Phases of the request or None.
+        """
+        if self.closed:
+            return
+        latency = time.perf_counter() - perf_start
+        start = time.time() - latency
+        strings = self.strings
+        self.start.append(start)
+        self.latency_us.append(min(int(latency * 1e6), 0xFFFFFFFF))
+        self.bytes.append(min(size, 0xFFFFFFFF))
+        self.status.append(status or 0)
+        self.method.append(strings.get(method) or self.string_id(method))
+        self.template.append(strings.get(template) or self.string_id(template))
+        self.device.append(strings.get(device) or self.string_id(device))
+        self.user.append(strings.get(user) or self.string_id(user))
+        if phases is None:
+            for column in self.columns[-5:]:
+                column.append(0)
+        else:
+            self.dns_us.append(int(phases.dns * 1e6))
+            self.connect_us.append(int(phases.connect * 1e6))
+            self.tls_us.append(int(phases.tls * 1e6))
+            self.ttfb_us.append(int(phases.ttfb * 1e6))
+            self.download_us.append(int(phases.download * 1e6))
+        self.recorded += 1
+        if len(self.start) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered rows to the writer thread, drop them when
+        max_pending batches are already waiting.
+        """
+        rows = len(self.start)
+        if not rows:
+            return
+        if self.queued - self.written >= self.max_pending:
+            self.dropped += rows
+            self._new_columns()
+            return
+        self.queued += 1
+        # strings are kept with the next written block when a batch is dropped
+        strings, self.new_strings = self.new_strings, []
+        self._queue.put((rows, strings, self.columns))
+        self._new_columns()
+
+    def close(self):
+        """Write the buffered rows and wait for the writer to finish"""
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        self._queue.put(None)
+        self._running.acquire()
+        LOGGER.info(
+            f"Request trace {self.path}: {self.recorded - self.dropped} rows "
+            f"written, {self.dropped} dropped"
+        )
+
+    def _write(self):
+        """Writer thread, append blocks until close"""
+        try:
+            self._write_blocks()
+        finally:
+            self._running.release()
+
+    def _write_blocks(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "wb") as outfile:
+            outfile.write(MAGIC + sys.byteorder.encode("ascii") + b"\n")
+            while True:
+                batch = self._queue.get()
+                if batch is None:
+                    return
+                rows, strings, columns = batch
+                encoded = json.dumps(strings).encode("utf8")
+                outfile.write(BLOCK.pack(rows, len(encoded)))
+                outfile.write(encoded)
+                for column in columns:
+                    column.tofile(outfile)
+                outfile.flush()
+                self.written += 1
+
+
+def iter_blocks(path: str) -> Iterator[Dict[str, array]]:
+    """Yield the columns of each block of a trace file.
+    String columns are decoded with the string table in the "strings" key.
+    """
+    strings: List[str] = []
+    with open(path, "rb") as infile:
+        header = infile.readline()
+        if not header.startswith(MAGIC):
+            raise TraceError(f"{path} is not a request trace file")
+        swap = header[len(MAGIC) :].strip().decode("ascii") != sys.byteorder
+        while True:
+            head = infile.read(BLOCK.size)
+            if not head:
+                return
+            if len(head) < BLOCK.size:
+                raise TraceError(f"{path} truncated block header")
+            rows, strings_length = BLOCK.unpack(head)
+            strings.extend(json.loads(infile.read(strings_length)))
+            block = {"strings": strings}
+            for name, typecode in COLUMNS:
+                column = array(typecode)
+                try:
+                    column.fromfile(infile, rows)
+                except EOFError as error:
+                    raise TraceError(f"{path} truncated block: {error}") from None
+                if swap:
+                    column.byteswap()
+                block[name] = column
+            yield block
+
+
+def iter_rows(path: str) -> Iterator[dict]:
+    """Yield the rows of a trace file as dicts with decoded strings"""
+    names = [name for name, _ in COLUMNS]
+    for block in iter_blocks(path):
+        strings = block["strings"]
+        for values in zip(*(block[name] for name in names)):
+            row = dict(zip(names, values))
+            for name in STRING_COLUMNS:
+                row[name] = strings[row[name]]
+            yield row
+
+
+_recorders: Dict[str, TraceRecorder] = {}
+
+
+def register(environment, directory: str) -> TraceRecorder:
+    """Return the trace recorder of this process writing to directory,
+    started on first call and closed when Locust quits.
+    """
+    recorder = _recorders.get(directory)
+    if recorder is None:
+        path = os.path.join(directory, f"smxtrace-{os.getpid()}.bin")
+        recorder = _recorders[directory] = TraceRecorder(path)
+        environment.events.quit.add_listener(lambda exit_code: recorder.close())
+        LOGGER.info(f"Recording request trace to {path}")
+    return recorder
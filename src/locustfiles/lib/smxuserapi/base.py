@@ -2,9 +2,16 @@
 Base class for all SMx API calls to be the parent of all
 customer client classes.
 """
-import json
+
+import time
+from contextlib import nullcontext
+from typing import Union
+
 from locust.contrib.fasthttp import FastResponse
+from locustfiles.lib import smxgate, smxmetrics, smxstats, smxtiming, smxtrace
 from locustfiles.lib.base_logger import getlogger
+from locustfiles.lib.smxpayloads import get_json_encoder, payload_cache
+from locustfiles.lib.smxroutes import RouteRegistry
 
 LOGGER = getlogger(__name__)
 
@@ -20,20 +27,54 @@ class SMxFastHTTPUser:
         port=443,
         group_requests=True,
         log_error_response=False,
+        json_encoder="json",
+        stats_max_names=0,
+        trace_directory=None,
+        connection_phases=False,
+        max_requests_per_device=0,
+        device_lock_directory=None,
     ):
         """
         Initialize the SMx API session.
+        json_encoder selects the request body encoder (json or orjson).
+        stats_max_names bounds the exact stats entries when group_requests is
+        off, other requests are reported under their group name (see smxstats).
+        trace_directory records every request in a trace file (see smxtrace).
+        connection_phases reports the DNS, connect, TLS, time to first byte and
+        download time of every request as types DNS, CONNECT, TLS, TTFB and
+        DOWNLOAD of the harness metrics (see smxtiming and smxmetrics).
+        max_requests_per_device limits the requests in flight per device_name
+        for all users of the worker, or of all workers on the host sharing
+        device_lock_directory.  The queue wait is reported as harness metrics
+        type QUEUE (see smxgate).  Harness metrics are not counted in the
+        Locust request statistics.
         """
         self.rooturl = rooturl
         self.auth = (username, password)
         self.port = port
         self.group_requests = group_requests
         self.log_error_response = log_error_response
+        self.encode = get_json_encoder(json_encoder)
+        self.payloads = payload_cache(json_encoder)
+        self.routes = RouteRegistry(rooturl)
+        self.stats_max_names = stats_max_names
+        self.stats_names = None
+        self.trace_directory = trace_directory
+        self.trace = None
+        self.connection_phases = connection_phases
+        self.observed = trace_directory is not None or connection_phases
+        self.gate = smxgate.register(max_requests_per_device, device_lock_directory)
 
     def get_url(self, route: str) -> str:
         """Return api url"""
         return f"{self.rooturl}{route}"
 
+    def encode_payload(self, data: Union[dict, bytes, str]) -> Union[bytes, str]:
+        """Return request body, bytes and str bodies are sent as is"""
+        if isinstance(data, (bytes, str)):
+            return data
+        return self.encode(data)
+
     def log_tracked_error_response(self, response):
         """Log responses not in the 200 range"""
         if self.log_error_response and not (200 <= response.status_code <= 299):
@@ -41,6 +82,147 @@ class SMxFastHTTPUser:
                 f"Tracked failed response: {response.request.method} {response.url} {response.status_code} {response.text}"
             )
 
+    def check_response(self, response, ignore_status: list = []):
+        """Report statuses in ignore_status as success, log other failures"""
+        if response.status_code in ignore_status:
+            response.success()
+        else:
+            self.log_tracked_error_response(response)
+
+    def client_request(
+        self,
+        client,
+        method: str,
+        url: str,
+        name: str = None,
+        ignore_status: list = [],
+        **kwargs,
+    ) -> FastResponse:
+        """Perform a tracked request on a fully qualified url"""
+        if self.connection_phases:
+            smxtiming.instrument_fasthttp(client)
+        start = time.perf_counter()
+        with client.request(
+            method,
+            url,
+            name=name,
+            auth=self.auth,
+            catch_response=True,
+            **kwargs,
+        ) as response:
+            if self.observed:
+                template = (name or url).removeprefix(self.rooturl)
+                self.observe(
+                    client, start, method, name or url, template, None, response
+                )
+            self.check_response(response, ignore_status)
+            return response
+
+    def client_call(
+        self,
+        client,
+        operation: str,
+        params: dict = None,
+        data: Union[dict, bytes, str] = None,
+        ignore_status: list = [],
+        **values,
+    ) -> FastResponse:
+        """Perform the request of a registered route (see smxroutes).
+        values are the route template fields, the stats group name of the
+        route is used when group_requests is set.
+        """
+        method, url, group_name = self.routes.resolve(operation, values)
+        if self.group_requests:
+            name = group_name
+        elif self.stats_max_names and group_name is not None:
+            name = self.stats_name(client, url, group_name)
+        else:
+            name = None
+        if data is not None and not isinstance(data, (bytes, str)):
+            data = self.encode(data)
+        device_name = values.get("device_name")
+        if self.gate is None or device_name is None:
+            gate = nullcontext()
+        else:
+            gate = self.gate.hold(device_name)
+        with gate as wait:
+            if wait is not None:
+                self.report_queue_wait(client, name or url, wait)
+            if self.connection_phases:
+                smxtiming.instrument_fasthttp(client)
+            start = time.perf_counter()
+            with client.request(
+                method,
+                url,
+                name=name,
+                data=data,
+                params=params,
+                auth=self.auth,
+                catch_response=True,
+            ) as response:
+                if self.observed:
+                    self.observe(
+                        client,
+                        start,
+                        method,
+                        name or url,
+                        self.routes.template(operation),
+                        device_name,
+                        response,
+                    )
+                self.check_response(response, ignore_status)
+                return response
+
+    def observe(
+        self, client, start: float, method, name, template, device_name, response
+    ):
+        """Report the connection phases and record the trace of a request
+        started at perf_counter start.
+        """
+        phases = None
+        if self.connection_phases:
+            phases = smxtiming.current()
+            if phases is None or phases.start < start:
+                phases = None  # request did not reach the connection layer
+            else:
+                phases.finish()
+                self.report_phases(client, name, phases)
+        if self.trace_directory is not None:
+            if self.trace is None:
+                self.trace = smxtrace.register(client.environment, self.trace_directory)
+            user = getattr(client, "user", None)
+            self.trace.record(
+                start,
+                method,
+                template,
+                device_name,
+                response.status_code,
+                len(response.content or b""),
+                None if user is None else type(user).__name__,
+                phases,
+            )
+
+    def report_phases(self, client, name: str, phases: smxtiming.Phases):
+        """Record the connection phases in the harness metrics.
+        DNS, connect and TLS are only reported for new connections.
+        """
+        record = smxmetrics.register(client.environment).record
+        for phase, seconds in phases.items():
+            if seconds or phase in ("ttfb", "download"):
+                record(phase.upper(), name, seconds)
+
+    def report_queue_wait(self, client, name: str, seconds: float):
+        """Record the device gate wait in the harness metrics (QUEUE)"""
+        smxmetrics.register(client.environment).record("QUEUE", name, seconds)
+
+    def stats_name(self, client, url: str, group_name: str) -> str:
+        """Return the bounded stats name of a request (url or group name)"""
+        if self.stats_names is None:
+            self.stats_names = smxstats.register(
+                client.environment, self.stats_max_names
+            )
+        return self.stats_names.name(url, group_name)
+
     def client_get(
         self,
         client,
@@ -50,73 +232,60 @@ class SMxFastHTTPUser:
         group_name: str = None,
     ) -> FastResponse:
         """Perform client get request"""
-        url = self.get_url(route)
         if group_name is not None:
             group_name = self.get_url(group_name)
-        with client.get(
-            url,
+        return self.client_request(
+            client,
+            "GET",
+            self.get_url(route),
             name=group_name,
-            auth=self.auth,
+            ignore_status=ignore_status,
             params=params,
-            catch_response=True,
-        ) as response:
-            if response.status_code in ignore_status:
-                response.success()
-            else:
-                self.log_tracked_error_response(response)
-            return response
+        )
 
     def client_post(
         self,
         client,
         route: str,
-        data: dict = {},
+        data: Union[dict, bytes, str] = {},
         ignore_status: list = [],
         group_name: str = None,
     ) -> FastResponse:
-        """Perform client post request"""
-        url = self.get_url(route)
+        """Perform client post request.
+        data is encoded as JSON unless already an encoded bytes or str body.
+        """
         if group_name is not None:
             group_name = self.get_url(group_name)
-        payload = json.dumps(data)
-        with client.post(
-            url,
+        return self.client_request(
+            client,
+            "POST",
+            self.get_url(route),
             name=group_name,
-            auth=self.auth,
-            data=payload,
-            catch_response=True,
-        ) as response:
-            if response.status_code in ignore_status:
-                response.success()
-            else:
-                self.log_tracked_error_response(response)
-            return response
+            ignore_status=ignore_status,
+            data=self.encode_payload(data),
+        )
 
     def client_put(
         self,
         client,
         route: str,
-        data: dict = {},
+        data: Union[dict, bytes, str] = {},
         ignore_status: list = [],
         group_name: str = None,
     ) -> FastResponse:
-        """Perform client put request"""
-        url = self.get_url(route)
+        """Perform client put request.
+        data is encoded as JSON unless already an encoded bytes or str body.
+        """
         if group_name is not None:
             group_name = self.get_url(group_name)
-        payload = json.dumps(data)
-        with client.put(
-            url,
+        return self.client_request(
+            client,
+            "PUT",
+            self.get_url(route),
             name=group_name,
-            auth=self.auth,
-            data=payload,
-            catch_response=True,
-        ) as response:
-            if response.status_code in ignore_status:
-                response.success()
-            else:
-                self.log_tracked_error_response(response)
-            return response
+            ignore_status=ignore_status,
+            data=self.encode_payload(data),
+        )
 
     def client_delete(
         self,
@@ -126,17 +295,12 @@ class SMxFastHTTPUser:
         group_name: str = None,
     ) -> FastResponse:
         """Perform client delete request"""
-        url = self.get_url(route)
         if group_name is not None:
             group_name = self.get_url(group_name)
-        with client.delete(
-            url,
+        return self.client_request(
+            client,
+            "DELETE",
+            self.get_url(route),
             name=group_name,
-            auth=self.auth,
-            catch_response=True,
-        ) as response:
-            if response.status_code in ignore_status:
-                response.success()
-            else:
-                self.log_tracked_error_response(response)
-            return response
+            ignore_status=ignore_status,
+        )
@@ -5,18 +5,12 @@ Eventually it may make sense further modularize the API calls
 as the class grows.
 """
 
-import locustfiles.lib.smxuserapi.base as Base
-
+from typing import Union
 
-def get_ont_serial_number(vendor_id, serial_number):
-    """Return ONT serial number"""
-    if vendor_id.upper() == "CXNK" and len(serial_number) < 12:
-        serial_number = (
-            vendor_id
-            + ("0" * (12 - len(vendor_id) - len(serial_number)))
-            + serial_number
-        )
-    return serial_number
+import locustfiles.lib.smxuserapi.base as Base
+from locustfiles.lib.jsonstream import loads_records
+from locustfiles.lib.pagination import iter_pages
+from locustfiles.lib.smxpayloads import get_ont_serial_number
 
 
 class SMxFastHTTPUser(Base.SMxFastHTTPUser):
@@ -26,17 +20,21 @@ class SMxFastHTTPUser(Base.SMxFastHTTPUser):
 
     def create_config_device_vlan(self, client, device_name: str, configuration: dict):
         """Create a VLAN"""
-        route = f"/config/device/{device_name}/vlan"
-        return self.client_post(client, route, data=configuration)
+        return self.client_call(
+            client,
+            "create_config_device_vlan",
+            data=configuration,
+            device_name=device_name,
+        )
 
     def read_config_device_vlan(self, client, device_name: str, vlan_id: int):
         """ "Read VLAN"""
-        route = f"/config/device/{device_name}/vlan/{vlan_id}"
-        if self.group_requests:
-            group_name = f"/config/device/{device_name}/vlan/[vlan_id]"
-        else:
-            group_name = None
-        return self.client_get(client, route, group_name=group_name)
+        return self.client_call(
+            client,
+            "read_config_device_vlan",
+            device_name=device_name,
+            vlan_id=vlan_id,
+        )
 
     def update_config_device_vlan(
         self,
@@ -48,52 +46,80 @@ class SMxFastHTTPUser(Base.SMxFastHTTPUser):
         Note that this is a PUT vs a PATCH requiring all fields
         including the modified field.
         """
-        route = f"/config/device/{device_name}/vlan"
-        return self.client_put(client, route, data=configuration)
+        return self.client_call(
+            client,
+            "update_config_device_vlan",
+            data=configuration,
+            device_name=device_name,
+        )
 
     def delete_config_device_vlan(self, client, device_name: str, vlan_id: int):
         """Delete VLAN"""
-        route = f"/config/device/{device_name}/vlan/{vlan_id}"
-        if self.group_requests:
-            group_name = f"/config/device/{device_name}/vlan/[vlan_id]"
-        else:
-            group_name = None
-        return self.client_delete(client, route, group_name=group_name)
+        return self.client_call(
+            client,
+            "delete_config_device_vlan",
+            device_name=device_name,
+            vlan_id=vlan_id,
+        )
 
     # ----- Device CRUD ----- #
 
     def get_config_device_state(self, client, device_name: str):
         """Get OLT state"""
-        route = f"/config/device/{device_name}"
         fields = ("state",)
         params = {
             "fields": ",".join(fields),
         }
-        return self.client_get(client, route, params)
+        return self.client_call(
+            client, "get_config_device_state", params, device_name=device_name
+        )
 
     # ----- ONT CRUD ----- #
 
     def create_config_device_ont(
-        self, client, device_name: str, vendor_id: str, configuration: dict
+        self,
+        client,
+        device_name: str,
+        vendor_id: str,
+        configuration: Union[dict, bytes],
     ):
-        """Create ont"""
-        route = f"/config/device/{device_name}/ont"
-        configuration["serial-number"] = get_ont_serial_number(
-            vendor_id, configuration["serial-number"]
+        """Create ont.
+        A dict configuration is not modified, an encoded configuration (see
+        create_config_device_ont_record) is sent as is.
+        """
+        if isinstance(configuration, dict):
+            serial_number = get_ont_serial_number(
+                vendor_id, configuration["serial-number"]
+            )
+            if serial_number != configuration["serial-number"]:
+                configuration = {**configuration, "serial-number": serial_number}
+        return self.client_call(
+            client,
+            "create_config_device_ont",
+            data=configuration,
+            device_name=device_name,
+        )
+
+    def create_config_device_ont_record(self, client, device_name: str, ont):
+        """Create ont from an ONT config model with the cached encoded body"""
+        return self.client_call(
+            client,
+            "create_config_device_ont",
+            data=self.payloads.ont(ont),
+            device_name=device_name,
         )
-        return self.client_post(client, route, data=configuration)
 
     def delete_config_device_ont(
         self, client, device_name: str, ont_id: str, forced_delete="false"
     ):
         """Delete ONT by ont_id"""
-
-        route = f"/config/device/{device_name}/ont?ont-id={ont_id}&force-delete={forced_delete}"
-        if self.group_requests:
-            group_name = f"/config/device/{device_name}/ont/[ont_id]"
-        else:
-            group_name = None
-        return self.client_delete(client, route, group_name=group_name)
+        return self.client_call(
+            client,
+            "delete_config_device_ont",
+            device_name=device_name,
+            ont_id=ont_id,
+            forced_delete=forced_delete,
+        )
 
     # ----- Subscriber CRUD ----- #
 
@@ -101,44 +127,52 @@ class SMxFastHTTPUser(Base.SMxFastHTTPUser):
         """Create a basic subscriber.
         Only the account name and customer ID are required.
         """
-        route = f"/ems/subscriber"
-        return self.client_post(client, route, data=configuration)
+        return self.client_call(client, "create_ems_subscriber", data=configuration)
 
     def delete_ems_subscriber(
         self, client, account_id: str, org_id: str, forced: bool = False
     ):
         """Delete subscriber"""
-        forced_str = "true" if forced else "false"
-        route = f"/ems/subscriber/org/{org_id}/account/{account_id}?force-delete={forced_str}"
-        if self.group_requests:
-            group_name = f"/ems/subscriber/org/{org_id}/account/[account_id]"
-        else:
-            group_name = None
-        return self.client_delete(client, route, group_name=group_name)
+        return self.client_call(
+            client,
+            "delete_ems_subscriber",
+            org_id=org_id,
+            account_name=account_id,
+            forced_delete="true" if forced else "false",
+        )
 
     # ----- Subscriber Service CRUD ----- #
 
     def create_ems_service(self, client, configuration: dict):
         """Create a subscriber service"""
+        return self.client_call(client, "create_ems_service", data=configuration)
 
-        route = "/ems/service"
-        return self.client_post(client, route, data=configuration)
+    def create_ems_service_record(self, client, device_name: str, ont_id: str, service):
+        """Create subscriber service from a service model with the cached
+        encoded body
+        """
+        return self.client_call(
+            client,
+            "create_ems_service",
+            data=self.payloads.service(device_name, ont_id, service),
+        )
 
     def delete_ems_service(
         self, client, device_name: str, service_name: str, ont_id: str, ont_port_id: str
     ):
         """Delete subscriber service by service name"""
-        route = f"/ems/service?device-name={device_name}&ont-id={ont_id}&ont-port-id={ont_port_id}&service-name={service_name}"
-        if self.group_requests:
-            group_name = f"/ems/service?device-name={device_name}&ont-id=[ont_id]&ont-port-id=[ont_port_id]&service-name=[service]"
-        else:
-            group_name = None
-        return self.client_delete(client, route, group_name=group_name)
+        return self.client_call(
+            client,
+            "delete_ems_service",
+            device_name=device_name,
+            ont_id=ont_id,
+            ont_port_id=ont_port_id,
+            service_name=service_name,
+        )
 
     def update_subscriber_service(self, client, configuration: dict):
         """Update a subscriber data service"""
-        route = "/ems/service"
-        return self.client_put(client, route, configuration)
+        return self.client_call(client, "update_ems_service", data=configuration)
 
     def update_ems_service_device_activation(
         self,
@@ -151,9 +185,17 @@ class SMxFastHTTPUser(Base.SMxFastHTTPUser):
         action: str,
     ):
         """Update a subscriber service as 'activate' or 'deactivate' using 'pause' or 'resume' action"""
-        # TODO string too long, need to refactor
-        route = f"/ems/service/device/{device_name}/ont/{ont_id}/port/{ont_port_id}/vlan/{vlan_id}?cTag={cTag}&action={action}"
-        return self.client_put(client, route)
+        return self.client_call(
+            client,
+            "update_ems_service_device_activation",
+            data={},
+            device_name=device_name,
+            ont_id=ont_id,
+            ont_port_id=ont_port_id,
+            vlan_id=vlan_id,
+            c_tag=cTag,
+            action=action,
+        )
 
     # ----- Added for Cox Fetch Specific ----- #
 
@@ -161,24 +203,45 @@ class SMxFastHTTPUser(Base.SMxFastHTTPUser):
         self, client, device_name: str, fields: dict = {}, offset=0, limit=20
     ):
         """Get ONT info stored in SMx database"""
-        route = f"/config/device/{device_name}/gui/ont"
         params = {
             "fields": ",".join(fields),
             "offset": offset,
             "limit": limit,
         }
-        return self.client_get(client, route, params)
+        return self.client_call(
+            client, "get_config_device_gui_ont", params, device_name=device_name
+        )
+
+    def iter_config_device_gui_onts(
+        self, client, device_name: str, fields: dict = {}, limit=20, **page_options
+    ):
+        """Yield ONT info stored in SMx database across all pages.
+        Each page is a tracked request, a failed page ends the iteration.
+        Pages are decoded from bytes keeping only fields.
+        page_options are passed to iter_pages.
+        """
+
+        def fetch_page(offset, limit):
+            response = self.get_config_device_gui_onts(
+                client, device_name, fields, offset=offset, limit=limit
+            )
+            if not (200 <= response.status_code <= 299):
+                return []
+            return loads_records(response.content, fields)
+
+        return iter_pages(fetch_page, limit, **page_options)
 
     def get_config_device_ont(
         self, client, device_name: str, ont_id: int, fields: dict = {}
     ):
         """Get ONT info from SMx database - not contacting the actual OLT to get ONTs"""
-        route = f"/config/device/{device_name}/ont"
         params = {
             "ont-id": ont_id,
             "fields": ",".join(fields),
         }
-        return self.client_get(client, route, params)
+        return self.client_call(
+            client, "get_config_device_ont", params, device_name=device_name
+        )
 
     def get_config_device_ontport(
         self, client, device_name: str, ont_id: int, fields: dict = {}
@@ -186,12 +249,13 @@ class SMxFastHTTPUser(Base.SMxFastHTTPUser):
         """Get ONT port info
         Undiscoverd ONT returns more info than in query string - not sure if correct
         """
-        route = f"/config/device/{device_name}/ontport"
         params = {
             "ont-id": ont_id,
             "fields": ",".join(fields),
         }
-        return self.client_get(client, route, params)
+        return self.client_call(
+            client, "get_config_device_ontport", params, device_name=device_name
+        )
 
     def get_performance_device_ont(
         self,
@@ -202,25 +266,25 @@ class SMxFastHTTPUser(Base.SMxFastHTTPUser):
         fields: dict = {},
     ):
         """Get real time status for an ONT"""
-        route = f"/performance/device/{device_name}/ont/{ont_id}/status"
         params = {
             "refresh": refresh,
             "fields": ",".join(fields),
         }
-        if self.group_requests:
-            group_name = f"/performance/device/{device_name}/ont/[ont_id]/status"
-        else:
-            group_name = None
-        return self.client_get(client, route, params, group_name=group_name)
+        return self.client_call(
+            client,
+            "get_performance_device_ont",
+            params,
+            device_name=device_name,
+            ont_id=ont_id,
+        )
 
     def get_ems_service_ont(
         self, client, device_name: str, ont_id: int, fields: dict = {}
     ):
         """Get ONT service info"""
-        route = f"/ems/service"
         params = {
             "device-name": device_name,
             "ont-id": ont_id,
             "fields": ",".join(fields),
         }
-        return self.client_get(client, route, params)
+        return self.client_call(client, "get_ems_service", params)
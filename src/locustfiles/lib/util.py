@@ -3,8 +3,12 @@ The intent of this module is to be a collection of miscellaneous
 utility functions used by the app.
 """
 import sys
+from typing import Sequence
+
 import yaml
 
+from locustfiles.lib import yamlstream
+
 
 def _load_yaml_file(cfgfilename: str) -> object:
     """Read in YAML data and return dictionary"""
@@ -27,10 +31,18 @@ def get_device_config(devicefile: str, devicename: str) -> dict:
     return devices[devicename]
 
 
-def load_test_params(paramsfile: str) -> dict:
-    """Return test configuration parameters"""
+def load_test_params(paramsfile: str, skip: Sequence[str] = ()) -> dict:
+    """Return test configuration parameters.
+    The lists of the keys in skip are left empty, e.g. skip=("ont_config",)
+    when the ONTs are streamed (see locustmodeldata.ontstream): the file is
+    then read with yamlstream, yaml.safe_load otherwise.
+    """
     try:
-        params = _load_yaml_file(paramsfile)
+        with open(paramsfile, "r", encoding="utf8") as infile:
+            if skip:
+                params = yamlstream.load(infile, skip)
+            else:
+                params = yaml.safe_load(infile)
     except Exception as error:
         print(f"Error loading {paramsfile}.  error={error}")
         sys.exit(1)
@@ -0,0 +1,225 @@
+"""
+Incremental parsing of large YAML test data files.
+
+yaml.safe_load builds the whole document, through a node graph, before
+returning it: a test data file with a million ONTs takes minutes and
+holds every ONT twice at its peak.  This module reads the parser events
+(libyaml when installed) and builds the Python values directly, with the
+SafeLoader tag resolution:
+
+    * load returns the document, optionally with the sequences of some
+      keys (e.g. ont_config) skipped: they are parsed but never built
+    * iter_items yields the items of the sequence at a key path one at a
+      time, the other keys of its mapping are collected in a header dict
+
+Anchors, aliases and merge keys (<<) are supported, except anchors defined
+inside skipped sequences.  Tags of mappings and sequences (!!set, !!omap)
+are not supported.
+
+Example:
+    header = {}
+    with open(paramsfile, encoding="utf8") as stream:
+        path = ("ont_crud_data", "onts", "ont_config")
+        for ont in iter_items(stream, path, header, skip=("ont_config",)):
+            ...
+"""
+
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+import yaml
+from yaml.constructor import ConstructorError
+from yaml.events import (
+    AliasEvent,
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    SequenceEndEvent,
+    SequenceStartEvent,
+)
+from yaml.nodes import ScalarNode
+
+# libyaml parser when PyYAML was built with it
+LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+STR_TAG = "tag:yaml.org,2002:str"
+INT_TAG = "tag:yaml.org,2002:int"
+MERGE_TAG = "tag:yaml.org,2002:merge"
+_MERGE = object()  # merge key (<<)
+_COLLECTION_TAGS = (None, "!", "tag:yaml.org,2002:map", "tag:yaml.org,2002:seq")
+
+
+class _Builder:
+    """Python values of the parser events of a document"""
+
+    def __init__(self, loader, skip: Sequence[str] = ()):
+        self.loader = loader
+        self.skip_keys = skip  # keys of the sequences not built
+        self.anchors: Dict[str, Any] = {}
+
+    def value(self, event):
+        """Return the value starting with event"""
+        kind = type(event)
+        if kind is ScalarEvent:
+            value = self.scalar(event)
+        elif kind is MappingStartEvent:
+            self.check_tag(event)
+            value = {}
+            if event.anchor:
+                self.anchors[event.anchor] = value
+            self.mapping(value)
+            return value
+        elif kind is SequenceStartEvent:
+            self.check_tag(event)
+            value = []
+            if event.anchor:
+                self.anchors[event.anchor] = value
+            get_event = self.loader.get_event
+            event = get_event()
+            while type(event) is not SequenceEndEvent:
+                value.append(self.value(event))
+                event = get_event()
+            return value
+        elif kind is AliasEvent:
+            if event.anchor not in self.anchors:
+                raise ConstructorError(
+                    None,
+                    None,
+                    f"found undefined alias {event.anchor}",
+                    event.start_mark,
+                )
+            return self.anchors[event.anchor]
+        else:
+            raise ConstructorError(
+                None, None, f"unexpected event {event}", event.start_mark
+            )
+        if event.anchor:
+            self.anchors[event.anchor] = value
+        return value
+
+    def scalar(self, event):
+        """Return the value of a scalar, resolved as by SafeLoader"""
+        value = event.value
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = self.loader.resolve(ScalarNode, value, event.implicit)
+        if tag == STR_TAG:
+            return value
+        if tag == INT_TAG and value.isdigit() and (value[0] != "0" or value == "0"):
+            return int(value)
+        if tag == MERGE_TAG:
+            return _MERGE
+        return self.loader.construct_object(
+            ScalarNode(tag, value, event.start_mark, event.end_mark, event.style)
+        )
+
+    def mapping(self, value: dict):
+        """Fill value with the pairs of a mapping, up to its end event.
+        The sequences of the skipped keys are left empty.
+        """
+        get_event = self.loader.get_event
+        skip = self.skip_keys
+        merges = []
+        event = get_event()
+        while type(event) is not MappingEndEvent:
+            key = self.value(event)
+            event = get_event()
+            if key in skip and type(event) is SequenceStartEvent:
+                self.skip()
+                value[key] = []
+            elif key is _MERGE:
+                merged = self.value(event)
+                merges.extend(merged if isinstance(merged, list) else [merged])
+            else:
+                value[key] = self.value(event)
+            event = get_event()
+        for merged in merges:  # explicit keys first, then the first merge
+            if not isinstance(merged, dict):
+                raise ConstructorError(
+                    None, None, "merge key needs mappings", event.start_mark
+                )
+            for key, item in merged.items():
+                value.setdefault(key, item)
+
+    def skip(self):
+        """Skip the events up to the end of the current collection"""
+        get_event = self.loader.get_event
+        depth = 1
+        while depth:
+            kind = type(get_event())
+            if kind is MappingStartEvent or kind is SequenceStartEvent:
+                depth += 1
+            elif kind is MappingEndEvent or kind is SequenceEndEvent:
+                depth -= 1
+
+    @staticmethod
+    def check_tag(event):
+        if event.tag not in _COLLECTION_TAGS:
+            raise ConstructorError(
+                None, None, f"unsupported tag {event.tag}", event.start_mark
+            )
+
+
+def _document(stream, skip: Sequence[str]) -> Iterator[_Builder]:
+    """Yield the builder of the first document of stream, at its root event"""
+    loader = LOADER(stream)
+    try:
+        loader.get_event()  # stream start
+        if loader.check_event(yaml.DocumentStartEvent):
+            loader.get_event()
+            yield _Builder(loader, skip)
+    finally:
+        loader.dispose()
+
+
+def load(stream, skip: Sequence[str] = ()) -> Any:
+    """Return the first document of stream (file or str) like
+    yaml.safe_load.  The sequences of the mapping keys in skip are left
+    empty.
+    """
+    for builder in _document(stream, skip):
+        return builder.value(builder.loader.get_event())
+    return None
+
+
+def iter_items(
+    stream, path: Sequence[str], header: Optional[dict] = None, skip=()
+) -> Iterator[Any]:
+    """Yield the items of the sequence at the mapping key path of the first
+    document of stream.  header, when given, gets the other keys of the
+    mapping holding the sequence, as they are read, and the value at path
+    when it is not a sequence (e.g. a side file name).  The sequences of the
+    mapping keys in skip, off the path, are left empty.
+    """
+    header = {} if header is None else header
+    for builder in _document(stream, skip):
+        yield from _walk(builder, builder.loader.get_event(), tuple(path), header)
+
+
+def _walk(builder: _Builder, event, path: tuple, header: dict) -> Iterable[Any]:
+    """Yield the items of the sequence at path below the event"""
+    if type(event) is not MappingStartEvent:
+        builder.value(event)  # not on the path
+        return
+    get_event = builder.loader.get_event
+    event = get_event()
+    while type(event) is not MappingEndEvent:
+        key = builder.value(event)
+        event = get_event()
+        if key != path[0]:
+            if key in builder.skip_keys and type(event) is SequenceStartEvent:
+                builder.skip()
+                value = []
+            else:
+                value = builder.value(event)  # built for its anchors
+            if len(path) == 1:
+                header[key] = value
+        elif len(path) > 1:
+            yield from _walk(builder, event, path[1:], header)
+        elif type(event) is SequenceStartEvent:
+            event = get_event()
+            while type(event) is not SequenceEndEvent:
+                yield builder.value(event)
+                event = get_event()
+        else:
+            header[key] = builder.value(event)
+        event = get_event()